@@ -12,7 +12,10 @@ then
 fi
 
 
-python3 -m celery -A config.celery worker -l INFO --concurrency=10 &
+# отдельные воркеры на очередь, долгие задачи не задерживают быстрые
+python3 -m celery -A config.celery worker -Q realtime -n realtime@%h -l INFO --concurrency=4 &
+python3 -m celery -A config.celery worker -Q background -n background@%h -l INFO --concurrency=4 &
+python3 -m celery -A config.celery worker -Q mail -n mail@%h -l INFO --concurrency=2 &
 
 python3 -m celery -A config.celery beat --pidfile= -l INFO -s /app/runtime/celerybeat-schedule
 
@@ -4,7 +4,7 @@ from api.forms import GameAdminForm
 from api.models import (
     Game
 )
-from api.services import create_broadcast_for_game
+from api.services import schedule_broadcast
 
 
 @admin.register(Game)
@@ -17,4 +17,4 @@ class GameAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change) -> None:
         super().save_model(request, obj, form, change)
-        create_broadcast_for_game(obj)
+        schedule_broadcast(obj)
@@ -0,0 +1,7 @@
+"""
+Engine analysis
+
+Positions are evaluated by a local UCI engine in a separate process (run_analysis):
+web processes only put jobs into a priority queue and read evaluations from a shared cache,
+so engine load never competes with move handling for the same workers.
+"""
@@ -0,0 +1,93 @@
+"""
+Evaluation cache
+
+Evaluations are stored per position key (the Zobrist hash, so move counters do not matter)
+and per requested depth. A lookup is answered by the deepest stored evaluation that is at
+least as deep as requested.
+"""
+import json
+import threading
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from api.constants import EVAL_CACHE_TTL
+
+
+def _deepest(evaluations: dict, depth: int):
+    depths = [stored for stored in evaluations if stored >= depth]
+    return evaluations[max(depths)] if depths else None
+
+
+class RedisEvalCache:
+    """
+    One hash per position, fields are depths, values are JSON evaluations
+    """
+
+    prefix = "eval"
+
+    def __init__(self, url, ttl=EVAL_CACHE_TTL):
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def _key(self, position_key) -> str:
+        return f"{self.prefix}:{position_key}"
+
+    def get_many(self, position_keys, depth: int) -> dict:
+        """
+        {position key: evaluation} for the cached positions
+        """
+        position_keys = list(position_keys)
+        pipe = self.redis.pipeline(transaction=False)
+        for position_key in position_keys:
+            pipe.hgetall(self._key(position_key))
+
+        found = {}
+        for position_key, fields in zip(position_keys, pipe.execute()):
+            evaluation = _deepest({int(stored): value for stored, value in fields.items()}, depth)
+            if evaluation is not None:
+                found[position_key] = json.loads(evaluation)
+        return found
+
+    def get(self, position_key, depth: int):
+        return self.get_many([position_key], depth).get(position_key)
+
+    def set(self, position_key, depth: int, evaluation: dict) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self._key(position_key), depth, json.dumps(evaluation))
+        pipe.expire(self._key(position_key), self.ttl)
+        pipe.execute()
+
+
+class InMemoryEvalCache:
+    """
+    Per-process cache for tests and local development
+    """
+
+    def __init__(self):
+        self._evaluations = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, position_keys, depth: int) -> dict:
+        found = {}
+        with self._lock:
+            for position_key in position_keys:
+                evaluation = _deepest(self._evaluations.get(position_key, {}), depth)
+                if evaluation is not None:
+                    found[position_key] = dict(evaluation)
+        return found
+
+    def get(self, position_key, depth: int):
+        return self.get_many([position_key], depth).get(position_key)
+
+    def set(self, position_key, depth: int, evaluation: dict) -> None:
+        with self._lock:
+            self._evaluations.setdefault(position_key, {})[depth] = dict(evaluation)
+
+
+@lru_cache(maxsize=None)
+def get_eval_cache():
+    config = settings.EVAL_CACHE
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
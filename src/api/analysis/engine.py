@@ -0,0 +1,162 @@
+"""
+Engine process pool and the analysis worker
+
+At most `size` engine processes run at a time, each with the options from settings
+(one search thread by default) and a lowered CPU priority, so the operating system
+schedules web workers first when the machine is busy. Every search is capped by depth and time.
+A search stopped by the time limit is cached under the requested depth all the same, the same
+limit would stop it again, and keeps the depth it actually reached in the evaluation.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from functools import lru_cache
+
+import chess
+import chess.engine
+from django.conf import settings
+
+from api import positions
+from api.constants import (
+    ANALYSIS_ENGINE_NICE,
+    ANALYSIS_ENGINES,
+    ANALYSIS_LIVE_TTL,
+    ANALYSIS_MATE_SCORE,
+    ANALYSIS_TIME_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def evaluation(info: dict, depth: int) -> dict:
+    """
+    Evaluation from White's point of view, a mate is also given in centipawns
+    """
+    score = info["score"].white()
+    pv = [move.uci() for move in info.get("pv", [])]
+    return {
+        "depth": info.get("depth", depth),
+        "cp": score.score(mate_score=ANALYSIS_MATE_SCORE),
+        "mate": score.mate(),
+        "best": pv[0] if pv else None,
+        "pv": pv,
+    }
+
+
+class EnginePool:
+    """
+    Engines are started on demand, reused and replaced after a failure
+    """
+
+    def __init__(self, command, size=ANALYSIS_ENGINES, options=None, nice=ANALYSIS_ENGINE_NICE,
+                 time_limit=ANALYSIS_TIME_LIMIT):
+        self.command = command
+        self.size = size
+        self.options = options or {}
+        self.nice = nice
+        self.time_limit = time_limit
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _lower_priority(self):
+        os.nice(self.nice)
+
+    def _start(self):
+        engine = chess.engine.SimpleEngine.popen_uci(
+            self.command, preexec_fn=self._lower_priority if self.nice else None
+        )
+        engine.configure({name: value for name, value in self.options.items() if name in engine.options})
+        return engine
+
+    def analyse(self, fen: str, depth: int) -> dict:
+        """
+        Blocks while all engines are busy. Raises chess.engine.EngineError or TimeoutError
+        """
+        with self._slots:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                engine = self._start()
+
+            # в пул возвращается только исправный движок, после любой ошибки он закрывается
+            healthy = False
+            try:
+                info = engine.analyse(chess.Board(fen), chess.engine.Limit(depth=depth, time=self.time_limit))
+                healthy = True
+            finally:
+                if healthy:
+                    self._idle.put(engine)
+                else:
+                    engine.close()
+        return evaluation(info, depth)
+
+    def close(self) -> None:
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            engine.quit()
+
+
+@lru_cache(maxsize=None)
+def get_engine_pool():
+    config = settings.ANALYSIS_ENGINE
+    return EnginePool(
+        config["COMMAND"], size=config.get("ENGINES", ANALYSIS_ENGINES), options=config.get("OPTIONS")
+    )
+
+
+class AnalysisWorker:
+    """
+    Takes jobs from the queue, one thread per engine. A live job that waited longer than
+    live_ttl is dropped, the game has moved on. notify(job, evaluation) is called for live jobs
+    """
+
+    def __init__(self, pool: EnginePool, jobs, cache, notify=None, live_ttl=ANALYSIS_LIVE_TTL):
+        self.pool = pool
+        self.jobs = jobs
+        self.cache = cache
+        self.notify = notify
+        self.live_ttl = live_ttl
+
+    def run_once(self, timeout=1, now=None):
+        """
+        Handles one job, returns its evaluation or None if there was nothing to do
+        """
+        job = self.jobs.pop(timeout)
+        if job is None:
+            return None
+        if job.is_live and (now or time.time()) - job.created_at > self.live_ttl:
+            return None
+
+        key = positions.fen_key(job.fen)
+        result = self.cache.get(key, job.depth)
+        if result is None:
+            try:
+                result = self.pool.analyse(job.fen, job.depth)
+            except (chess.engine.EngineError, TimeoutError):
+                logger.exception("Engine failed on %s", job.fen)
+                return None
+            self.cache.set(key, job.depth, result)
+
+        if job.is_live and job.game and self.notify is not None:
+            self.notify(job, result)
+        return result
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Analysis job failed")
+                time.sleep(1)
+
+    def run_forever(self):
+        threads = [threading.Thread(target=self._run, daemon=True) for _ in range(self.pool.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,136 @@
+"""
+Analysis job queue
+
+Jobs are ordered by priority first (live games before post-game review), then by age.
+An identical job that is already waiting is not queued twice. The queue is bounded and review
+jobs may only fill half of it, so a backlog of reviews never keeps live positions out.
+"""
+import heapq
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from api.constants import ANALYSIS_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+LIVE, REVIEW = 0, 1
+
+# priorities are far apart so that age only orders jobs of the same priority
+PRIORITY_SPAN = 10 ** 10
+
+
+class Job:
+    __slots__ = ("fen", "depth", "priority", "game", "created_at")
+
+    def __init__(self, fen, depth, priority=REVIEW, game=None, created_at=None):
+        self.fen = fen
+        self.depth = depth
+        self.priority = priority
+        self.game = game
+        self.created_at = time.time() if created_at is None else created_at
+
+    @property
+    def is_live(self) -> bool:
+        return self.priority == LIVE
+
+    @property
+    def score(self) -> float:
+        return self.priority * PRIORITY_SPAN + self.created_at
+
+    def to_json(self) -> str:
+        """
+        The age is kept in the score, so equal jobs have equal members
+        """
+        return json.dumps([self.fen, self.depth, self.priority, self.game])
+
+    @classmethod
+    def from_json(cls, value, score: float):
+        fen, depth, priority, game = json.loads(value)
+        return cls(fen, depth, priority, game, created_at=score - priority * PRIORITY_SPAN)
+
+
+def _limit(job: Job, max_size: int) -> int:
+    return max_size if job.is_live else max_size // 2
+
+
+class RedisAnalysisQueue:
+    """
+    A sorted set, the worker takes the lowest score with BZPOPMIN
+    """
+
+    key = "analysis:queue"
+
+    def __init__(self, url, max_size=ANALYSIS_QUEUE_SIZE):
+        self.redis = redis.Redis.from_url(url)
+        self.max_size = max_size
+
+    def push(self, job: Job) -> bool:
+        """
+        False if the queue is full for jobs of this priority or unavailable
+        """
+        try:
+            if self.redis.zcard(self.key) >= _limit(job, self.max_size):
+                return False
+            self.redis.zadd(self.key, {job.to_json(): job.score}, nx=True)
+        except redis.RedisError:
+            logger.exception("Could not queue the analysis of %s", job.fen)
+            return False
+        return True
+
+    def pop(self, timeout=1):
+        item = self.redis.bzpopmin(self.key, timeout)
+        if item is None:
+            return None
+        _, value, score = item
+        return Job.from_json(value, score)
+
+    def size(self) -> int:
+        return self.redis.zcard(self.key)
+
+
+class InMemoryAnalysisQueue:
+    """
+    Per-process queue for tests and local development
+    """
+
+    def __init__(self, max_size=ANALYSIS_QUEUE_SIZE):
+        self.max_size = max_size
+        self._heap = []
+        self._members = set()
+        self._ready = threading.Condition()
+
+    def push(self, job: Job) -> bool:
+        with self._ready:
+            if len(self._heap) >= _limit(job, self.max_size):
+                return False
+            member = job.to_json()
+            if member not in self._members:
+                self._members.add(member)
+                heapq.heappush(self._heap, (job.score, member))
+                self._ready.notify()
+        return True
+
+    def pop(self, timeout=1):
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._heap, timeout):
+                return None
+            score, member = heapq.heappop(self._heap)
+            self._members.discard(member)
+        return Job.from_json(member, score)
+
+    def size(self) -> int:
+        with self._ready:
+            return len(self._heap)
+
+
+@lru_cache(maxsize=None)
+def get_analysis_queue():
+    config = settings.ANALYSIS_QUEUE
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
@@ -0,0 +1,177 @@
+"""
+Post-game review
+
+A finished game is replayed from its move log and every position is evaluated, cached
+evaluations first, so positions seen in earlier games (openings above all) cost nothing.
+The centipawn loss of a move is how much the evaluation dropped for the side that moved,
+both evaluations capped at ANALYSIS_CPL_CAP so that a missed mate does not dominate the average.
+Move accuracy follows the win-probability curve used by Lichess.
+"""
+import logging
+import math
+from multiprocessing.util import Finalize
+
+import chess
+import chess.engine
+import chess.pgn
+
+from api import movelog, positions
+from api.constants import ANALYSIS_BLUNDER, ANALYSIS_CPL_CAP, ANALYSIS_INACCURACY, ANALYSIS_MISTAKE
+from .cache import get_eval_cache
+from .engine import EnginePool
+
+logger = logging.getLogger(__name__)
+
+# the largest loss first
+JUDGEMENTS = (
+    (ANALYSIS_BLUNDER, chess.pgn.NAG_BLUNDER, "Blunder", "blunders"),
+    (ANALYSIS_MISTAKE, chess.pgn.NAG_MISTAKE, "Mistake", "mistakes"),
+    (ANALYSIS_INACCURACY, chess.pgn.NAG_DUBIOUS_MOVE, "Inaccuracy", "inaccuracies"),
+)
+
+# the engine of a worker process, see init_worker
+_engine = None
+
+
+def win_chance(cp: int) -> float:
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * cp)) - 1)
+
+
+def move_accuracy(win_before: float, win_after: float) -> float:
+    return min(max(103.1668 * math.exp(-0.04354 * (win_before - win_after)) - 3.1669, 0), 100)
+
+
+def judgement(loss: int):
+    """
+    (threshold, NAG, label, counter) for the loss or None for a good move
+    """
+    for entry in JUDGEMENTS:
+        if loss >= entry[0]:
+            return entry
+    return None
+
+
+def _capped(evaluation: dict) -> int:
+    return min(max(evaluation["cp"], -ANALYSIS_CPL_CAP), ANALYSIS_CPL_CAP)
+
+
+def review_moves(moves, evaluations: list, fen=chess.STARTING_FEN) -> list:
+    """
+    evaluations: White's point of view, one per position including the initial one (fen).
+    [{"color", "loss", "accuracy", "nag"}] per move, the engine's best move never loses
+    """
+    chess_board = chess.Board(fen)
+    reviewed = []
+    for move, before, after in zip(moves, evaluations, evaluations[1:]):
+        sign = 1 if chess_board.turn == chess.WHITE else -1
+        loss = 0 if move.uci() == before["best"] else max(sign * (_capped(before) - _capped(after)), 0)
+        accuracy = 100.0 if not loss else move_accuracy(
+            win_chance(sign * _capped(before)), win_chance(sign * _capped(after))
+        )
+        entry = judgement(loss)
+        reviewed.append({
+            "color": "white" if sign > 0 else "black",
+            "loss": loss,
+            "accuracy": accuracy,
+            "nag": entry[1] if entry else None,
+        })
+        chess_board.push(move)
+    return reviewed
+
+
+def summary(reviewed: list) -> dict:
+    """
+    Average centipawn loss, accuracy and the number of inaccuracies, mistakes and blunders per color
+    """
+    result = {}
+    for color in ("white", "black"):
+        moves = [entry for entry in reviewed if entry["color"] == color]
+        stats = {
+            "acpl": round(sum(entry["loss"] for entry in moves) / len(moves)) if moves else None,
+            "accuracy": round(sum(entry["accuracy"] for entry in moves) / len(moves), 1) if moves else None,
+        }
+        for _, nag, _, counter in JUDGEMENTS:
+            stats[counter] = sum(entry["nag"] == nag for entry in moves)
+        result[color] = stats
+    return result
+
+
+def eval_comment(evaluation: dict) -> str:
+    """
+    [%eval] command of the PGN annotation convention, in pawns or moves to mate
+    """
+    if evaluation["mate"] is not None:
+        return f"[%eval #{evaluation['mate']}]"
+    return f"[%eval {evaluation['cp'] / 100:.2f}]"
+
+
+def annotate(headers, moves, evaluations: list, reviewed: list) -> str:
+    """
+    PGN with an eval comment after every move, NAGs for bad moves and the engine's better move
+    """
+    game = chess.pgn.Game()
+    for name, value in headers:
+        game.headers[name] = str(value)
+
+    node = game
+    for move, before, after, entry in zip(moves, evaluations, evaluations[1:], reviewed):
+        chess_board = node.board()
+        node = node.add_variation(move)
+        comment = eval_comment(after) if after["mate"] != 0 else ""
+        if entry["nag"] is not None:
+            node.nags.add(entry["nag"])
+            label = next(label for _, nag, label, _ in JUDGEMENTS if nag == entry["nag"])
+            best = chess.Move.from_uci(before["best"]) if before["best"] else None
+            comment += f" {label}." + (f" {chess_board.san(best)} was best." if best else "")
+        node.comment = comment.strip()
+    return str(game)
+
+
+def init_worker(command, options=None) -> None:
+    """
+    One engine per worker process. The engine is quit when the process exits,
+    otherwise its thread would keep the process alive
+    """
+    global _engine
+    _engine = EnginePool(command, size=1, options=options)
+    Finalize(None, close_worker, exitpriority=10)
+
+
+def close_worker() -> None:
+    global _engine
+    if _engine is not None:
+        _engine.close()
+        _engine = None
+
+
+def evaluate(fens, keys, depth: int, engine, cache) -> list:
+    found = cache.get_many(set(keys), depth)
+    for fen, key in zip(fens, keys):
+        if key not in found:
+            found[key] = engine.analyse(fen, depth)
+            cache.set(key, depth, found[key])
+    return [found[key] for key in keys]
+
+
+def review_game(item) -> tuple:
+    """
+    (game id, move log, PGN headers, depth) -> (game id, annotated PGN, summary), runs in a worker process.
+    PGN and summary are None if the engine failed
+    """
+    game_id, log, headers, depth = item
+    moves = movelog.decode_moves(log)
+    starting_fen = dict(headers).get("FEN", chess.STARTING_FEN)
+    chess_board = chess.Board(starting_fen)
+    fens, keys = [chess_board.fen()], [positions.position_key(chess_board)]
+    for move in moves:
+        keys.append(positions.push(chess_board, move, keys[-1]))
+        fens.append(chess_board.fen())
+
+    try:
+        evaluations = evaluate(fens, keys, depth, _engine, get_eval_cache())
+    except (chess.engine.EngineError, TimeoutError):
+        logger.exception("Engine failed on game %s", game_id)
+        return game_id, None, None
+
+    reviewed = review_moves(moves, evaluations, starting_fen)
+    return game_id, annotate(headers, moves, evaluations, reviewed), summary(reviewed)
@@ -0,0 +1,114 @@
+"""
+Cache of python-chess boards for games in progress
+
+A per-process LRU sits in front of the shared Django cache (Redis in production),
+so a move does not have to replay the whole move stack from the database.
+The shared cache keeps the FEN and the ply of the position only, a move rewrites
+a fixed-size entry, and a board restored from it carries no move stack.
+"""
+import threading
+from collections import OrderedDict
+
+import chess
+from django.core.cache import cache
+from django.db import transaction
+
+from .constants import LIVE_BOARD_CACHE_SIZE, LIVE_BOARD_CACHE_TIMEOUT
+
+
+class LiveBoardCache:
+    """
+    Holds the current chess.Board of every live game, keyed by game uuid
+
+    Entries are validated against the FEN stored in the Board row, so a board
+    changed by another process is never served.
+    """
+
+    key_prefix = "live_board"
+
+    def __init__(self, maxsize=LIVE_BOARD_CACHE_SIZE, timeout=LIVE_BOARD_CACHE_TIMEOUT):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, game_uuid):
+        return f"{self.key_prefix}_{game_uuid}"
+
+    @staticmethod
+    def _is_actual(chess_board, fen):
+        return fen is None or chess_board.fen() == fen
+
+    def _get_local(self, key, ply=None):
+        with self._lock:
+            chess_board, cached_ply = self._boards.get(key, (None, None))
+            if chess_board is None or (ply is not None and cached_ply != ply):
+                return None
+            self._boards.move_to_end(key)
+            return chess_board
+
+    def _set_local(self, key, chess_board, ply):
+        with self._lock:
+            self._boards[key] = (chess_board, ply)
+            self._boards.move_to_end(key)
+            while len(self._boards) > self.maxsize:
+                self._boards.popitem(last=False)
+
+    def _get_shared(self, key, ply=None):
+        entry = cache.get(self._cache_key(key))
+        if entry is None or (ply is not None and entry["ply"] != ply):
+            return None, None
+        return chess.Board(entry["fen"]), entry["ply"]
+
+    def get(self, game_uuid, fen=None, ply=None):
+        """
+        Returns the cached board of a game, or None
+
+        fen, ply: current position of the game, entries that do not match it are dropped
+        """
+        key = str(game_uuid)
+
+        chess_board = self._get_local(key, ply)
+        if chess_board is not None and self._is_actual(chess_board, fen):
+            return chess_board
+
+        chess_board, ply = self._get_shared(key, ply)
+        if chess_board is None or not self._is_actual(chess_board, fen):
+            with self._lock:
+                self._boards.pop(key, None)
+            return None
+
+        self._set_local(key, chess_board, ply)
+        return chess_board
+
+    def set(self, game_uuid, chess_board, ply):
+        """
+        Stores the board after a move has been pushed onto it, ply - half-moves made in the game
+        """
+        key = str(game_uuid)
+
+        self._set_local(key, chess_board, ply)
+        cache.set(self._cache_key(key), {"fen": chess_board.fen(), "ply": ply}, self.timeout)
+
+    def set_on_commit(self, game_uuid, chess_board, ply):
+        """
+        Stores the board once the move is committed, a rolled back move never gets into the cache
+        """
+        transaction.on_commit(lambda: self.set(game_uuid, chess_board, ply))
+
+    def delete(self, game_uuid):
+        key = str(game_uuid)
+
+        with self._lock:
+            self._boards.pop(key, None)
+        cache.delete(self._cache_key(key))
+
+    def clear(self):
+        """
+        Drops the per-process entries only
+        """
+        with self._lock:
+            self._boards.clear()
+
+
+live_boards = LiveBoardCache()
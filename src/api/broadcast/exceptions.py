@@ -1,5 +1,4 @@
 class BroadcastApiError(Exception):
 
-    def __init__(self, message):
-        super().__init__("Broadcast api error")
-
+    def __init__(self, message="Broadcast api error"):
+        super().__init__(message)
@@ -0,0 +1,142 @@
+"""
+Local fake of the Janus HTTP API for tests and development
+
+Understands the requests of api.broadcast.services: create and keep alive a session,
+attach the videoroom plugin, create and destroy a room. failures and delay simulate
+an unhealthy server, expire_session a session timed out on the Janus side.
+
+    python -m api.broadcast.fake_janus 8088
+"""
+import itertools
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeJanusHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        # первый сегмент пути - корень API, например /janus
+        path = [int(part) for part in self.path.strip("/").split("/")[1:]]
+
+        with server.lock:
+            server.requests.append((self.path, body))
+            failing = server.failures > 0
+            if failing:
+                server.failures -= 1
+
+        if server.delay:
+            time.sleep(server.delay)
+        if failing:
+            return self._respond({"janus": "error", "error": {"code": 500, "reason": "Unavailable"}}, status=503)
+
+        self._respond(server.process(path, body))
+
+    def _respond(self, data: dict, status=200):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeJanus(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, FakeJanusHandler)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1000)
+        self.sessions = set()
+        self.handles = {}
+        self.rooms = {}
+        self.requests = []
+        self.failures = 0
+        self.delay = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/janus"
+
+    def _error(self, transaction, code, reason) -> dict:
+        return {"janus": "error", "transaction": transaction, "error": {"code": code, "reason": reason}}
+
+    def process(self, path: list, body: dict) -> dict:
+        transaction = body.get("transaction")
+        with self.lock:
+            if not path and body.get("janus") == "create":
+                session_id = next(self.ids)
+                self.sessions.add(session_id)
+                return {"janus": "success", "transaction": transaction, "data": {"id": session_id}}
+
+            if not path or path[0] not in self.sessions:
+                return self._error(transaction, 458, "No such session")
+
+            if len(path) == 1 and body.get("janus") == "keepalive":
+                return {"janus": "ack", "session_id": path[0], "transaction": transaction}
+
+            if len(path) == 1 and body.get("janus") == "attach":
+                handle_id = next(self.ids)
+                self.handles[handle_id] = path[0]
+                return {"janus": "success", "transaction": transaction, "data": {"id": handle_id}}
+
+            if len(path) == 2 and self.handles.get(path[1]) == path[0] and body.get("janus") == "message":
+                request = body.get("body", {}).get("request")
+                if request == "destroy":
+                    self.rooms.pop(body["body"].get("room"), None)
+                    return {
+                        "janus": "success",
+                        "transaction": transaction,
+                        "plugindata": {
+                            "plugin": "janus.plugin.videoroom",
+                            "data": {"videoroom": "destroyed", "room": body["body"].get("room")},
+                        },
+                    }
+                if request != "create":
+                    return self._error(transaction, 423, "Unknown request")
+                room_id = next(self.ids)
+                self.rooms[room_id] = body["body"].get("description")
+                return {
+                    "janus": "success",
+                    "transaction": transaction,
+                    "plugindata": {
+                        "plugin": "janus.plugin.videoroom",
+                        "data": {"videoroom": "created", "room": room_id, "permanent": False},
+                    },
+                }
+
+            return self._error(transaction, 459, "No such handle")
+
+    def expire_session(self, session_id) -> None:
+        with self.lock:
+            self.sessions.discard(session_id)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8088
+    server = FakeJanus(("127.0.0.1", port))
+    print(f"Fake Janus at {server.url}")
+    server.serve_forever()
@@ -0,0 +1,300 @@
+"""
+Пул заранее созданных комнат Janus
+
+Партия берет готовые комнаты из пула (O(1)) и возвращает их после окончания.
+Отдельный процесс (run_broadcast_pool) держит сессии живыми, убирает комнаты умерших
+сессий и комнаты старше TTL и дополняет пул до нужного размера.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from api.broadcast.exceptions import BroadcastApiError
+from api.broadcast.services import DestroyRoom, KeepAlive, create_rooms, create_session
+from api.constants import (
+    BROADCAST_ROOM_LEASE_TTL,
+    BROADCAST_ROOM_POOL_INTERVAL,
+    BROADCAST_ROOM_POOL_SIZE,
+    BROADCAST_ROOM_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Room:
+    __slots__ = ("session_id", "data_id", "room_id", "created_at", "leased_at")
+
+    def __init__(self, session_id, data_id, room_id, created_at, leased_at=None):
+        self.session_id = session_id
+        self.data_id = data_id
+        self.room_id = room_id
+        self.created_at = created_at
+        self.leased_at = leased_at
+
+    @property
+    def key(self) -> str:
+        return str(self.room_id)
+
+    def to_json(self) -> str:
+        return json.dumps([self.session_id, self.data_id, self.room_id, self.created_at, self.leased_at])
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(*json.loads(value))
+
+
+def _hit_rate(hits: int, misses: int):
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+
+class RedisRoomPool:
+    """
+    Свободные комнаты - список (LPOP), выданные - хеш по номеру комнаты
+    """
+
+    available_key = "broadcast:pool:available"
+    leased_key = "broadcast:pool:leased"
+    stats_key = "broadcast:pool:stats"
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def put(self, rooms: list) -> None:
+        if rooms:
+            self.redis.rpush(self.available_key, *(room.to_json() for room in rooms))
+
+    def lease(self, count: int, now: float) -> list:
+        """
+        До count свободных комнат, недостающие считаются промахами пула
+        """
+        pipe = self.redis.pipeline()
+        for _ in range(count):
+            pipe.lpop(self.available_key)
+        rooms = [Room.from_json(value) for value in pipe.execute() if value is not None]
+
+        pipe = self.redis.pipeline()
+        self._track(pipe, rooms, now)
+        pipe.hincrby(self.stats_key, "hits", len(rooms))
+        pipe.hincrby(self.stats_key, "misses", count - len(rooms))
+        pipe.execute()
+        return rooms
+
+    def _track(self, pipe, rooms: list, now: float) -> None:
+        for room in rooms:
+            room.leased_at = now
+            pipe.hset(self.leased_key, room.key, room.to_json())
+
+    def track(self, rooms: list, now: float) -> None:
+        """
+        Комнаты, созданные мимо пула, тоже возвращаются в него после партии
+        """
+        pipe = self.redis.pipeline()
+        self._track(pipe, rooms, now)
+        pipe.execute()
+
+    def release(self, room_ids: list) -> int:
+        keys = [str(room_id) for room_id in room_ids]
+        if not keys:
+            return 0
+
+        values = self.redis.hmget(self.leased_key, keys)
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.hdel(self.leased_key, key)
+        deleted = pipe.execute()
+
+        # комнату возвращает только тот, кто удалил ее из выданных
+        rooms = [Room.from_json(value) for value, removed in zip(values, deleted) if value and removed]
+        for room in rooms:
+            room.leased_at = None
+        self.put(rooms)
+        return len(rooms)
+
+    def available(self) -> list:
+        return [Room.from_json(value) for value in self.redis.lrange(self.available_key, 0, -1)]
+
+    def leased(self) -> list:
+        return [Room.from_json(value) for value in self.redis.hvals(self.leased_key)]
+
+    def remove(self, rooms: list) -> None:
+        pipe = self.redis.pipeline()
+        for room in rooms:
+            pipe.lrem(self.available_key, 1, room.to_json())
+        pipe.execute()
+
+    def forget(self, room_ids: list) -> None:
+        if room_ids:
+            self.redis.hdel(self.leased_key, *(str(room_id) for room_id in room_ids))
+
+    def size(self) -> int:
+        return self.redis.llen(self.available_key)
+
+    def stats(self) -> dict:
+        pipe = self.redis.pipeline()
+        pipe.llen(self.available_key)
+        pipe.hlen(self.leased_key)
+        pipe.hgetall(self.stats_key)
+        available, leased, counters = pipe.execute()
+        hits, misses = int(counters.get(b"hits", 0)), int(counters.get(b"misses", 0))
+        return {
+            "available": available,
+            "leased": leased,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": _hit_rate(hits, misses),
+        }
+
+
+class InMemoryRoomPool:
+    """
+    Пул в памяти процесса для тестов и локальной разработки
+    """
+
+    def __init__(self):
+        self._available = deque()
+        self._leased = {}
+        self._hits = self._misses = 0
+        self._lock = threading.Lock()
+
+    def put(self, rooms: list) -> None:
+        with self._lock:
+            self._available.extend(rooms)
+
+    def lease(self, count: int, now: float) -> list:
+        with self._lock:
+            rooms = [self._available.popleft() for _ in range(min(count, len(self._available)))]
+            self._hits += len(rooms)
+            self._misses += count - len(rooms)
+        self.track(rooms, now)
+        return rooms
+
+    def track(self, rooms: list, now: float) -> None:
+        with self._lock:
+            for room in rooms:
+                room.leased_at = now
+                self._leased[room.key] = room
+
+    def release(self, room_ids: list) -> int:
+        with self._lock:
+            rooms = [self._leased.pop(str(room_id)) for room_id in room_ids if str(room_id) in self._leased]
+            for room in rooms:
+                room.leased_at = None
+            self._available.extend(rooms)
+        return len(rooms)
+
+    def available(self) -> list:
+        with self._lock:
+            return list(self._available)
+
+    def leased(self) -> list:
+        with self._lock:
+            return list(self._leased.values())
+
+    def remove(self, rooms: list) -> None:
+        keys = {room.key for room in rooms}
+        with self._lock:
+            self._available = deque(room for room in self._available if room.key not in keys)
+
+    def forget(self, room_ids: list) -> None:
+        with self._lock:
+            for room_id in room_ids:
+                self._leased.pop(str(room_id), None)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._available)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "available": len(self._available),
+                "leased": len(self._leased),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": _hit_rate(self._hits, self._misses),
+            }
+
+
+@lru_cache(maxsize=None)
+def get_room_pool():
+    config = settings.BROADCAST_ROOM_POOL
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+class RoomPoolMaintainer:
+
+    def __init__(
+        self,
+        pool,
+        size=BROADCAST_ROOM_POOL_SIZE,
+        ttl=BROADCAST_ROOM_TTL,
+        lease_ttl=BROADCAST_ROOM_LEASE_TTL,
+        interval=BROADCAST_ROOM_POOL_INTERVAL,
+    ):
+        self.pool = pool
+        self.size = size
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+
+    @staticmethod
+    def _is_alive(session_id) -> bool:
+        try:
+            return KeepAlive(session_id).do_request()
+        except BroadcastApiError:
+            return False
+
+    @staticmethod
+    def _destroy(room: Room) -> None:
+        try:
+            DestroyRoom(room.session_id, room.data_id, room.room_id).do_request()
+        except BroadcastApiError:
+            logger.warning("Could not destroy Janus room %s", room.room_id)
+
+    def _create(self, count: int, now: float) -> list:
+        session_id, data_id = create_session()
+        room_ids = create_rooms(session_id, data_id, [("pool", str(i)) for i in range(count)])
+        return [Room(session_id, data_id, room_id, now) for room_id in room_ids]
+
+    def run_once(self, now=None) -> dict:
+        """
+        Проверка здоровья (keepalive каждой сессии, в том числе выданных комнат),
+        удаление устаревших комнат и пополнение пула
+        """
+        now = now or time.time()
+        available, leased = self.pool.available(), self.pool.leased()
+        alive = {session_id: self._is_alive(session_id) for session_id in {
+            room.session_id for room in available + leased
+        }}
+
+        stale = [room for room in available if not alive[room.session_id] or now - room.created_at > self.ttl]
+        abandoned = [room for room in leased if not alive[room.session_id] or now - room.leased_at > self.lease_ttl]
+        self.pool.remove(stale)
+        self.pool.forget([room.room_id for room in abandoned])
+        for room in stale + abandoned:
+            if alive[room.session_id]:
+                self._destroy(room)
+
+        missing = self.size - self.pool.size()
+        if missing > 0:
+            try:
+                self.pool.put(self._create(missing, now))
+            except BroadcastApiError:
+                logger.exception("Could not refill the Janus room pool")
+
+        stats = self.pool.stats()
+        logger.info("Janus room pool: %s", stats)
+        return stats
+
+    def run_forever(self):
+        while True:
+            started = time.monotonic()
+            self.run_once()
+            time.sleep(max(self.interval - (time.monotonic() - started), 0))
@@ -1,12 +1,50 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import requests
 from requests import Response
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 
 from api.broadcast.exceptions import BroadcastApiError
+from api.constants import (
+    BROADCAST_BACKOFF,
+    BROADCAST_CONNECT_TIMEOUT,
+    BROADCAST_HTTP_POOL_SIZE,
+    BROADCAST_READ_TIMEOUT,
+    BROADCAST_RETRIES,
+    BROADCAST_ROOM_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """
+    Один пул соединений с Janus на процесс
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BROADCAST_HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@lru_cache(maxsize=None)
+def _get_room_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(BROADCAST_ROOM_WORKERS, thread_name_prefix="janus-room")
 
 
 class AbstractCreateBroadcast:
-    _url = settings.VIDEO_BROADCAST
+    # повтор после отправленного запроса может создать вторую сессию или комнату
+    idempotent = False
+
+    @property
+    def _url(self):
+        return settings.VIDEO_BROADCAST
 
     @property
     def url(self):
@@ -18,11 +56,41 @@ class AbstractCreateBroadcast:
     def get_result_from_res(self, res: Response):
         return res.json()['data']['id']
 
+    def _post(self) -> Response:
+        """
+        Повторяет запрос с экспоненциальной задержкой при ответах 5xx и сетевых ошибках.
+        Неидемпотентный запрос после сетевой ошибки повторяется, только если он не был
+        отправлен (таймаут соединения): Janus мог его уже выполнить
+        """
+        for attempt in range(BROADCAST_RETRIES + 1):
+            if attempt:
+                time.sleep(BROADCAST_BACKOFF * 2 ** (attempt - 1))
+            try:
+                res = get_http_session().post(
+                    self.url, json=self.get_data(), timeout=(BROADCAST_CONNECT_TIMEOUT, BROADCAST_READ_TIMEOUT)
+                )
+            except requests.ConnectTimeout as exc:
+                logger.warning("Janus request to %s failed: %s", self.url, exc)
+                continue
+            except requests.RequestException as exc:
+                logger.warning("Janus request to %s failed: %s", self.url, exc)
+                if not self.idempotent:
+                    raise BroadcastApiError(f"Janus request to {self.url} failed: {exc}") from exc
+                continue
+            if res.status_code < 500:
+                return res
+            logger.warning("Janus request to %s failed with status %s", self.url, res.status_code)
+
+        raise BroadcastApiError(f"Janus request to {self.url} failed {BROADCAST_RETRIES + 1} times")
+
     def do_request(self):
-        res = requests.post(self.url, json=self.get_data())
+        res = self._post()
         if res.status_code != 200:
-            raise BroadcastApiError
-        return self.get_result_from_res(res)
+            raise BroadcastApiError(f"Janus responded with status {res.status_code}")
+        try:
+            return self.get_result_from_res(res)
+        except (KeyError, TypeError, ValueError):
+            raise BroadcastApiError(f"Unexpected Janus response: {res.text[:200]}")
 
 
 class CreateSession(AbstractCreateBroadcast):
@@ -82,21 +150,81 @@ class CreateRoom(AbstractCreateBroadcast):
         return res.json()['plugindata']['data']['room']
 
 
+class KeepAlive(AbstractCreateBroadcast):
+    """
+    Janus закрывает сессию без запросов дольше session_timeout (60 секунд по умолчанию)
+    """
+    idempotent = True
+
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+
+    @property
+    def url(self):
+        return f'{self._url}/{self.session_id}'
+
+    def get_data(self):
+        return dict(
+            janus='keepalive',
+            transaction='XFWaWrh10g2y'
+        )
+
+    def get_result_from_res(self, res: Response):
+        if res.json()['janus'] != 'ack':
+            raise KeyError('janus')
+        return True
+
+
+class DestroyRoom(AbstractCreateBroadcast):
+    idempotent = True
+
+    def __init__(self, session_id: int, data_id: int, room_id: int):
+        self.session_id = session_id
+        self.data_id = data_id
+        self.room_id = room_id
+
+    @property
+    def url(self):
+        return f'{self._url}/{self.session_id}/{self.data_id}'
+
+    def get_data(self):
+        return dict(
+            janus='message',
+            body=dict(
+                request='destroy',
+                room=self.room_id,
+            ),
+            transaction='XFWaWrh10g2y'
+        )
+
+    def get_result_from_res(self, res: Response):
+        return res.json()['plugindata']['data']['room']
+
+
+CAMERA = 'камера'
+BOARD = 'рабочий стол'
+
+
 def create_session():
     session_id = CreateSession().do_request()
     data_id = CreateData(session_id).do_request()
     return session_id, data_id
 
 
+def create_rooms(session_id: int, data_id: int, rooms: list) -> list:
+    """
+    Создает комнаты параллельно, rooms: [(имя игрока, CAMERA | BOARD)].
+    Возвращает номера комнат в том же порядке
+    """
+    futures = [
+        _get_room_executor().submit(CreateRoom(session_id, data_id, full_name, field_name).do_request)
+        for full_name, field_name in rooms
+    ]
+    return [future.result() for future in futures]
+
+
 def create_rooms_for_user(
     session_id: int, data_id: int, full_name
 ):
-    camera = CreateRoom(
-        session_id, data_id,
-        full_name, 'камера'
-    ).do_request()
-    board = CreateRoom(
-        session_id, data_id,
-        full_name, 'рабочий стол'
-    ).do_request()
+    camera, board = create_rooms(session_id, data_id, [(full_name, CAMERA), (full_name, BOARD)])
     return camera, board
@@ -0,0 +1,158 @@
+"""
+Server-side clock scheduler
+
+Flag-fall deadlines of every game in progress are kept in a sorted set, the scheduler
+sleeps until the earliest one and hands due games to a handler.
+"""
+import heapq
+import logging
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .constants import CLOCK_SCHEDULER_BATCH_SIZE, CLOCK_SCHEDULER_IDLE_TIMEOUT, CLOCK_SCHEDULER_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class RedisClockStore:
+    """
+    Deadlines in a Redis sorted set scored by unix timestamp
+    """
+
+    key = "clocks:deadlines"
+    wakeup_key = "clocks:wakeup"
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def schedule(self, game_uuid, deadline: float) -> None:
+        member = str(game_uuid)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zadd(self.key, {member: deadline})
+            pipe.zrange(self.key, 0, 0)
+            _, head = pipe.execute()
+
+            # the scheduler only has to wake up if the earliest deadline has changed
+            if head and head[0].decode() == member:
+                self.redis.lpush(self.wakeup_key, member)
+        except redis.RedisError:
+            logger.exception("Could not schedule the clock of game %s", member)
+
+    def cancel(self, game_uuid) -> None:
+        try:
+            self.redis.zrem(self.key, str(game_uuid))
+        except redis.RedisError:
+            logger.exception("Could not cancel the clock of game %s", game_uuid)
+
+    def pop_due(self, now: float, limit=CLOCK_SCHEDULER_BATCH_SIZE) -> list:
+        due = self.redis.zrangebyscore(self.key, "-inf", now, start=0, num=limit)
+        if not due:
+            return []
+
+        pipe = self.redis.pipeline()
+        for member in due:
+            pipe.zrem(self.key, member)
+
+        # ZREM only succeeds for one scheduler if several are running
+        return [member.decode() for member, removed in zip(due, pipe.execute()) if removed]
+
+    def next_deadline(self):
+        head = self.redis.zrange(self.key, 0, 0, withscores=True)
+        return head[0][1] if head else None
+
+    def wait(self, timeout: float) -> None:
+        if self.redis.blpop([self.wakeup_key], timeout=timeout):
+            self.redis.delete(self.wakeup_key)
+
+
+class InMemoryClockStore:
+    """
+    Per-process store for tests and local development
+    """
+
+    def __init__(self):
+        self._deadlines = {}
+        self._heap = []
+        self._condition = threading.Condition()
+
+    def schedule(self, game_uuid, deadline: float) -> None:
+        member = str(game_uuid)
+        with self._condition:
+            self._deadlines[member] = deadline
+            heapq.heappush(self._heap, (deadline, member))
+            if self._heap[0][1] == member:
+                self._condition.notify_all()
+
+    def cancel(self, game_uuid) -> None:
+        with self._condition:
+            self._deadlines.pop(str(game_uuid), None)
+
+    def _drop_cancelled(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def pop_due(self, now: float, limit=CLOCK_SCHEDULER_BATCH_SIZE) -> list:
+        due = []
+        with self._condition:
+            self._drop_cancelled()
+            while self._heap and self._heap[0][0] <= now and len(due) < limit:
+                _, member = heapq.heappop(self._heap)
+                del self._deadlines[member]
+                due.append(member)
+                self._drop_cancelled()
+        return due
+
+    def next_deadline(self):
+        with self._condition:
+            self._drop_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def wait(self, timeout: float) -> None:
+        with self._condition:
+            self._condition.wait(timeout)
+
+
+@lru_cache(maxsize=None)
+def get_clock_store():
+    config = settings.CLOCK_STORE
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+class ClockScheduler:
+    """
+    Wakes up once per deadline (or when an earlier one is scheduled), never polls games.
+    A game whose handler failed is scheduled again after retry_delay
+    """
+
+    def __init__(self, store, handler, idle_timeout=CLOCK_SCHEDULER_IDLE_TIMEOUT,
+                 retry_delay=CLOCK_SCHEDULER_RETRY_DELAY):
+        self.store = store
+        self.handler = handler
+        self.idle_timeout = idle_timeout
+        self.retry_delay = retry_delay
+
+    def run_pending(self, now=None) -> int:
+        now = now or time.time()
+        due = self.store.pop_due(now)
+        for game_uuid in due:
+            try:
+                self.handler(game_uuid)
+            except Exception:
+                logger.exception("Could not finish game %s on time", game_uuid)
+                self.store.schedule(game_uuid, now + self.retry_delay)
+        return len(due)
+
+    def run_forever(self):
+        while True:
+            self.run_pending()
+
+            deadline = self.store.next_deadline()
+            timeout = self.idle_timeout if deadline is None else min(deadline - time.time(), self.idle_timeout)
+            if timeout > 0:
+                self.store.wait(timeout)
@@ -1 +1,74 @@
 K_FACTOR = 32
+
+# Live board cache
+LIVE_BOARD_CACHE_SIZE = 1000
+LIVE_BOARD_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Clock scheduler
+CLOCK_SCHEDULER_BATCH_SIZE = 500
+CLOCK_SCHEDULER_IDLE_TIMEOUT = 60
+CLOCK_SCHEDULER_RETRY_DELAY = 5
+
+# PGN import
+PGN_IMPORT_BATCH_SIZE = 500
+PGN_IMPORT_CHUNK_SIZE = 20
+
+# PGN export
+PGN_EXPORT_CHUNK_SIZE = 500
+
+# Position index
+POSITION_INDEX_BATCH_SIZE = 1000
+
+# Opening explorer
+OPENING_EXPLORER_DEPTH = 30
+OPENING_EXPLORER_BATCH_SIZE = 1000
+# games finished this long before a rebuild started are counted again after the swap
+OPENING_EXPLORER_CATCH_UP = 60
+
+# Category ratings
+RATING_SYSTEM = "glicko2"
+RATING_BATCH_SIZE = 1000
+
+# Leaderboards
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 200
+LEADERBOARD_AROUND_SIZE = 5
+
+# Matchmaking
+MATCHMAKING_BUCKET_SIZE = 50
+MATCHMAKING_INITIAL_WINDOW = 100
+MATCHMAKING_WINDOW_WIDENING = 10
+MATCHMAKING_MAX_WINDOW = 500
+MATCHMAKING_BATCH_SIZE = 1000
+MATCHMAKING_TICK = 1
+MATCHMAKING_LEADER_TTL = 10
+
+# Broadcast (Janus)
+BROADCAST_CONNECT_TIMEOUT = 3
+BROADCAST_READ_TIMEOUT = 10
+BROADCAST_RETRIES = 3
+BROADCAST_BACKOFF = 0.5
+BROADCAST_HTTP_POOL_SIZE = 20
+BROADCAST_ROOM_WORKERS = 8
+
+# Broadcast room pool
+BROADCAST_ROOM_POOL_SIZE = 40
+BROADCAST_ROOM_TTL = 60 * 60 * 6
+BROADCAST_ROOM_LEASE_TTL = 60 * 60 * 12
+BROADCAST_ROOM_POOL_INTERVAL = 20
+
+# Engine analysis
+ANALYSIS_ENGINES = 2
+ANALYSIS_DEPTH = 18
+ANALYSIS_LIVE_DEPTH = 12
+ANALYSIS_MAX_DEPTH = 24
+ANALYSIS_TIME_LIMIT = 10
+ANALYSIS_LIVE_TTL = 15
+ANALYSIS_QUEUE_SIZE = 10000
+ANALYSIS_ENGINE_NICE = 10
+ANALYSIS_MATE_SCORE = 10000
+EVAL_CACHE_TTL = 60 * 60 * 24 * 30
+ANALYSIS_INACCURACY = 50
+ANALYSIS_MISTAKE = 100
+ANALYSIS_BLUNDER = 300
+ANALYSIS_CPL_CAP = 1000
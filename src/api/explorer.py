@@ -0,0 +1,190 @@
+"""
+Opening explorer
+
+For every position (Zobrist key) of the first OPENING_EXPLORER_DEPTH plies the explorer keeps
+per next move: white wins, draws, black wins, the sum of the mover's ratings and the number
+of rated games. A finished game is added once, a rebuild replaces everything at once.
+"""
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import movelog, positions
+from .constants import OPENING_EXPLORER_DEPTH
+
+WHITE, DRAW, BLACK, RATING_SUM, RATED = range(5)
+FIELDS = "wdbrn"
+
+
+def game_entries(log, depth=OPENING_EXPLORER_DEPTH) -> list:
+    """
+    [(position key, packed move, mover is white)] for the first depth plies of a move log
+    """
+    moves = movelog.decode_moves(log)[:depth]
+    keys = positions.replay(moves)
+    return [(key, movelog.pack_move(move), ply % 2 == 0) for ply, (key, move) in enumerate(zip(keys, moves))]
+
+
+def count_games(games, depth=OPENING_EXPLORER_DEPTH) -> dict:
+    """
+    Map step of a rebuild, runs in a worker process.
+    games: [(move log, outcome, white rating, black rating)], outcome is WHITE, DRAW or BLACK
+    """
+    stats = defaultdict(lambda: [0, 0, 0, 0, 0])
+    for log, outcome, white_rating, black_rating in games:
+        for key, move, is_white in game_entries(log, depth):
+            entry = stats[key, move]
+            entry[outcome] += 1
+            rating = white_rating if is_white else black_rating
+            if rating is not None:
+                entry[RATING_SUM] += rating
+                entry[RATED] += 1
+    return dict(stats)
+
+
+def merge(total: dict, stats: dict) -> dict:
+    """
+    Reduce step of a rebuild
+    """
+    for entry_key, entry in stats.items():
+        if entry_key in total:
+            total[entry_key] = [a + b for a, b in zip(total[entry_key], entry)]
+        else:
+            total[entry_key] = entry
+    return total
+
+
+class RedisOpeningExplorer:
+    """
+    One hash per position, fields "<packed move>:<w|d|b|r|n>".
+    Keys carry a generation so that a rebuild can switch to a fully written tree
+    """
+
+    prefix = "explorer"
+    generation_key = "explorer:generation"
+
+    # KEYS: games set, then the position hash of every increment; ARGV: game id, then field and amount pairs.
+    # The game is marked and counted atomically, or not at all if it was already counted
+    add_game_script = """
+    if redis.call("SADD", KEYS[1], ARGV[1]) == 0 then
+        return 0
+    end
+    for i = 2, #KEYS do
+        redis.call("HINCRBY", KEYS[i], ARGV[2 * i - 2], ARGV[2 * i - 1])
+    end
+    return 1
+    """
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+        self._add_game = self.redis.register_script(self.add_game_script)
+
+    def _generation(self) -> int:
+        return int(self.redis.get(self.generation_key) or 0)
+
+    def _key(self, generation, position_key) -> str:
+        return f"{self.prefix}:{generation}:{position_key}"
+
+    def _games_key(self, generation) -> str:
+        return f"{self.prefix}:{generation}:games"
+
+    def add_game(self, game_id, entries: list, outcome: int, ratings: dict) -> bool:
+        """
+        ratings: {True: white rating, False: black rating}, None for unrated players
+        """
+        generation = self._generation()
+        keys, args = [self._games_key(generation)], [str(game_id)]
+        for position_key, move, is_white in entries:
+            key = self._key(generation, position_key)
+            increments = [(FIELDS[outcome], 1)]
+            if ratings.get(is_white) is not None:
+                increments += [(FIELDS[RATING_SUM], int(ratings[is_white])), (FIELDS[RATED], 1)]
+            for field, amount in increments:
+                keys.append(key)
+                args += [f"{move}:{field}", amount]
+        return bool(self._add_game(keys=keys, args=args))
+
+    def moves(self, position_key) -> dict:
+        """
+        {packed move: [white, draws, black, rating sum, rated]}
+        """
+        stats = defaultdict(lambda: [0, 0, 0, 0, 0])
+        for field, value in self.redis.hgetall(self._key(self._generation(), position_key)).items():
+            move, stat = field.decode().split(":")
+            stats[int(move)][FIELDS.index(stat)] = int(value)
+        return dict(stats)
+
+    def replace(self, stats: dict, game_ids, batch_size=10000) -> None:
+        old, new = self._generation(), self._generation() + 1
+        self._delete_generation(new)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for i, ((position_key, move), entry) in enumerate(stats.items(), 1):
+            pipe.hset(self._key(new, position_key), mapping={
+                f"{move}:{field}": value for field, value in zip(FIELDS, entry) if value
+            })
+            if i % batch_size == 0:
+                pipe.execute()
+        game_ids = [str(game_id) for game_id in game_ids]
+        for start in range(0, len(game_ids), batch_size):
+            pipe.sadd(self._games_key(new), *game_ids[start:start + batch_size])
+        pipe.execute()
+
+        self.redis.set(self.generation_key, new)
+        self._delete_generation(old)
+
+    def _delete_generation(self, generation) -> None:
+        keys = []
+        for key in self.redis.scan_iter(match=f"{self.prefix}:{generation}:*", count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                self.redis.unlink(*keys)
+                keys = []
+        if keys:
+            self.redis.unlink(*keys)
+
+
+class InMemoryOpeningExplorer:
+    """
+    Per-process explorer for tests and local development
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._games = set()
+        self._lock = threading.Lock()
+
+    def add_game(self, game_id, entries: list, outcome: int, ratings: dict) -> bool:
+        with self._lock:
+            if str(game_id) in self._games:
+                return False
+            self._games.add(str(game_id))
+            for position_key, move, is_white in entries:
+                entry = self._stats.setdefault(position_key, {}).setdefault(move, [0, 0, 0, 0, 0])
+                entry[outcome] += 1
+                if ratings.get(is_white) is not None:
+                    entry[RATING_SUM] += int(ratings[is_white])
+                    entry[RATED] += 1
+        return True
+
+    def moves(self, position_key) -> dict:
+        with self._lock:
+            return {move: list(entry) for move, entry in self._stats.get(position_key, {}).items()}
+
+    def replace(self, stats: dict, game_ids) -> None:
+        tree = {}
+        for (position_key, move), entry in stats.items():
+            tree.setdefault(position_key, {})[move] = list(entry)
+        with self._lock:
+            self._stats = tree
+            self._games = {str(game_id) for game_id in game_ids}
+
+
+@lru_cache(maxsize=None)
+def get_opening_explorer():
+    config = settings.OPENING_EXPLORER
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
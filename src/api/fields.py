@@ -0,0 +1,21 @@
+from annoying import fields
+
+
+class AutoSingleRelatedObjectDescriptor(fields.AutoSingleRelatedObjectDescriptor):
+    """
+    Уже загруженный объект (select_related, повторное обращение) возвращается без atomic:
+    исходный дескриптор открывает savepoint на каждое чтение, даже когда в БД идти не нужно
+    """
+
+    def __get__(self, instance, instance_type=None):
+        if instance is not None:
+            cached = self.related.get_cached_value(instance, default=None)
+            if cached is not None:
+                return cached
+
+        return super().__get__(instance, instance_type)
+
+
+class AutoOneToOneField(fields.AutoOneToOneField):
+    def contribute_to_related_class(self, cls, related):
+        setattr(cls, related.get_accessor_name(), AutoSingleRelatedObjectDescriptor(related))
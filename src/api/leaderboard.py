@@ -0,0 +1,154 @@
+"""
+Leaderboards
+
+Every rating category has its own sorted set of player ids scored by rating:
+ELO_CATEGORY for Elo and the TimeControlType id for the per time control ratings.
+Ranks start at 1, the lookups are O(log n) in Redis.
+"""
+import bisect
+import logging
+import threading
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ELO_CATEGORY = "elo"
+
+
+class RedisLeaderboard:
+    """
+    One Redis sorted set per category, equal ratings are ordered by player id as a string
+    """
+
+    key_prefix = "leaderboard:"
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def _key(self, category) -> str:
+        return f"{self.key_prefix}{category}"
+
+    def update(self, category, ratings: dict) -> None:
+        if not ratings:
+            return
+        try:
+            self.redis.zadd(self._key(category), {str(player_id): rating for player_id, rating in ratings.items()})
+        except redis.RedisError:
+            logger.exception("Could not update the %s leaderboard", category)
+
+    def replace(self, category, ratings: dict, batch_size=10000) -> None:
+        """
+        Fills a temporary set and renames it, readers never see a partial leaderboard
+        """
+        key = self._key(category)
+        if not ratings:
+            self.redis.delete(key)
+            return
+
+        tmp_key = f"{key}:rebuild"
+        self.redis.delete(tmp_key)
+        items = [(str(player_id), rating) for player_id, rating in ratings.items()]
+        pipe = self.redis.pipeline(transaction=False)
+        for start in range(0, len(items), batch_size):
+            pipe.zadd(tmp_key, dict(items[start:start + batch_size]))
+        pipe.execute()
+        self.redis.rename(tmp_key, key)
+
+    def position(self, category, player_id):
+        """
+        (rank, rating) of a player or None if they are not rated in the category
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrevrank(self._key(category), str(player_id))
+        pipe.zscore(self._key(category), str(player_id))
+        rank, rating = pipe.execute()
+        return None if rank is None else (rank + 1, rating)
+
+    def page(self, category, offset: int, limit: int) -> list:
+        """
+        [(rank, player_id, rating)] starting from the offset
+        """
+        if limit <= 0:
+            return []
+        entries = self.redis.zrevrange(self._key(category), offset, offset + limit - 1, withscores=True)
+        return [
+            (offset + i + 1, int(player_id), rating) for i, (player_id, rating) in enumerate(entries)
+        ]
+
+    def size(self, category) -> int:
+        return self.redis.zcard(self._key(category))
+
+
+class InMemoryLeaderboard:
+    """
+    Per-process leaderboard for tests and local development.
+    Entries are kept like a Redis sorted set, ascending by (rating, player id as a string),
+    and read from the end, so equal ratings are ordered exactly as in RedisLeaderboard
+    """
+
+    def __init__(self):
+        self._ratings = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _insert(self, category, player_id, rating) -> None:
+        ratings = self._ratings.setdefault(category, {})
+        entries = self._entries.setdefault(category, [])
+        if player_id in ratings:
+            del entries[bisect.bisect_left(entries, (ratings[player_id], player_id))]
+        ratings[player_id] = rating
+        bisect.insort(entries, (rating, player_id))
+
+    def update(self, category, ratings: dict) -> None:
+        with self._lock:
+            for player_id, rating in ratings.items():
+                self._insert(str(category), str(player_id), rating)
+
+    def replace(self, category, ratings: dict) -> None:
+        with self._lock:
+            self._ratings.pop(str(category), None)
+            self._entries.pop(str(category), None)
+            for player_id, rating in ratings.items():
+                self._insert(str(category), str(player_id), rating)
+
+    def position(self, category, player_id):
+        with self._lock:
+            rating = self._ratings.get(str(category), {}).get(str(player_id))
+            if rating is None:
+                return None
+            entries = self._entries[str(category)]
+            return len(entries) - bisect.bisect_left(entries, (rating, str(player_id))), rating
+
+    def page(self, category, offset: int, limit: int) -> list:
+        with self._lock:
+            entries = self._entries.get(str(category), [])
+            end = max(len(entries) - offset, 0)
+            page = entries[max(end - max(limit, 0), 0):end][::-1]
+            return [(offset + i + 1, int(player_id), rating) for i, (rating, player_id) in enumerate(page)]
+
+    def size(self, category) -> int:
+        with self._lock:
+            return len(self._entries.get(str(category), []))
+
+
+@lru_cache(maxsize=None)
+def get_leaderboard():
+    config = settings.LEADERBOARD
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+def get_around(leaderboard, category, player_id, size: int):
+    """
+    Position of a player and the page of players around them: size above and size below
+    """
+    position = leaderboard.position(category, player_id)
+    if position is None:
+        return None, []
+
+    rank, _ = position
+    offset = max(rank - 1 - size, 0)
+    return position, leaderboard.page(category, offset, rank - 1 - offset + size + 1)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import services
+from api.constants import ANALYSIS_DEPTH
+from api.models import Game
+from core.tournament.models import Tournament
+
+
+class Command(BaseCommand):
+    help = "Analyses finished games with the engine: annotated PGN, accuracy and mistakes. Can be resumed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tournament", type=int, default=None, help="Only the games of this tournament")
+        parser.add_argument("--depth", type=int, default=ANALYSIS_DEPTH)
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Processes with an engine each, all CPUs by default, 0 analyses in this process",
+        )
+
+    def handle(self, *args, **options):
+        kwargs = dict(
+            depth=options["depth"],
+            workers=options["workers"],
+            progress=lambda done, total: self.stdout.write(f"{done}/{total} games analysed"),
+        )
+        if options["tournament"] is not None:
+            try:
+                tournament = Tournament.objects.get(pk=options["tournament"])
+            except Tournament.DoesNotExist:
+                raise CommandError(f"Tournament {options['tournament']} does not exist")
+            analysed = services.analyse_tournament(tournament, **kwargs)
+        else:
+            analysed = services.analyse_games(Game.objects.all(), **kwargs)
+        self.stdout.write(self.style.SUCCESS(f"{analysed} games analysed"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from api.constants import PGN_IMPORT_BATCH_SIZE
+from api.pgn_import import import_pgn
+
+
+class Command(BaseCommand):
+    help = "Imports every game of PGN files without broadcasting them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+")
+        parser.add_argument("--batch-size", type=int, default=PGN_IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Parsing processes, all CPUs by default, 0 parses in this process",
+        )
+        parser.add_argument(
+            "--match-players", action="store_true",
+            help="Attach games to the accounts named in the White and Black tags",
+        )
+        parser.add_argument(
+            "--rated", action="store_true",
+            help="Count the imported games in rating recalculations",
+        )
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            stats = import_pgn(
+                path,
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+                progress=self.report_progress,
+                match_players=options["match_players"],
+                rated=options["rated"],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{path}: {stats['imported']} games imported, {stats['skipped']} skipped "
+                f"in {stats['seconds']:.1f}s"
+            ))
+
+    def report_progress(self, imported, skipped, seconds):
+        rate = imported / seconds if seconds else 0
+        self.stdout.write(f"{imported} games imported, {skipped} skipped ({rate:.0f} games/s)")
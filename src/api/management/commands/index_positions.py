@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api import services
+from api.constants import POSITION_INDEX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Indexes the positions of boards saved before the position index existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=POSITION_INDEX_BATCH_SIZE)
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Replaying processes, all CPUs by default, 0 replays in this process",
+        )
+
+    def handle(self, *args, **options):
+        indexed = services.index_positions(
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            progress=lambda indexed: self.stdout.write(f"{indexed} boards indexed"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"{indexed} boards indexed"))
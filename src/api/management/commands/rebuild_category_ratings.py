@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import services
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per time control ratings from every finished game, one game per rating period"
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        amount = services.rebuild_category_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f"Ratings rebuilt from {amount} games in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import services
+
+
+class Command(BaseCommand):
+    help = "Fills every leaderboard from the stored ratings"
+
+    def handle(self, *args, **options):
+        amount = services.rebuild_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f"{amount} leaderboards rebuilt"))
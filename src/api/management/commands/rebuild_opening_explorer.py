@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api import services
+from api.constants import OPENING_EXPLORER_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the opening explorer from every finished game"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=OPENING_EXPLORER_BATCH_SIZE)
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Counting processes, all CPUs by default, 0 counts in this process",
+        )
+
+    def handle(self, *args, **options):
+        games = services.rebuild_opening_explorer(
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            progress=lambda games: self.stdout.write(f"{games} games counted"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Opening explorer rebuilt from {games} games"))
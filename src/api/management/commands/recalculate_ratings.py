@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from api import services
+
+
+class Command(BaseCommand):
+    help = "Recalculates Elo ratings from every game finished since the given moment"
+
+    def add_arguments(self, parser):
+        parser.add_argument("since", help="ISO 8601 datetime, e.g. 2021-03-14T19:47:00+00:00")
+
+    def handle(self, *args, **options):
+        since = parse_datetime(options["since"])
+        if since is None:
+            raise CommandError(f"Invalid datetime: {options['since']}")
+
+        amount = services.recalculate_ratings(since)
+        self.stdout.write(self.style.SUCCESS(f"Ratings recalculated from {amount} games"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api import services
+from api.analysis.cache import get_eval_cache
+from api.analysis.engine import AnalysisWorker, get_engine_pool
+from api.analysis.jobs import get_analysis_queue
+
+
+class Command(BaseCommand):
+    help = "Evaluates queued positions with the local UCI engine pool, live games first"
+
+    def handle(self, *args, **options):
+        pool = get_engine_pool()
+        worker = AnalysisWorker(pool, get_analysis_queue(), get_eval_cache(), notify=services.send_live_eval)
+        self.stdout.write(f"Analysis started with {pool.size} engines")
+        try:
+            worker.run_forever()
+        finally:
+            pool.close()
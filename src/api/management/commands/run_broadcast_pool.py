@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.broadcast.pool import RoomPoolMaintainer, get_room_pool
+from api.constants import BROADCAST_ROOM_POOL_SIZE
+
+
+class Command(BaseCommand):
+    help = "Keeps a pool of ready Janus rooms: health checks, TTL recycling and refilling"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=BROADCAST_ROOM_POOL_SIZE)
+        parser.add_argument("--once", action="store_true", help="Run a single maintenance pass and print the stats")
+
+    def handle(self, *args, **options):
+        maintainer = RoomPoolMaintainer(get_room_pool(), size=options["size"])
+        if options["once"]:
+            self.stdout.write(str(maintainer.run_once()))
+            return
+
+        maintainer.run_forever()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import services
+from api.clocks import ClockScheduler, get_clock_store
+
+
+class Command(BaseCommand):
+    help = "Finishes games on time forfeit when a player's clock runs out"
+
+    def handle(self, *args, **options):
+        amount = services.schedule_unfinished_games()
+        self.stdout.write(f"Scheduled clocks of {amount} games in progress")
+
+        ClockScheduler(get_clock_store(), self.finish_game_on_time).run_forever()
+
+    @staticmethod
+    def finish_game_on_time(game_uuid):
+        close_old_connections()
+        services.finish_game_on_time(game_uuid)
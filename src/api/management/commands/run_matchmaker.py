@@ -0,0 +1,23 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import services
+from api.matchmaking import Matchmaker, get_seek_queue
+
+
+class Command(BaseCommand):
+    help = "Pairs players waiting for an opponent, only the node holding the lease does the pairing"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Matchmaker started")
+        asyncio.run(Matchmaker(get_seek_queue(), self.create_game).run_forever())
+
+    @staticmethod
+    async def create_game(white, black):
+        await sync_to_async(close_old_connections)()
+        await sync_to_async(services.create_matched_game)(
+            white.player_id, black.player_id, white.time_control_type_id
+        )
@@ -0,0 +1,292 @@
+"""
+Matchmaking
+
+Web nodes push seeks and cancellations to a shared queue. A single matchmaker (the node
+holding the leadership lease) drains it into an in-memory pool and pairs players of the same
+time control whose Elo difference fits a window that widens while a seek waits.
+The pool lives only in the leader's memory, seeks waiting there are lost when the lease moves.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .constants import (
+    MATCHMAKING_BATCH_SIZE,
+    MATCHMAKING_BUCKET_SIZE,
+    MATCHMAKING_INITIAL_WINDOW,
+    MATCHMAKING_LEADER_TTL,
+    MATCHMAKING_MAX_WINDOW,
+    MATCHMAKING_TICK,
+    MATCHMAKING_WINDOW_WIDENING,
+)
+
+logger = logging.getLogger(__name__)
+
+SEEK = "seek"
+CANCEL = "cancel"
+
+
+class Seek:
+    __slots__ = ("player_id", "rating", "time_control_type_id", "created_at")
+
+    def __init__(self, player_id, rating, time_control_type_id, created_at):
+        self.player_id = player_id
+        self.rating = rating
+        self.time_control_type_id = time_control_type_id
+        self.created_at = created_at
+
+    def __repr__(self):
+        return f"Seek({self.player_id}, {self.rating}, {self.time_control_type_id})"
+
+
+class SeekPool:
+    """
+    Seeks are kept in deques per (time control, rating bucket), oldest first.
+    A player has at most one seek, replaced and cancelled seeks are dropped lazily
+    """
+
+    def __init__(
+        self,
+        bucket_size=MATCHMAKING_BUCKET_SIZE,
+        initial_window=MATCHMAKING_INITIAL_WINDOW,
+        widening=MATCHMAKING_WINDOW_WIDENING,
+        max_window=MATCHMAKING_MAX_WINDOW,
+    ):
+        self.bucket_size = bucket_size
+        self.initial_window = initial_window
+        self.widening = widening
+        self.max_window = max_window
+        self._seeks = {}
+        self._buckets = defaultdict(deque)
+        self._order = deque()
+
+    def __len__(self):
+        return len(self._seeks)
+
+    def _bucket(self, rating) -> int:
+        return int(rating // self.bucket_size)
+
+    def _is_active(self, seek: Seek) -> bool:
+        return self._seeks.get(seek.player_id) is seek
+
+    def window(self, seek: Seek, now: float) -> float:
+        return min(self.initial_window + self.widening * max(now - seek.created_at, 0), self.max_window)
+
+    def _find_opponent(self, seek: Seek, now: float):
+        """
+        Closest active seek within the window, the oldest one among equally close buckets.
+        Buckets are visited from the center outwards and the search stops when no
+        farther bucket can hold a closer rating
+        """
+        window = self.window(seek, now)
+        center = self._bucket(seek.rating)
+        reach = int(window // self.bucket_size) + 1
+
+        best, best_difference = None, None
+        for distance in range(reach + 1):
+            if best is not None and (distance - 1) * self.bucket_size > best_difference:
+                break
+            for bucket_index in {center - distance, center + distance}:
+                bucket = self._buckets.get((seek.time_control_type_id, bucket_index))
+                if not bucket:
+                    continue
+                while bucket and not self._is_active(bucket[0]):
+                    bucket.popleft()
+                for other in bucket:
+                    if other.player_id == seek.player_id or not self._is_active(other):
+                        continue
+                    difference = abs(other.rating - seek.rating)
+                    if difference <= window and (best is None or difference < best_difference):
+                        best, best_difference = other, difference
+
+        return best
+
+    def _remove(self, seek: Seek) -> None:
+        del self._seeks[seek.player_id]
+        bucket = self._buckets[seek.time_control_type_id, self._bucket(seek.rating)]
+        bucket.remove(seek)
+        if not bucket:
+            del self._buckets[seek.time_control_type_id, self._bucket(seek.rating)]
+
+    def add(self, seek: Seek, now: float):
+        """
+        Pairs the seek right away if possible, otherwise it waits in the pool.
+        Returns the opponent's seek or None
+        """
+        previous = self._seeks.get(seek.player_id)
+        if previous is not None:
+            self._remove(previous)
+
+        opponent = self._find_opponent(seek, now)
+        if opponent is not None:
+            self._remove(opponent)
+            return opponent
+
+        self._seeks[seek.player_id] = seek
+        self._buckets[seek.time_control_type_id, self._bucket(seek.rating)].append(seek)
+        self._order.append(seek)
+        return None
+
+    def cancel(self, player_id) -> None:
+        seek = self._seeks.get(player_id)
+        if seek is not None:
+            self._remove(seek)
+
+    def clear(self) -> None:
+        self._seeks.clear()
+        self._buckets.clear()
+        self._order.clear()
+
+    def pop_pairs(self, now: float) -> list:
+        """
+        Pairs seeks whose windows have widened enough, the longest waiting seek chooses first
+        """
+        pairs = []
+        for seek in list(self._order):
+            if not self._is_active(seek):
+                continue
+            opponent = self._find_opponent(seek, now)
+            if opponent is not None:
+                self._remove(seek)
+                self._remove(opponent)
+                pairs.append((seek, opponent))
+
+        self._order = deque(seek for seek in self._order if self._is_active(seek))
+        return pairs
+
+
+class RedisSeekQueue:
+    """
+    Commands in a Redis list, the leadership lease is a key with a TTL
+    """
+
+    key = "matchmaking:commands"
+    leader_key = "matchmaking:leader"
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def push(self, command: dict) -> None:
+        self.redis.rpush(self.key, json.dumps(command))
+
+    def pop(self, timeout: float, limit=MATCHMAKING_BATCH_SIZE) -> list:
+        first = self.redis.blpop([self.key], timeout=max(int(timeout), 1))
+        if not first:
+            return []
+
+        pipe = self.redis.pipeline()
+        pipe.lrange(self.key, 0, limit - 2)
+        pipe.ltrim(self.key, limit - 1, -1)
+        rest, _ = pipe.execute()
+        return [json.loads(item) for item in [first[1], *rest]]
+
+    def acquire_leadership(self, node_id: str, ttl: float = MATCHMAKING_LEADER_TTL) -> bool:
+        ttl_ms = int(ttl * 1000)
+        if self.redis.set(self.leader_key, node_id, nx=True, px=ttl_ms):
+            return True
+
+        # продлеваем свою аренду, чужую не трогаем
+        pipe = self.redis.pipeline()
+        try:
+            pipe.watch(self.leader_key)
+            if pipe.get(self.leader_key) != node_id.encode():
+                return False
+            pipe.multi()
+            pipe.pexpire(self.leader_key, ttl_ms)
+            pipe.execute()
+            return True
+        except redis.WatchError:
+            return False
+        finally:
+            pipe.reset()
+
+
+class InMemorySeekQueue:
+    """
+    Per-process queue for tests and local development
+    """
+
+    def __init__(self):
+        self._commands = deque()
+        self._condition = threading.Condition()
+
+    def push(self, command: dict) -> None:
+        with self._condition:
+            self._commands.append(command)
+            self._condition.notify_all()
+
+    def pop(self, timeout: float, limit=MATCHMAKING_BATCH_SIZE) -> list:
+        with self._condition:
+            if not self._commands and timeout > 0:
+                self._condition.wait(timeout)
+            return [self._commands.popleft() for _ in range(min(limit, len(self._commands)))]
+
+    def acquire_leadership(self, node_id: str, ttl: float = MATCHMAKING_LEADER_TTL) -> bool:
+        return True
+
+
+@lru_cache(maxsize=None)
+def get_seek_queue():
+    config = settings.MATCHMAKING_QUEUE
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+class Matchmaker:
+    """
+    handler(white, black) is a coroutine creating the game of a pair
+    """
+
+    def __init__(self, queue, handler, pool=None, tick=MATCHMAKING_TICK):
+        self.queue = queue
+        self.handler = handler
+        self.pool = pool or SeekPool()
+        self.tick = tick
+        self.node_id = uuid.uuid4().hex
+
+    def apply(self, commands: list, now: float) -> list:
+        pairs = []
+        for command in commands:
+            if command["action"] == CANCEL:
+                self.pool.cancel(command["player"])
+                continue
+
+            seek = Seek(command["player"], command["rating"], command["time_control_type"], command["created_at"])
+            opponent = self.pool.add(seek, now)
+            if opponent is not None:
+                # дольше ждавший игрок играет белыми
+                pairs.append((opponent, seek))
+        return pairs
+
+    async def _pair(self, white: Seek, black: Seek) -> None:
+        try:
+            await self.handler(white, black)
+        except Exception:
+            logger.exception("Could not create a game for %s and %s", white, black)
+
+    async def run_pending(self, timeout: float = 0, now=None) -> int:
+        loop = asyncio.get_running_loop()
+        commands = await loop.run_in_executor(None, self.queue.pop, timeout)
+
+        now = now or time.time()
+        pairs = self.apply(commands, now) + self.pool.pop_pairs(now)
+        await asyncio.gather(*(self._pair(white, black) for white, black in pairs))
+        return len(pairs)
+
+    async def run_forever(self):
+        while True:
+            if not self.queue.acquire_leadership(self.node_id):
+                # пул ведет другой узел, ожидавшие здесь заявки уже у него или отменены:
+                # при возврате аренды они не должны спариться повторно
+                self.pool.clear()
+                await asyncio.sleep(self.tick)
+                continue
+            await self.run_pending(timeout=self.tick)
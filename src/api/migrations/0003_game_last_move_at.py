@@ -0,0 +1,42 @@
+# Generated by Django 3.0.7 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+def backfill_clocks(apps, schema_editor):
+    """
+    Fill the time spent by each player of unfinished games from the Move timestamps
+    """
+    Game = apps.get_model('api', 'Game')
+    Move = apps.get_model('api', 'Move')
+
+    games = Game.objects.filter(started_at__isnull=False, finished_at__isnull=True, board__isnull=False)
+    for game in games.iterator():
+        time_spent = {'white': 0, 'black': 0}
+        previous = game.started_at
+        timestamps = Move.objects.filter(board_id=game.board_id).order_by('id').values_list('created_at', flat=True)
+        for n, timestamp in enumerate(timestamps):
+            color = 'white' if n % 2 == 0 else 'black'
+            time_spent[color] += int((timestamp - previous).total_seconds())
+            previous = timestamp
+
+        game.white_player_time_spent = time_spent['white']
+        game.black_player_time_spent = time_spent['black']
+        game.last_move_at = previous
+        game.save(update_fields=['white_player_time_spent', 'black_player_time_spent', 'last_move_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_auto_20210314_1947'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='last_move_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_clocks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:01
+
+import chess
+from django.db import migrations, models
+
+
+def backfill_movetext(apps, schema_editor):
+    """
+    Replay the move stack of every board once to store the PGN movetext.
+    Move.san is dropped in 0015 and is not filled
+    """
+    Board = apps.get_model('api', 'Board')
+    Move = apps.get_model('api', 'Move')
+
+    for board in Board.objects.filter(move__isnull=False).distinct().iterator():
+        chess_board = chess.Board()
+        moves = Move.objects.filter(board_id=board.id).order_by('id').values_list('from_square', 'to_square')
+        tokens = []
+        for from_square, to_square in moves:
+            requested_move = chess.Move.from_uci(f'{from_square}{to_square}')
+            if requested_move not in chess_board.legal_moves:
+                break
+            if chess_board.turn:
+                tokens.append(f'{chess_board.fullmove_number}.')
+            tokens.append(chess_board.san(requested_move))
+            chess_board.push(requested_move)
+
+        board.movetext = ' '.join(tokens)
+        board.save(update_fields=['movetext'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_game_last_move_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='movetext',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='san',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.RunPython(backfill_movetext, migrations.RunPython.noop),
+    ]
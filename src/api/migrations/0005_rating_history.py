@@ -0,0 +1,35 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0004_pgn_movetext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.SmallIntegerField()),
+                ('delta', models.SmallIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('game', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_history', to='api.Game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('created_at', 'id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ratinghistory',
+            index=models.Index(fields=['player', 'created_at'], name='api_ratingh_player__d02cce_idx'),
+        ),
+    ]
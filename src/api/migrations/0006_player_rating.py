@@ -0,0 +1,34 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tournament', '0004_pairing'),
+        ('api', '0005_rating_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerRating',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('system', models.CharField(max_length=20)),
+                ('rating', models.FloatField()),
+                ('deviation', models.FloatField()),
+                ('volatility', models.FloatField()),
+                ('games', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to=settings.AUTH_USER_MODEL)),
+                ('time_control_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='tournament.TimeControlType')),
+            ],
+            options={
+                'unique_together': {('player', 'time_control_type', 'system')},
+            },
+        ),
+    ]
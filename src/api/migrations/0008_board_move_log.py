@@ -0,0 +1,52 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:33
+
+from itertools import groupby
+
+import chess
+from django.db import migrations, models
+
+from api import movelog
+
+BATCH_SIZE = 1000
+
+
+def backfill_move_log(apps, schema_editor):
+    """
+    Pack the Move rows of every board into its move log, one pass over the moves ordered by board
+    """
+    Board = apps.get_model('api', 'Board')
+    Move = apps.get_model('api', 'Move')
+
+    moves = (
+        Move.objects.filter(board__isnull=False)
+        .order_by('board_id', 'id')
+        .values_list('board_id', 'from_square', 'to_square', 'created_at')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    boards = []
+    for board_id, rows in groupby(moves, key=lambda row: row[0]):
+        rows = list(rows)
+        boards.append(Board(id=board_id, move_log=movelog.encode(
+            [chess.Move.from_uci(f'{from_square}{to_square}') for _, from_square, to_square, _ in rows],
+            [created_at for *_, created_at in rows],
+        )))
+        if len(boards) >= BATCH_SIZE:
+            Board.objects.bulk_update(boards, ['move_log'])
+            boards = []
+    Board.objects.bulk_update(boards, ['move_log'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_elo_rating_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='move_log',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(backfill_move_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_board_move_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='zobrist',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='BoardPosition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ply', models.PositiveSmallIntegerField()),
+                ('zobrist', models.BigIntegerField(db_index=True)),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='api.Board')),
+            ],
+            options={
+                'unique_together': {('board', 'ply')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_position_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameAnalysis',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('pgn', models.TextField()),
+                ('white_acpl', models.PositiveIntegerField(null=True)),
+                ('black_acpl', models.PositiveIntegerField(null=True)),
+                ('white_accuracy', models.FloatField(null=True)),
+                ('black_accuracy', models.FloatField(null=True)),
+                ('white_inaccuracies', models.PositiveSmallIntegerField(default=0)),
+                ('black_inaccuracies', models.PositiveSmallIntegerField(default=0)),
+                ('white_mistakes', models.PositiveSmallIntegerField(default=0)),
+                ('black_mistakes', models.PositiveSmallIntegerField(default=0)),
+                ('white_blunders', models.PositiveSmallIntegerField(default=0)),
+                ('black_blunders', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analysis', to='api.Game')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.7 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_game_analysis'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='black_player_time_spent',
+            field=models.FloatField(blank=True, default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='white_player_time_spent',
+            field=models.FloatField(blank=True, default=0, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.0.7 on 2026-10-18 21:08
+
+import api.fields
+from django.conf import settings
+from django.db import migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0011_time_spent_milliseconds'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='elo',
+            name='player',
+            field=api.fields.AutoOneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='elo', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 21:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_elo_player_cached_descriptor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='starting_fen',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
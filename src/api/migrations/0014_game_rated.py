@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 21:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_board_starting_fen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='rated',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.7 on 2026-10-18 21:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_game_rated'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='move',
+            name='san',
+        ),
+    ]
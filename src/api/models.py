@@ -1,7 +1,7 @@
 import uuid
+from datetime import timedelta
 
 import chess
-from annoying.fields import AutoOneToOneField
 from core.tournament.models import TimeControlType
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -10,6 +10,9 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils.timezone import now
 
+from . import movelog
+from .fields import AutoOneToOneField
+
 User = get_user_model()
 
 
@@ -18,7 +21,7 @@ class Elo(models.Model):
     https://en.wikipedia.org/wiki/Elo_rating_system#Mathematical_details
     """
 
-    rating = models.IntegerField(default=1200)
+    rating = models.IntegerField(default=1200, db_index=True)
     previous_rating = models.IntegerField(default=1200)
     wins = models.IntegerField(default=0)
     losses = models.IntegerField(default=0)
@@ -95,12 +98,25 @@ class Result(models.Model):
         (UNTERMINATED, "Game not terminated."),
     ]
 
+    PGN_RESULTS = {
+        WHITE_WINS: "1-0",
+        BLACK_WINS: "0-1",
+        DRAW: "1/2-1/2",
+    }
+
     result = models.TextField(choices=RESULT_CHOICES, default=SCHEDULED,)
     termination = models.TextField(choices=TERMINATION_CHOICES, default=UNTERMINATED,)
 
     def __str__(self):
         return self.result
 
+    @property
+    def pgn(self) -> str:
+        """
+        Результат в нотации PGN, "*" для незаконченной партии
+        """
+        return self.PGN_RESULTS.get(self.result, "*")
+
     @property
     def finished(self):
         """
@@ -108,6 +124,16 @@ class Result(models.Model):
         """
         return self.result in (self.WHITE_WINS, self.BLACK_WINS, self.DRAW)
 
+    def points(self, color: str):
+        """
+        Очки игрока за партию, None если партия не окончена
+        """
+        if self.result == self.DRAW:
+            return 0.5
+        if self.result in (self.WHITE_WINS, self.BLACK_WINS):
+            return float(self.result == (self.WHITE_WINS if color == "white" else self.BLACK_WINS))
+        return None
+
 
 class Board(models.Model):
     """
@@ -127,6 +153,11 @@ class Board(models.Model):
     halfmove_clock = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
     game_uuid = models.UUIDField(default=uuid.uuid4)
+    movetext = models.TextField(blank=True, default="")
+    move_log = models.BinaryField(default=bytes, editable=False)
+    zobrist = models.BigIntegerField(null=True, blank=True)
+    # пусто - партия с начальной позиции
+    starting_fen = models.TextField(blank=True, default="")
 
     def __str__(self):
         return f'{self.game}: {self.fen}'
@@ -135,34 +166,62 @@ class Board(models.Model):
         """
         Updates all the information needed to recover a Board (except for the move stack)
         """
-        attributes = [
-            "ep_square",
-            "turn",
-            "fullmove_number",
-            "halfmove_clock",
-        ]
+        for attribute, value in self.position_data(chess_board).items():
+            setattr(self, attribute, value)
 
-        for i in attributes:
-            setattr(self, i, getattr(chess_board, i))
+        self.save()
 
+    @staticmethod
+    def position_data(chess_board) -> dict:
+        """
+        Board field values for the position of a python-chess Board
+        """
         chess_board_flip_vert = chess_board.transform(chess.flip_vertical)
         chess_board_rotated = chess_board_flip_vert.transform(chess.flip_horizontal)
 
-        self.castling_rights = str(chess_board.castling_rights)
-        self.fen = chess_board.fen()
-        self.board_fen = chess_board.board_fen()
-        self.board_fen_flipped = chess_board_rotated.board_fen()
-        self.castling_xfen = chess_board.castling_xfen()
+        return {
+            "ep_square": chess_board.ep_square,
+            "turn": chess_board.turn,
+            "fullmove_number": chess_board.fullmove_number,
+            "halfmove_clock": chess_board.halfmove_clock,
+            "castling_rights": str(chess_board.castling_rights),
+            "fen": chess_board.fen(),
+            "board_fen": chess_board.board_fen(),
+            "board_fen_flipped": chess_board_rotated.board_fen(),
+            "castling_xfen": chess_board.castling_xfen(),
+        }
 
-        self.save()
+    def add_san(self, san: str) -> None:
+        """
+        Appends a move to the PGN movetext, must be called before update() saves the new position
+        """
+        if self.turn:
+            san = f"{self.fullmove_number}. {san}"
+        elif not self.movetext:
+            san = f"{self.fullmove_number}... {san}"
+
+        self.movetext = f"{self.movetext} {san}" if self.movetext else san
 
     @property
-    def move_stack(self):
-        if self.move_set:
-            moves = self.move_set.all()
-            move_ucis = [m.uci() for m in moves]
-            return move_ucis
-        return []
+    def ply(self) -> int:
+        """
+        Number of half-moves made since the starting position
+        """
+        return movelog.length(self.move_log)
+
+    def add_move(self, move, at=None) -> None:
+        """
+        Appends a move to the move log, saved together with the position by update()
+        """
+        self.move_log = movelog.append(self.move_log, move, at)
+
+    @property
+    def move_stack(self) -> list:
+        return movelog.decode_moves(self.move_log)
+
+    @property
+    def move_times(self) -> list:
+        return movelog.decode_times(self.move_log)
 
     @classmethod
     def from_fen(cls, fen):
@@ -175,6 +234,7 @@ class Board(models.Model):
 
         board_data = {
             "fen": fen,
+            "starting_fen": fen if fen != chess.STARTING_FEN else "",
             "turn": board.turn,
             "castling_xfen": board.castling_xfen(),
             "castling_rights": board.castling_rights,
@@ -189,6 +249,21 @@ class Board(models.Model):
         return self.fen
 
 
+class BoardPosition(models.Model):
+    """
+    Zobrist key of a board's position after every half-move, ply 0 is the initial position
+    """
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name="positions")
+    ply = models.PositiveSmallIntegerField()
+    zobrist = models.BigIntegerField(db_index=True)
+
+    class Meta:
+        unique_together = ("board", "ply")
+
+    def __str__(self):
+        return f"{self.board_id}: {self.ply}"
+
+
 class Piece(models.Model):
     BLACK_PAWN_SYMBOL = "P"
     BLACK_KNIGHT_SYMBOL = "N"
@@ -233,6 +308,29 @@ class Piece(models.Model):
         return self.piece_type
 
 
+def escape_pgn_value(value) -> str:
+    """
+    PGN tag value with backslashes and quotes escaped as the PGN spec requires
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class GameQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Everything GameSerializer reads, in a single query whatever the page size
+        """
+        return self.select_related(
+            "board",
+            "result",
+            "time_control_type",
+            "white_player__elo",
+            "white_player__avatar",
+            "black_player__elo",
+            "black_player__avatar",
+        )
+
+
 class Game(models.Model):
     NONE = "none"
     CAM = "cam"
@@ -271,9 +369,15 @@ class Game(models.Model):
     black_player_can_claim_draw = models.BooleanField(default=True)
     white_player_can_claim_draw = models.BooleanField(default=True)
     time_control_type = models.ForeignKey(TimeControlType, on_delete=models.CASCADE, null=True)
-    white_player_time_spent = models.SmallIntegerField(null=True, blank=True, default=0)
-    black_player_time_spent = models.SmallIntegerField(null=True, blank=True, default=0)
+    # секунды с точностью до миллисекунды
+    white_player_time_spent = models.FloatField(null=True, blank=True, default=0)
+    black_player_time_spent = models.FloatField(null=True, blank=True, default=0)
+    last_move_at = models.DateTimeField(null=True, blank=True)
     broadcast_type = models.CharField(max_length=100, choices=BROADCAST_TYPE_CHOICES)
+    # партии без рейтинга (импортированные) пересчет рейтингов пропускает
+    rated = models.BooleanField(default=True)
+
+    objects = GameQuerySet.as_manager()
 
     def check_white_or_black(self, user_id: int) -> str:
         if self.white_player and self.white_player.id == user_id:
@@ -281,17 +385,19 @@ class Game(models.Model):
         elif self.black_player and self.black_player.id == user_id:
             return 'black'
 
-    def set_cam_broadcast(self, color: str, value):
+    def set_cam_broadcast(self, color: str, value, save=True):
         if self.broadcast_type in ('cam', 'both'):
             setattr(self, f'{color}_player_broadcast', value)
-            self.save()
+            if save:
+                self.save()
         else:
             pass
 
-    def set_board_broadcast(self, color: str, value):
+    def set_board_broadcast(self, color: str, value, save=True):
         if self.broadcast_type in ('board', 'both'):
             setattr(self, f'{color}_player_broadcast_board', value)
-            self.save()
+            if save:
+                self.save()
         else:
             pass
 
@@ -299,72 +405,186 @@ class Game(models.Model):
         setattr(self, f'{color}_player_can_claim_draw', value)
         self.save()
 
-    def _calc_times(self):
-        timestamps = {0: self.started_at}
-        for n, timestamp in enumerate(Move.objects.filter(board=self.board).values_list('created_at', flat=True)):
-            timestamps[n + 1] = timestamp
-
-        move_times = {0: 0}
-        for n, timestamp in enumerate(timestamps):
-            if n > 0:
-                delta = (timestamps[timestamp] - timestamps.get(n - 1)).total_seconds()
-                move_times[n] = delta
-        return move_times
-
-    def move_amount(self, user: User):
+    def moves_made(self, color: str) -> int:
         """
-        Общее количество ходов определенного игрока
+        Количество сделанных игроком ходов, считается по журналу ходов без запросов к Move:
+        очередь хода у игрока, сделавшего меньше ходов (партия может начинаться ходом черных)
         """
-        return Move.objects.filter(board=self.board, user=user).count()
-
-    @property
-    def white_player_time_remaining(self):
-        move_times = self._calc_times()
-
-        white_player_time_spent = 0
-        for delta in move_times:
-            if delta % 2 != 0:
-                white_player_time_spent += int(move_times[delta])
+        if self.board is None:
+            return 0
+        ply = self.board.ply
+        if (color == 'white') == bool(self.board.turn):
+            return ply // 2
+        return ply - ply // 2
+
+    def time_remaining(self, color: str):
+        """
+        Оставшееся время игрока на момент последнего хода, с учетом доп. времени
+        """
+        if self.time_control_type is None:
+            return None
 
         tct_time = self.time_control_type.time
+        time_spent = getattr(self, f'{color}_player_time_spent') or 0
         if tct_time is not None:
-            white_player_time_remaining = tct_time - white_player_time_spent
+            time_remaining = tct_time - time_spent
         else:
-            white_player_time_remaining = 0
+            time_remaining = 0
 
         # учет доп времени
         tct_addition_time = self.time_control_type.additional_time
-        move_amount = self.move_amount(self.white_player)
         if tct_addition_time:
-            white_player_time_remaining += move_amount * tct_addition_time
-        return white_player_time_remaining
+            time_remaining += self.moves_made(color) * tct_addition_time
+        return time_remaining
+
+    @property
+    def white_player_time_remaining(self):
+        return self.time_remaining('white')
 
     @property
     def black_player_time_remaining(self):
-        move_times = self._calc_times()
+        return self.time_remaining('black')
 
-        black_player_time_spent = 0
-        for delta in move_times:
-            if delta % 2 == 0:
-                black_player_time_spent += int(move_times[delta])
+    @property
+    def pgn(self) -> str:
+        return self.to_pgn()
 
-        tct_time = self.time_control_type.time
-        if tct_time is not None:
-            black_player_time_remaining = tct_time - black_player_time_spent
-        else:
-            black_player_time_remaining = 0
+    def pgn_headers(self, event: str = "?") -> list:
+        """
+        Заголовки PGN из данных партии: обязательные семь тегов, затем рейтинги,
+        контроль времени и причина окончания
+        """
+        date = self.started_at or self.created_at
+        result = self.result.pgn if self.result else "*"
+        headers = [
+            ("Event", event),
+            ("Site", "?"),
+            ("Date", date.strftime("%Y.%m.%d") if date else "????.??.??"),
+            ("Round", "?"),
+            ("White", self.white_player.username if self.white_player else "?"),
+            ("Black", self.black_player.username if self.black_player else "?"),
+            ("Result", result),
+        ]
 
-        # учет доп времени
-        tct_addition_time = self.time_control_type.additional_time
-        move_amount = self.move_amount(self.black_player)
-        if tct_addition_time:
-            black_player_time_remaining += move_amount * tct_addition_time
-        return black_player_time_remaining
+        if self.board and self.board.starting_fen:
+            headers += [("SetUp", "1"), ("FEN", self.board.starting_fen)]
+
+        if self.white_player:
+            headers.append(("WhiteElo", self.white_player.elo.rating))
+        if self.black_player:
+            headers.append(("BlackElo", self.black_player.elo.rating))
+
+        time_control_type = self.time_control_type
+        if time_control_type and time_control_type.time:
+            time_control = str(time_control_type.time)
+            if time_control_type.additional_time:
+                time_control += f"+{time_control_type.additional_time}"
+            headers.append(("TimeControl", time_control))
+
+        if self.result and self.result.finished:
+            headers.append(("Termination", self.result.termination))
+
+        return headers
+
+    def to_pgn(self, event: str = "?") -> str:
+        """
+        PGN партии: заголовки и сохраненный при ходах movetext
+        """
+        result = self.result.pgn if self.result else "*"
+        tags = "\n".join(f'[{name} "{escape_pgn_value(value)}"]' for name, value in self.pgn_headers(event))
+        movetext = self.board.movetext if self.board else ""
+
+        return f"{tags}\n\n{movetext} {result}" if movetext else f"{tags}\n\n{result}"
+
+    @property
+    def clock_color(self) -> str:
+        """
+        Цвет игрока, чьи часы сейчас идут
+        """
+        return 'white' if self.board.turn else 'black'
+
+    def flag_deadline(self):
+        """
+        Момент, когда истечет время игрока, чьи часы идут, или None
+        """
+        if self.started_at is None or self.finished_at is not None or self.board is None:
+            return None
+        if self.time_control_type is None or self.time_control_type.time is None:
+            return None
+
+        clock_started_at = self.last_move_at or self.started_at
+        return clock_started_at + timedelta(seconds=self.time_remaining(self.clock_color))
+
+    def flag_fallen_color(self, at=None):
+        """
+        Цвет игрока, у которого истекло время, или None
+        """
+        deadline = self.flag_deadline()
+        if deadline is None or (at or now()) < deadline:
+            return None
+        return self.clock_color
+
+
+class RatingHistory(models.Model):
+    """
+    Рейтинг игрока после партии и его изменение
+    """
+    player = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="rating_history")
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, null=True, related_name="rating_history")
+    rating = models.SmallIntegerField()
+    delta = models.SmallIntegerField()
+    created_at = models.DateTimeField(default=now)
+
+    class Meta:
+        ordering = ("created_at", "id")
+        indexes = [models.Index(fields=["player", "created_at"])]
+
+
+class GameAnalysis(models.Model):
+    """
+    Разбор законченной партии движком: PGN с оценками и пометками ходов,
+    средняя потеря в сантипешках, точность и число ошибок каждого игрока
+    """
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, related_name="analysis")
+    depth = models.PositiveSmallIntegerField()
+    pgn = models.TextField()
+    white_acpl = models.PositiveIntegerField(null=True)
+    black_acpl = models.PositiveIntegerField(null=True)
+    white_accuracy = models.FloatField(null=True)
+    black_accuracy = models.FloatField(null=True)
+    white_inaccuracies = models.PositiveSmallIntegerField(default=0)
+    black_inaccuracies = models.PositiveSmallIntegerField(default=0)
+    white_mistakes = models.PositiveSmallIntegerField(default=0)
+    black_mistakes = models.PositiveSmallIntegerField(default=0)
+    white_blunders = models.PositiveSmallIntegerField(default=0)
+    black_blunders = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return f"{self.game_id}: {self.depth}"
+
+
+class PlayerRating(models.Model):
+    """
+    Рейтинг игрока в категории контроля времени, system - рейтинговая система из api.ratings
+    """
+    player = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="ratings")
+    time_control_type = models.ForeignKey(TimeControlType, on_delete=models.CASCADE, related_name="ratings")
+    system = models.CharField(max_length=20)
+    rating = models.FloatField()
+    deviation = models.FloatField()
+    volatility = models.FloatField()
+    games = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("player", "time_control_type", "system")
 
 
 class Move(models.Model):
     """
-    Each individual move that composes a board's move stack
+    Each individual move that composes a board's move stack.
+    Not written anymore, the moves are stored in Board.move_log
     """
     created_at = models.DateTimeField(auto_now_add=True)
     from_square = models.CharField(max_length=2)
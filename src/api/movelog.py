@@ -0,0 +1,89 @@
+"""
+Compact move log
+
+The moves of a board are kept in a single binary field: an 8-byte header holding the time
+of the latest move (milliseconds since the epoch), followed by one 6-byte record per half-move,
+a 16-bit packed move and the milliseconds elapsed since the previous move.
+A move is packed as from square (6 bits), to square (6 bits) and promotion piece type (3 bits).
+Appending a move rewrites the header and adds a record, earlier records never change.
+"""
+import struct
+from datetime import datetime, timezone
+
+import chess
+
+HEADER = struct.Struct("<q")
+RECORD = struct.Struct("<HI")
+
+MAX_DELTA = 2 ** 32 - 1
+
+
+def pack_move(move: chess.Move) -> int:
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def unpack_move(value: int) -> chess.Move:
+    return chess.Move(value & 0x3F, value >> 6 & 0x3F, value >> 12 & 0x7 or None)
+
+
+def _timestamp(at) -> int:
+    return 0 if at is None else int(at.timestamp() * 1000)
+
+
+def append(log, move: chess.Move, at=None) -> bytes:
+    """
+    The log with a move made at the given time added, at=None for moves without a time
+    """
+    log = memoryview(log or b"")
+    now = _timestamp(at)
+    if not log:
+        return HEADER.pack(now) + RECORD.pack(pack_move(move), 0)
+
+    (latest,) = HEADER.unpack_from(log)
+    delta = min(max(now - latest, 0), MAX_DELTA) if now and latest else 0
+    return b"".join((HEADER.pack(now), log[HEADER.size:], RECORD.pack(pack_move(move), delta)))
+
+
+def encode(moves, times=None) -> bytes:
+    """
+    Log of a whole move list, times are the datetimes of the moves or None
+    """
+    moves = list(moves)
+    if not moves:
+        return b""
+
+    stamps = [_timestamp(at) for at in (times or [None] * len(moves))]
+    records = [
+        RECORD.pack(pack_move(move), min(max(stamp - previous, 0), MAX_DELTA) if stamp and previous else 0)
+        for move, previous, stamp in zip(moves, [0] + stamps, stamps)
+    ]
+    return HEADER.pack(stamps[-1]) + b"".join(records)
+
+
+def decode_moves(log) -> list:
+    if not log:
+        return []
+    return [unpack_move(value) for value, _ in RECORD.iter_unpack(memoryview(log)[HEADER.size:])]
+
+
+def decode_times(log) -> list:
+    """
+    Datetimes of the moves, restored backwards from the time of the latest move.
+    None for a log without times
+    """
+    if not log:
+        return []
+    (latest,) = HEADER.unpack_from(log)
+    deltas = [delta for _, delta in RECORD.iter_unpack(memoryview(log)[HEADER.size:])]
+    if not latest:
+        return [None] * len(deltas)
+
+    times = []
+    for delta in reversed(deltas):
+        times.append(datetime.fromtimestamp(latest / 1000, tz=timezone.utc))
+        latest -= delta
+    return times[::-1]
+
+
+def length(log) -> int:
+    return (len(log) - HEADER.size) // RECORD.size if log else 0
@@ -0,0 +1,213 @@
+"""
+Bulk PGN import
+
+Games are split from the file lazily, parsed and validated in worker processes
+and written in batches with bulk_create. Nothing is broadcast and ratings are not touched.
+Players are matched by username only on request, and imported games are unrated unless
+marked otherwise, so a PGN header cannot change a player's rating.
+"""
+import io
+import logging
+import re
+import time
+import uuid
+from datetime import datetime
+from multiprocessing import Pool
+
+import chess
+import chess.pgn
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import movelog, positions
+from .constants import PGN_IMPORT_BATCH_SIZE, PGN_IMPORT_CHUNK_SIZE
+from .models import Board, BoardPosition, Game, Result
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+RESULTS = {pgn_result: result for result, pgn_result in Result.PGN_RESULTS.items()}
+TAG_PAIR_REGEX = re.compile(r'^\[\w+\s+"')
+RESULT_TOKENS = set(Result.PGN_RESULTS.values()) | {"*"}
+TERMINATIONS = {termination.lower(): termination for termination, _ in Result.TERMINATION_CHOICES}
+
+
+def split_games(handle):
+    """
+    Yields the raw text of every game in a PGN file without parsing it.
+    A game starts at a tag pair after a blank line or a result token, so a comment
+    continuation such as "[%clk 0:01:00]}" stays in its game
+    """
+    lines = []
+    in_movetext = False
+    previous = ""
+
+    for line in handle:
+        is_tag_pair = TAG_PAIR_REGEX.match(line) is not None
+        if is_tag_pair and in_movetext and (not previous.strip() or previous.split()[-1] in RESULT_TOKENS):
+            yield "".join(lines)
+            lines, in_movetext = [], False
+        elif line.strip() and not is_tag_pair:
+            in_movetext = True
+        lines.append(line)
+        previous = line
+
+    if any(line.strip() for line in lines):
+        yield "".join(lines)
+
+
+def parse_game(text: str):
+    """
+    Validates the mainline of a game and returns plain data for the rows, runs in a worker process.
+    Games with illegal moves or a custom starting position are skipped (None)
+    """
+    game = chess.pgn.read_game(io.StringIO(text))
+    if game is None or game.errors or "FEN" in game.headers:
+        return None
+
+    chess_board = game.board()
+    tokens = []
+    keys = [positions.position_key(chess_board)]
+    for move in game.mainline_moves():
+        if chess_board.turn:
+            tokens.append(f"{chess_board.fullmove_number}.")
+        tokens.append(chess_board.san(move))
+        keys.append(positions.push(chess_board, move, keys[-1]))
+
+    return {
+        "headers": dict(game.headers),
+        "move_log": movelog.encode(chess_board.move_stack),
+        "positions": keys,
+        "movetext": " ".join(tokens),
+        "position": Board.position_data(chess_board),
+    }
+
+
+def parse_games(games, workers=None):
+    """
+    workers=0 parses in the current process
+    """
+    if workers == 0:
+        yield from map(parse_game, games)
+        return
+
+    with Pool(workers) as pool:
+        yield from pool.imap(parse_game, games, chunksize=PGN_IMPORT_CHUNK_SIZE)
+
+
+def _parse_date(value):
+    try:
+        return timezone.make_aware(datetime.strptime(value, "%Y.%m.%d"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _bulk_create(model, objects: list) -> list:
+    """
+    bulk_create fills primary keys only on backends returning them (PostgreSQL)
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects)
+
+    for obj in objects:
+        obj.save(force_insert=True)
+    return objects
+
+
+def save_games(parsed_games: list, match_players=False, rated=False) -> None:
+    """
+    Writes a batch of parsed games in one transaction.
+    With match_players players are matched by username, otherwise and for unknown players they are left empty
+    """
+    players = {}
+    if match_players:
+        usernames = {
+            data["headers"].get(color, "").strip() for data in parsed_games for color in ("White", "Black")
+        }
+        players = User.objects.filter(username__in=usernames).in_bulk(field_name="username")
+
+    results, boards, games = [], [], []
+    for data in parsed_games:
+        headers = data["headers"]
+        game_uuid = uuid.uuid4()
+        result = RESULTS.get(headers.get("Result"), Result.IN_PROGRESS)
+        termination = TERMINATIONS.get(headers.get("Termination", "").lower(), Result.NORMAL)
+        played_at = _parse_date(headers.get("Date"))
+
+        results.append(Result(
+            result=result,
+            termination=termination if result != Result.IN_PROGRESS else Result.UNTERMINATED,
+        ))
+        boards.append(Board(
+            game_uuid=game_uuid,
+            movetext=data["movetext"],
+            move_log=data["move_log"],
+            zobrist=data["positions"][-1],
+            **data["position"],
+        ))
+        games.append(Game(
+            uuid=game_uuid,
+            white_player=players.get(headers.get("White", "").strip()),
+            black_player=players.get(headers.get("Black", "").strip()),
+            started_at=played_at,
+            finished_at=played_at if result != Result.IN_PROGRESS else None,
+            broadcast_type=Game.NONE,
+            rated=rated,
+        ))
+
+    with transaction.atomic():
+        _bulk_create(Result, results)
+        _bulk_create(Board, boards)
+
+        for game, board, result in zip(games, boards, results):
+            game.board, game.result = board, result
+        Game.objects.bulk_create(games)
+
+        BoardPosition.objects.bulk_create(
+            (
+                BoardPosition(board=board, ply=ply, zobrist=zobrist)
+                for data, board in zip(parsed_games, boards)
+                for ply, zobrist in enumerate(data["positions"])
+            ),
+            batch_size=PGN_IMPORT_BATCH_SIZE,
+        )
+
+
+def import_pgn(path, batch_size=PGN_IMPORT_BATCH_SIZE, workers=None, progress=None,
+               match_players=False, rated=False) -> dict:
+    """
+    Imports every game of a PGN file, see save_games for match_players and rated.
+
+    progress(imported, skipped, seconds) is called after each batch
+    """
+    imported = skipped = 0
+    started = time.monotonic()
+    batch = []
+
+    def flush():
+        nonlocal imported
+        save_games(batch, match_players, rated)
+        imported += len(batch)
+        batch.clear()
+        if progress:
+            progress(imported, skipped, time.monotonic() - started)
+
+    with open(path, encoding="utf-8-sig", errors="replace") as handle:
+        for data in parse_games(split_games(handle), workers):
+            if data is None:
+                skipped += 1
+                continue
+
+            batch.append(data)
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+
+    seconds = time.monotonic() - started
+    logger.info("Imported %s games from %s in %.1fs, %s skipped", imported, path, seconds, skipped)
+
+    return {"imported": imported, "skipped": skipped, "seconds": seconds}
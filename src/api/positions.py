@@ -0,0 +1,80 @@
+"""
+Position keys
+
+A position is identified by its Polyglot Zobrist hash stored as a signed 64-bit integer.
+The key after a move is derived from the previous one: only the squares touched by the move
+and the castling, en passant and side to move components are hashed out and in again.
+"""
+import chess
+import chess.polyglot
+
+from . import movelog
+
+RANDOM_ARRAY = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+HASHER = chess.polyglot.ZobristHasher(RANDOM_ARRAY)
+
+
+def to_signed(zobrist_hash: int) -> int:
+    return zobrist_hash - (1 << 64) if zobrist_hash >= 1 << 63 else zobrist_hash
+
+
+def position_key(chess_board: chess.Board) -> int:
+    return to_signed(HASHER(chess_board))
+
+
+def fen_key(fen: str) -> int:
+    """
+    Raises ValueError for an invalid FEN
+    """
+    return position_key(chess.Board(fen))
+
+
+def _touched_squares(chess_board: chess.Board, move: chess.Move):
+    if chess_board.is_castling(move):
+        return chess.SquareSet(chess.BB_RANK_1 if chess_board.turn == chess.WHITE else chess.BB_RANK_8)
+    squares = [move.from_square, move.to_square]
+    if chess_board.is_en_passant(move):
+        squares.append(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+    return squares
+
+
+def _squares_hash(chess_board: chess.Board, squares) -> int:
+    zobrist_hash = 0
+    for square in squares:
+        piece = chess_board.piece_at(square)
+        if piece is not None:
+            zobrist_hash ^= RANDOM_ARRAY[64 * ((piece.piece_type - 1) * 2 + int(piece.color)) + square]
+    return zobrist_hash
+
+
+def _state_hash(chess_board: chess.Board) -> int:
+    return HASHER.hash_castling(chess_board) ^ HASHER.hash_ep_square(chess_board) ^ HASHER.hash_turn(chess_board)
+
+
+def push(chess_board: chess.Board, move: chess.Move, key: int) -> int:
+    """
+    Pushes the move onto the board and returns the key of the new position
+    """
+    squares = _touched_squares(chess_board, move)
+    zobrist_hash = (key % (1 << 64)) ^ _squares_hash(chess_board, squares) ^ _state_hash(chess_board)
+    chess_board.push(move)
+    return to_signed(zobrist_hash ^ _squares_hash(chess_board, squares) ^ _state_hash(chess_board))
+
+
+def replay(moves, chess_board=None) -> list:
+    """
+    Keys of the initial position and of the position after every move
+    """
+    chess_board = chess_board or chess.Board()
+    keys = [position_key(chess_board)]
+    for move in moves:
+        keys.append(push(chess_board, move, keys[-1]))
+    return keys
+
+
+def replay_log(item) -> tuple:
+    """
+    (board id, move log) -> (board id, keys), runs in a worker process
+    """
+    board_id, log = item
+    return board_id, replay(movelog.decode_moves(log))
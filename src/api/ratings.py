@@ -0,0 +1,141 @@
+"""
+Рейтинговые системы для рейтингов по категориям контроля времени
+
+Функции работают с идентификаторами игроков и не обращаются к БД.
+Партия передается как (белые, черные, очки белых)
+
+Glicko-2: http://www.glicko.net/glicko/glicko2.pdf
+"""
+import math
+from typing import NamedTuple
+
+
+class Rating(NamedTuple):
+    rating: float
+    deviation: float
+    volatility: float
+
+
+class RatingSystem:
+    """
+    Бэкенд рейтинга: rate - одна партия сразу после ее завершения,
+    rate_period - все партии рейтингового периода за один проход
+    """
+    name = None
+
+    def initial(self) -> Rating:
+        raise NotImplementedError
+
+    def rate(self, player: Rating, opponent: Rating, score: float) -> Rating:
+        return self.rate_period({1: player, 2: opponent}, [(1, 2, score)])[1]
+
+    def rate_period(self, ratings: dict, games: list) -> dict:
+        raise NotImplementedError
+
+
+class Glicko2(RatingSystem):
+    """
+    Все партии периода считаются по рейтингам на начало периода.
+    У игроков без партий в периоде растет только отклонение
+    """
+    name = "glicko2"
+
+    SCALE = 173.7178
+    BASE_RATING = 1500
+    EPSILON = 0.000001
+
+    def __init__(self, tau=0.5, rating=1500, deviation=350, volatility=0.06):
+        self.tau = tau
+        self.initial_rating = Rating(rating, deviation, volatility)
+
+    def initial(self) -> Rating:
+        return self.initial_rating
+
+    def _volatility(self, phi: float, sigma: float, v: float, delta: float) -> float:
+        """
+        Новая волатильность, шаг 5 (метод Иллинойса)
+        """
+        a = math.log(sigma ** 2)
+        tau = self.tau
+
+        def f(x):
+            ex = math.exp(x)
+            return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / tau ** 2
+
+        A = a
+        if delta ** 2 > phi ** 2 + v:
+            B = math.log(delta ** 2 - phi ** 2 - v)
+        else:
+            k = 1
+            while f(a - k * tau) < 0:
+                k += 1
+            B = a - k * tau
+
+        f_A, f_B = f(A), f(B)
+        while abs(B - A) > self.EPSILON:
+            C = A + (A - B) * f_A / (f_B - f_A)
+            f_C = f(C)
+            if f_C * f_B <= 0:
+                A, f_A = B, f_B
+            else:
+                f_A /= 2
+            B, f_B = C, f_C
+
+        return math.exp(A / 2)
+
+    def rate_period(self, ratings: dict, games: list) -> dict:
+        """
+        ratings: {игрок: Rating}, отсутствующие игроки получают начальный рейтинг
+        Возвращает новые рейтинги всех игроков из ratings и из партий
+        """
+        players = list(ratings)
+        index = {player_id: i for i, player_id in enumerate(players)}
+        for white, black, _ in games:
+            for player_id in (white, black):
+                if player_id not in index:
+                    index[player_id] = len(players)
+                    players.append(player_id)
+
+        # шкала Glicko-2 и g(phi) считаются один раз на игрока
+        initial = self.initial()
+        mu, phi, sigma, g = [], [], [], []
+        for player_id in players:
+            rating = ratings.get(player_id, initial)
+            mu.append((rating.rating - self.BASE_RATING) / self.SCALE)
+            phi.append(rating.deviation / self.SCALE)
+            sigma.append(rating.volatility)
+            g.append(1 / math.sqrt(1 + 3 * phi[-1] ** 2 / math.pi ** 2))
+
+        # накопленные суммы шагов 3 и 4
+        v_inverse = [0.0] * len(players)
+        improvement = [0.0] * len(players)
+        for white, black, white_score in games:
+            i, j = index[white], index[black]
+            for player, opponent, score in ((i, j, white_score), (j, i, 1 - white_score)):
+                g_opponent = g[opponent]
+                expected = 1 / (1 + math.exp(-g_opponent * (mu[player] - mu[opponent])))
+                v_inverse[player] += g_opponent ** 2 * expected * (1 - expected)
+                improvement[player] += g_opponent * (score - expected)
+
+        result = {}
+        for i, player_id in enumerate(players):
+            if not v_inverse[i]:
+                deviation = min(math.sqrt(phi[i] ** 2 + sigma[i] ** 2) * self.SCALE, initial.deviation)
+                result[player_id] = Rating(mu[i] * self.SCALE + self.BASE_RATING, deviation, sigma[i])
+                continue
+
+            v = 1 / v_inverse[i]
+            new_sigma = self._volatility(phi[i], sigma[i], v, v * improvement[i])
+            phi_star = math.sqrt(phi[i] ** 2 + new_sigma ** 2)
+            new_phi = 1 / math.sqrt(1 / phi_star ** 2 + 1 / v)
+            new_mu = mu[i] + new_phi ** 2 * improvement[i]
+            result[player_id] = Rating(new_mu * self.SCALE + self.BASE_RATING, new_phi * self.SCALE, new_sigma)
+
+        return result
+
+
+RATING_SYSTEMS = {system.name: system for system in (Glicko2,)}
+
+
+def get_rating_system(name: str) -> RatingSystem:
+    return RATING_SYSTEMS[name]()
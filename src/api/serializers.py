@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 
+import chess
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
@@ -11,8 +12,17 @@ from rest_framework_simplejwt.token_blacklist.models import (
 from six import text_type
 
 from core.files.serializers import ImageSerializer
+from core.tournament.models import TimeControlType
 from . import services
-from .models import Board, Elo, Game, Result, Move
+from .constants import (
+    ANALYSIS_DEPTH,
+    ANALYSIS_MAX_DEPTH,
+    LEADERBOARD_AROUND_SIZE,
+    LEADERBOARD_MAX_PAGE_SIZE,
+    LEADERBOARD_PAGE_SIZE,
+)
+from .leaderboard import ELO_CATEGORY
+from .models import Board, Elo, Game, PlayerRating, Result, Move
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 
@@ -32,6 +42,32 @@ class EloSerializer(serializers.ModelSerializer):
         )
 
 
+class PlayerRatingSerializer(serializers.ModelSerializer):
+    time_control_type_name = serializers.CharField(source="time_control_type.name", read_only=True)
+
+    class Meta:
+        model = PlayerRating
+        fields = (
+            "time_control_type",
+            "time_control_type_name",
+            "system",
+            "rating",
+            "deviation",
+            "volatility",
+            "games",
+        )
+
+
+class EloRatingsSerializer(EloSerializer):
+    """
+    Elo вместе с рейтингами игрока по категориям контроля времени
+    """
+    ratings = PlayerRatingSerializer(source="player.ratings", many=True, read_only=True)
+
+    class Meta(EloSerializer.Meta):
+        fields = EloSerializer.Meta.fields + ("ratings",)
+
+
 class UserEloSerializer(serializers.ModelSerializer):
     elo = EloSerializer()
     id = serializers.IntegerField()
@@ -59,6 +95,7 @@ class BoardSerializer(serializers.ModelSerializer):
             "board_fen_flipped",
             "updated_at",
             "game_uuid",
+            "ply",
         )
 
 
@@ -124,8 +161,7 @@ class GameSerializer(serializers.ModelSerializer):
     #     return getattr(game, f'{user_color}_player_broadcast_board')
 
     def get_pgn(self, obj):
-        from .services import get_pgn_game_from_uuid
-        return str(get_pgn_game_from_uuid(obj.uuid))
+        return obj.pgn if obj.board else ''
 
     def create(self, validated_data):
         result_data = validated_data.pop("result", {})
@@ -193,6 +229,10 @@ class GameJoinSerializer(serializers.Serializer):
     preferred_color = serializers.ChoiceField(choices=(('white', 'Белый'), ('black', 'Черный')))
 
 
+class GameSeekSerializer(serializers.Serializer):
+    time_control_type = serializers.PrimaryKeyRelatedField(queryset=TimeControlType.objects.all())
+
+
 class GameMoveSerializer(serializers.Serializer):
     from_square = serializers.CharField()
     to_square = serializers.CharField()
@@ -202,6 +242,95 @@ class GamePgnSerializer(serializers.Serializer):
     results = serializers.CharField()
 
 
+class PositionQuerySerializer(serializers.Serializer):
+    fen = serializers.CharField()
+
+    def validate_fen(self, value):
+        try:
+            chess.Board(value)
+        except ValueError:
+            raise serializers.ValidationError("Invalid FEN.")
+        return value
+
+
+class ExplorerMoveSerializer(serializers.Serializer):
+    """
+    white, draws, black - проценты партий
+    """
+    uci = serializers.CharField()
+    san = serializers.CharField()
+    games = serializers.IntegerField()
+    white = serializers.FloatField()
+    draws = serializers.FloatField()
+    black = serializers.FloatField()
+    average_rating = serializers.IntegerField(allow_null=True)
+
+
+class ExplorerSerializer(serializers.Serializer):
+    fen = serializers.CharField()
+    games = serializers.IntegerField()
+    moves = ExplorerMoveSerializer(many=True)
+
+
+class AnalysisQuerySerializer(serializers.Serializer):
+    depth = serializers.IntegerField(default=ANALYSIS_DEPTH, min_value=1, max_value=ANALYSIS_MAX_DEPTH)
+
+
+class EvaluationSerializer(serializers.Serializer):
+    """
+    Оценка со стороны белых, мат тоже переводится в сантипешки
+    """
+    depth = serializers.IntegerField()
+    cp = serializers.IntegerField()
+    mate = serializers.IntegerField(allow_null=True)
+    best = serializers.CharField(allow_null=True)
+    pv = serializers.ListField(child=serializers.CharField())
+
+
+class AnalysisPositionSerializer(serializers.Serializer):
+    ply = serializers.IntegerField()
+    fen = serializers.CharField()
+    san = serializers.CharField(allow_null=True)
+    eval = EvaluationSerializer(allow_null=True)
+
+
+class GameAnalysisSerializer(serializers.Serializer):
+    depth = serializers.IntegerField()
+    complete = serializers.BooleanField()
+    pending = serializers.IntegerField()
+    positions = AnalysisPositionSerializer(many=True)
+
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    """
+    category: "elo" или id типа контроля времени
+    """
+    category = serializers.CharField(default=ELO_CATEGORY)
+    limit = serializers.IntegerField(default=LEADERBOARD_PAGE_SIZE, min_value=1, max_value=LEADERBOARD_MAX_PAGE_SIZE)
+    offset = serializers.IntegerField(default=0, min_value=0)
+    size = serializers.IntegerField(default=LEADERBOARD_AROUND_SIZE, min_value=0, max_value=LEADERBOARD_MAX_PAGE_SIZE)
+
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    player = serializers.IntegerField()
+    username = serializers.CharField()
+    rating = serializers.IntegerField()
+
+
+class LeaderboardSerializer(serializers.Serializer):
+    category = serializers.CharField()
+    count = serializers.IntegerField()
+    results = LeaderboardEntrySerializer(many=True)
+
+
+class LeaderboardPositionSerializer(serializers.Serializer):
+    category = serializers.CharField()
+    rank = serializers.IntegerField(allow_null=True)
+    rating = serializers.IntegerField(allow_null=True)
+    around = LeaderboardEntrySerializer(many=True)
+
+
 class TokenCreateSerializer(serializers.Serializer):
     refresh = serializers.CharField()
     access = serializers.CharField()
@@ -1,17 +1,51 @@
+import logging
+import os
 import random
+import time
 import uuid
-from datetime import datetime
+from collections import defaultdict
+from datetime import timedelta
+from multiprocessing import Pool
 
 import chess
-from chess.pgn import Game as ChessGame
+import chess.pgn
 from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-from stream_app.services import send_game_data_to_group
-from .broadcast.services import create_session, create_rooms_for_user
-from .constants import K_FACTOR
-from .models import Board, Game, Move, Result
+from core.utils.tasks import enqueue_on_commit
+from stream_app.services import get_eval_event, get_move_event, send_eval_to_group, send_game_data_to_group, \
+    send_match_to_players
+from .analysis import review
+from .analysis.cache import get_eval_cache
+from .analysis.jobs import LIVE, REVIEW, Job, get_analysis_queue
+from .board_cache import live_boards
+from .explorer import get_opening_explorer
+from .leaderboard import ELO_CATEGORY, get_leaderboard
+from .matchmaking import CANCEL, SEEK, get_seek_queue
+from .clocks import get_clock_store
+from .broadcast.exceptions import BroadcastApiError
+from .broadcast.pool import Room, get_room_pool
+from . import explorer, movelog, positions, tasks
+from .broadcast.services import BOARD, CAMERA, create_rooms, create_session
+from .constants import (
+    ANALYSIS_DEPTH,
+    ANALYSIS_LIVE_DEPTH,
+    K_FACTOR,
+    OPENING_EXPLORER_BATCH_SIZE,
+    OPENING_EXPLORER_CATCH_UP,
+    PGN_EXPORT_CHUNK_SIZE,
+    POSITION_INDEX_BATCH_SIZE,
+    RATING_BATCH_SIZE,
+    RATING_SYSTEM,
+)
+from .models import Board, BoardPosition, Elo, Game, GameAnalysis, PlayerRating, RatingHistory, Result
+from .ratings import Rating, get_rating_system
 from .serializers import GameSerializer
 from django.contrib import auth
 
@@ -23,25 +57,23 @@ RESULTS_DICT = {
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 
 # Game
 
 
-def is_game_over(game_instance):
+def broadcast_on_commit(game_uuid, game_data=None, move_data=None) -> None:
     """
-    Update the game if it is over
-    Return True if the game is over, False if it is not
+    Рассылка партии после фиксации транзакции (с ATOMIC_REQUESTS - всего запроса):
+    до фиксации ни подписчики, ни кэш сообщения партии не видят новое состояние.
+    Без game_data партия сериализуется в момент рассылки
     """
+    def send():
+        data = game_data if game_data is not None else get_game_data(game_uuid)
+        async_to_sync(send_game_data_to_group)(game_uuid, data, move_data)
 
-    chess_board = chess_board_from_uuid(game_instance.uuid)
-
-    return chess_board.is_game_over()
-
-
-def check_threefold_repetition(game_instance):
-    chess_board = chess_board_from_uuid(game_instance.uuid)
-
-    return chess_board.can_claim_threefold_repetition()
+    transaction.on_commit(send)
 
 
 def create_game(result_data=None, board_data=None, **validated_data):
@@ -55,20 +87,22 @@ def create_game(result_data=None, board_data=None, **validated_data):
     game = Game.objects.create(
         result=result_object, board=board_object, uuid=game_uuid, **validated_data
     )
-    game_data = get_game_data(game_uuid)
-    async_to_sync(send_game_data_to_group)(game_uuid, game_data)
+    broadcast_on_commit(game_uuid)
     return game
 
 
 def create_board(game_uuid, data=None):
     chess_game = chess.Board()
+    zobrist = positions.position_key(chess_game)
 
     board_object = Board.objects.create(
         **data,
         fen=chess.STARTING_FEN,
         castling_rights=chess_game.castling_rights,
         game_uuid=game_uuid,
+        zobrist=zobrist,
     )
+    BoardPosition.objects.create(board=board_object, ply=0, zobrist=zobrist)
     return board_object
 
 
@@ -76,19 +110,101 @@ def create_result(data=None):
     return Result.objects.create(**data)
 
 
-def draw_game(game_instance):
+def draw_game(game_instance, broadcast=True):
     game_instance.result = Result(
         result=Result.DRAW, termination=Result.NORMAL
     )
-    __finish_game(game_instance)
+    __finish_game(game_instance, broadcast)
 
 
-def finish_game(game_instance, chess_board):
+def finish_game(game_instance, chess_board, broadcast=True):
     result_string = chess_board.result()
     game_instance.result = Result(
         result=RESULTS_DICT.get(result_string), termination=Result.NORMAL
     )
-    __finish_game(game_instance)
+    __finish_game(game_instance, broadcast)
+
+
+def time_forfeit_game(game_instance: Game, color: str, chess_board=None, broadcast=True) -> None:
+    """
+    Поражение по времени. Если у соперника недостаточно материала для мата - ничья
+    """
+    opponent_color = chess.BLACK if color == 'white' else chess.WHITE
+    if chess_board is not None and chess_board.has_insufficient_material(opponent_color):
+        result = Result.DRAW
+    else:
+        result = Result.BLACK_WINS if color == 'white' else Result.WHITE_WINS
+
+    game_instance.result = Result(
+        result=result, termination=Result.TIME_FORFEIT
+    )
+    __finish_game(game_instance, broadcast)
+
+
+def check_flag_fall(game_instance: Game, chess_board=None, at=None, broadcast=True) -> bool:
+    """
+    Завершает партию, если у игрока истекло время
+    """
+    color = game_instance.flag_fallen_color(at)
+    if color is None:
+        return False
+
+    time_forfeit_game(game_instance, color, chess_board, broadcast)
+    schedule_rating_update(game_instance)
+    return True
+
+
+def schedule_flag_fall(game_instance: Game) -> None:
+    """
+    Передает планировщику часов момент падения флага партии
+    """
+    deadline = game_instance.flag_deadline()
+    if deadline is None:
+        get_clock_store().cancel(game_instance.uuid)
+    else:
+        get_clock_store().schedule(game_instance.uuid, deadline.timestamp())
+
+
+def schedule_unfinished_games() -> int:
+    """
+    Заново планирует часы всех идущих партий, например после перезапуска Redis
+    """
+    games = Game.objects.filter(
+        started_at__isnull=False,
+        finished_at__isnull=True,
+        time_control_type__time__isnull=False,
+    ).select_related("board", "time_control_type")
+
+    amount = 0
+    for game in games.iterator():
+        schedule_flag_fall(game)
+        amount += 1
+    return amount
+
+
+def finish_game_on_time(game_uuid) -> bool:
+    """
+    Вызывается планировщиком часов, когда у игрока должно было истечь время
+    """
+    with transaction.atomic():
+        game = (
+            Game.objects.select_for_update(of=("self",))
+            .with_related()
+            .filter(uuid=game_uuid, board__isnull=False)
+            .first()
+        )
+        if game is None:
+            return False
+
+        chess_board = chess_board_from_board(game.board)
+        if not check_flag_fall(game, chess_board, broadcast=False):
+            # партия уже закончилась или часы переключились, планируем заново
+            schedule_flag_fall(game)
+            return False
+
+        broadcast_on_commit(game_uuid, GameSerializer(game).data)
+
+    return True
 
 
 def capitulate_game(game: Game, capitulated_user: User) -> None:
@@ -115,8 +231,7 @@ def claim_draw(game: Game, claim_user: User):
     can_claim = getattr(game, f'{color}_player_can_claim_draw')
     if can_claim:
         game.set_claim_draw(color, False)
-        game_data = get_game_data(game.uuid)
-        async_to_sync(send_game_data_to_group)(game.uuid, game_data)
+        broadcast_on_commit(game.uuid)
         return True
     return False
 
@@ -130,17 +245,25 @@ def agree_to_draw(game: Game, agree_user: User):
     is_claim = getattr(game, f'{opposite_color}_player_can_claim_draw')
     if not is_claim:
         draw_game(game)
-        update_elo(game)
+        schedule_rating_update(game)
         return True
     return False
 
 
-def __finish_game(game_instance: Game) -> None:
+def __finish_game(game_instance: Game, broadcast=True) -> None:
     game_instance.finished_at = timezone.now()
+    for color in ("white", "black"):
+        if getattr(game_instance, f"{color}_player_points") is None:
+            setattr(game_instance, f"{color}_player_points", game_instance.result.points(color))
     game_instance.result.save()
     game_instance.save()
-    game_data = get_game_data(game_instance.uuid)
-    async_to_sync(send_game_data_to_group)(game_instance.uuid, game_data)
+    # after the board of the last move has been stored
+    transaction.on_commit(lambda: live_boards.delete(game_instance.uuid))
+    get_clock_store().cancel(game_instance.uuid)
+    release_broadcast(game_instance)
+    enqueue_on_commit(tasks.update_opening_explorer, str(game_instance.uuid))
+    if broadcast:
+        broadcast_on_commit(game_instance.uuid)
 
 
 def assign_color(game_instance, username, preferred_color="white"):
@@ -167,9 +290,8 @@ def assign_color(game_instance, username, preferred_color="white"):
         game_instance.white_player = auth_user
 
     game_instance.save()
-    game_data = get_game_data(game_instance.uuid)
-    async_to_sync(send_game_data_to_group)(game_instance.uuid, game_data)
-    create_broadcast_for_game(game_instance)
+    schedule_broadcast(game_instance)
+    broadcast_on_commit(game_instance.uuid)
     return player_color
 
 
@@ -179,62 +301,166 @@ def assign_color(game_instance, username, preferred_color="white"):
 def move_piece(board_instance, from_square, to_square, user, chess_board=None):
     """
     Make a move if it is legal, and check if the game is over
+
+    Moves of a game go through commit_move, a board without a game (e.g. a PGN import)
+    only gets its move stack updated
     """
+    try:
+        game_uuid = board_instance.game.uuid
+    except Game.DoesNotExist:
+        game_uuid = None
+
+    if game_uuid:
+        requested_move, _ = commit_move(game_uuid, from_square, to_square, user)
+        return requested_move
+
     if not chess_board:
         chess_board = chess_board_from_uuid(board_instance.game_uuid)
 
     requested_move = chess.Move.from_uci(f"{from_square}{to_square}")
 
     if requested_move in chess_board.legal_moves:
-        chess_board.push(requested_move)
-        if not is_exist_move(board_instance.game_uuid):
-            start_game(board_instance.game_uuid)
-        Move.objects.create(from_square=from_square, to_square=to_square, board=board_instance, user=user)
+        san = chess_board.san(requested_move)
+        push_move(board_instance, chess_board, requested_move, timezone.now())
+        board_instance.add_san(san)
         board_instance.update(chess_board)
-
-        if hasattr(board_instance, "game"):
-            if check_threefold_repetition(board_instance.game):
-                draw_game(board_instance.game)
-                update_elo(board_instance.game)
-            if is_game_over(board_instance.game):
-                finish_game(board_instance.game, chess_board)
-                update_elo(board_instance.game)
-        game_data = get_game_data(board_instance.game_uuid)
-        async_to_sync(send_game_data_to_group)(board_instance.game_uuid, game_data)
+        live_boards.set_on_commit(board_instance.game_uuid, chess_board, movelog.length(board_instance.move_log))
 
         return requested_move
 
     return None
 
 
-def start_game(game_uuid: int) -> None:
-    try:
-        game = Game.objects.get(uuid=game_uuid)
-        game.started_at = datetime.now()
-        game.result = create_result(dict(
-            result=Result.IN_PROGRESS, termination=Result.UNTERMINATED
-        ))
-        game.save()
-    except Game.DoesNotExist:
-        pass
+def push_move(board_instance, chess_board, move, moved_at=None) -> None:
+    """
+    Pushes a legal move onto the board, appends it to the move log and indexes the new position.
+    The position key is updated from the previous one
+    """
+    zobrist = board_instance.zobrist
+    if zobrist is None:
+        zobrist = positions.position_key(chess_board)
+    board_instance.zobrist = positions.push(chess_board, move, zobrist)
+    board_instance.add_move(move, moved_at)
+    BoardPosition.objects.create(
+        board=board_instance, ply=movelog.length(board_instance.move_log), zobrist=board_instance.zobrist
+    )
+
+
+def is_threefold_repetition(board_instance, zobrist, ply, halfmove_clock) -> bool:
+    """
+    The position has occurred three times. Only plies with the same side to move
+    since the last capture or pawn move can repeat it
+    """
+    if halfmove_clock < 8:
+        return False
+    return BoardPosition.objects.filter(
+        board=board_instance, zobrist=zobrist, ply__gte=ply - halfmove_clock, ply__lte=ply
+    ).count() >= 3
+
+
+def commit_move(game_uuid, from_square, to_square, user):
+    """
+    Make a move in a single pass: the game row is locked, the board is built once,
+    and the game is serialized once for both the WebSocket group and the HTTP response
+
+    Returns the move and the serialized game, or (None, None) if the move is not legal.
+    If the player's flag has fallen the game is finished on time and the move is None
+    """
+    requested_move = chess.Move.from_uci(f"{from_square}{to_square}")
+
+    with transaction.atomic():
+        game = Game.objects.select_for_update(of=("self",)).with_related().get(uuid=game_uuid)
+        board_instance = game.board
+        chess_board = chess_board_from_board(board_instance)
+        moved_at = timezone.now()
 
+        move_data = None
 
-def is_exist_move(game_uuid) -> bool:
+        if check_flag_fall(game, chess_board, at=moved_at, broadcast=False):
+            requested_move = None
+
+        elif requested_move not in chess_board.legal_moves:
+            return None, None
+
+        else:
+            color = "white" if chess_board.turn else "black"
+            is_first_move = not board_instance.move_log
+            san = chess_board.san(requested_move)
+            push_move(board_instance, chess_board, requested_move, moved_at)
+            if is_first_move:
+                _start_game(game, moved_at)
+            record_move_time(game, color, moved_at)
+            board_instance.add_san(san)
+            board_instance.update(chess_board)
+            live_boards.set_on_commit(game_uuid, chess_board, movelog.length(board_instance.move_log))
+
+            if is_threefold_repetition(
+                board_instance, board_instance.zobrist, movelog.length(board_instance.move_log),
+                chess_board.halfmove_clock,
+            ):
+                draw_game(game, broadcast=False)
+                schedule_rating_update(game)
+            elif chess_board.is_game_over():
+                finish_game(game, chess_board, broadcast=False)
+                schedule_rating_update(game)
+            else:
+                game.save()
+                request_live_eval(game_uuid, chess_board.fen())
+
+            move_data = get_move_event(game, requested_move.uci(), san)
+
+        game_data = GameSerializer(game).data
+
+        transaction.on_commit(lambda: schedule_flag_fall(game))
+        broadcast_on_commit(game_uuid, game_data, move_data)
+
+    return requested_move, game_data
+
+
+def _start_game(game: Game, started_at=None) -> None:
+    game.started_at = started_at or timezone.now()
+    game.last_move_at = game.started_at
+    game.result = create_result(dict(
+        result=Result.IN_PROGRESS, termination=Result.UNTERMINATED
+    ))
+
+
+def record_move_time(game: Game, color: str, moved_at) -> None:
     """
-    Проверка на наличие хода
+    Учет времени хода на часах игрока, без пересчета всех ходов.
+    Время считается с точностью до миллисекунды, быстрые ходы тоже расходуют время
     """
-    return Move.objects.filter(board__game_uuid=game_uuid).exists()
+    clock_started_at = game.last_move_at or game.started_at
+    if clock_started_at is not None:
+        time_spent_field = f'{color}_player_time_spent'
+        elapsed = round((moved_at - clock_started_at).total_seconds(), 3)
+        setattr(game, time_spent_field, (getattr(game, time_spent_field) or 0) + elapsed)
+    game.last_move_at = moved_at
 
 
 def chess_board_from_uuid(board_uuid):
     """
     It's safe to set turn, castling_rights, ep_square, halfmove_clock and fullmove_number directly.
 
+    Live games are served from the board cache, the move stack is only replayed on a miss.
+
     https://python-chess.readthedocs.io/en/latest/core.html#chess.Board
     """
     board = Board.objects.get(game_uuid=board_uuid)
 
-    chess_board = chess.Board()
+    return chess_board_from_board(board)
+
+
+def chess_board_from_board(board):
+    """
+    Same as chess_board_from_uuid for an already loaded Board instance
+    """
+    ply = movelog.length(board.move_log)
+    chess_board = live_boards.get(board.game_uuid, fen=board.fen, ply=ply)
+    if chess_board is not None:
+        return chess_board
+
+    chess_board = chess.Board(board.starting_fen or chess.STARTING_FEN)
     for move in board.move_stack:
         chess_board.push(move)
     chess_board.ep_square = int(board.ep_square) if board.ep_square else None
@@ -242,25 +468,309 @@ def chess_board_from_uuid(board_uuid):
     chess_board.castling_rights = int(board.castling_rights)
     chess_board.fullmove_number = board.fullmove_number
     chess_board.halfmove_clock = board.halfmove_clock
+    live_boards.set(board.game_uuid, chess_board, ply)
 
     return chess_board
 
 
-def get_pgn_game_from_uuid(board_uuid):
+def index_positions(batch_size=POSITION_INDEX_BATCH_SIZE, workers=None, progress=None) -> int:
+    """
+    Индексирует позиции досок, сохраненных до появления индекса. Журналы ходов переигрываются
+    в рабочих процессах (workers=0 - в текущем), строки пишутся порциями.
+    progress(indexed) вызывается после каждой порции
+    """
+    boards = Board.objects.filter(zobrist__isnull=True).order_by("pk").values_list("pk", "move_log")
+    pool = Pool(workers) if workers != 0 else None
+    indexed, last_pk = 0, 0
     try:
-        board = Board.objects.get(game_uuid=board_uuid)
-        chess_board = chess.Board()
-        for move in board.move_stack:
-            chess_board.push(move)
-        chess_board.ep_square = int(board.ep_square) if board.ep_square else None
-        chess_board.turn = board.turn
-        chess_board.castling_rights = int(board.castling_rights)
-        chess_board.fullmove_number = board.fullmove_number
-        chess_board.halfmove_clock = board.halfmove_clock
+        while True:
+            batch = [(pk, bytes(move_log)) for pk, move_log in boards.filter(pk__gt=last_pk)[:batch_size]]
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            replayed = pool.map(positions.replay_log, batch) if pool else list(map(positions.replay_log, batch))
+
+            with transaction.atomic():
+                BoardPosition.objects.bulk_create(
+                    (
+                        BoardPosition(board_id=board_id, ply=ply, zobrist=zobrist)
+                        for board_id, keys in replayed
+                        for ply, zobrist in enumerate(keys)
+                    ),
+                    batch_size=batch_size,
+                    ignore_conflicts=True,
+                )
+                Board.objects.bulk_update(
+                    [Board(pk=board_id, zobrist=keys[-1]) for board_id, keys in replayed], ["zobrist"]
+                )
+
+            indexed += len(batch)
+            if progress:
+                progress(indexed)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return indexed
+
+
+def find_games_by_fen(fen: str, games=None):
+    """
+    Партии, в которых встречалась позиция. Поиск по индексу ключей позиций
+    """
+    games = Game.objects.all() if games is None else games
+    return games.filter(
+        board__in=BoardPosition.objects.filter(zobrist=positions.fen_key(fen)).values("board")
+    )
+
+
+# Opening explorer
+
+
+EXPLORER_OUTCOMES = {
+    Result.WHITE_WINS: explorer.WHITE,
+    Result.DRAW: explorer.DRAW,
+    Result.BLACK_WINS: explorer.BLACK,
+}
+
+
+def _ratings_before(game_ids) -> dict:
+    """
+    {(game, player): рейтинг игрока перед партией} по истории рейтингов
+    """
+    return {
+        (game_id, player_id): rating - delta
+        for game_id, player_id, rating, delta in RatingHistory.objects.filter(
+            game__in=game_ids
+        ).values_list("game", "player", "rating", "delta")
+    }
+
+
+def update_opening_explorer(game_uuid) -> bool:
+    """
+    Добавляет закончившуюся партию в дерево дебютов, каждая партия учитывается один раз.
+    Рейтинг игрока - рейтинг перед партией, если он уже пересчитан, иначе текущий
+    """
+    game = Game.objects.select_related(
+        "board", "result", "white_player__elo", "black_player__elo"
+    ).filter(uuid=game_uuid).first()
+    if game is None or game.board is None or game.result.result not in EXPLORER_OUTCOMES:
+        return False
+
+    entries = explorer.game_entries(game.board.move_log)
+    if not entries:
+        return False
+
+    before = _ratings_before([game.pk])
+    ratings = {
+        is_white: before.get((game.pk, player.pk), player.elo.rating) if player else None
+        for is_white, player in ((True, game.white_player), (False, game.black_player))
+    }
+    return get_opening_explorer().add_game(game.pk, entries, EXPLORER_OUTCOMES[game.result.result], ratings)
+
+
+def _explorer_batches(batch_size):
+    games = (
+        Game.objects.filter(result__result__in=EXPLORER_OUTCOMES, board__isnull=False)
+        .order_by("pk")
+        .values_list(
+            "pk", "board__move_log", "result__result",
+            "white_player", "black_player", "white_player__elo__rating", "black_player__elo__rating",
+        )
+    )
+    batch = []
+    for row in games.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _explorer_rows(batch) -> list:
+    before = _ratings_before([row[0] for row in batch])
+    return [
+        (
+            bytes(move_log),
+            EXPLORER_OUTCOMES[result],
+            before.get((game_id, white_id), white_rating) if white_id else None,
+            before.get((game_id, black_id), black_rating) if black_id else None,
+        )
+        for game_id, move_log, result, white_id, black_id, white_rating, black_rating in batch
+    ]
+
+
+def rebuild_opening_explorer(batch_size=OPENING_EXPLORER_BATCH_SIZE, workers=None, progress=None) -> int:
+    """
+    Дерево дебютов заново по всем законченным партиям: партии считаются порциями
+    в рабочих процессах (workers=0 - в текущем), счетчики складываются и заменяют дерево целиком.
+    Партии, законченные во время пересчета, могли попасть только в старое дерево -
+    после замены они добавляются еще раз (повторно партия не учитывается).
+    progress(games) вызывается после каждой порции
+    """
+    started = timezone.now() - timedelta(seconds=OPENING_EXPLORER_CATCH_UP)
+    game_ids, stats, pending = [], {}, []
+    processes = workers or os.cpu_count() or 1
+    pool = Pool(processes) if workers != 0 else None
+
+    def reduce():
+        counted = pool.map(explorer.count_games, pending) if pool else map(explorer.count_games, pending)
+        for batch_stats in counted:
+            explorer.merge(stats, batch_stats)
+        pending.clear()
+        if progress:
+            progress(len(game_ids))
+
+    try:
+        for batch in _explorer_batches(batch_size):
+            game_ids.extend(row[0] for row in batch)
+            pending.append(_explorer_rows(batch))
+            if len(pending) >= processes:
+                reduce()
+        if pending:
+            reduce()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    get_opening_explorer().replace(stats, game_ids)
+    for game_uuid in Game.objects.filter(finished_at__gte=started).values_list("uuid", flat=True):
+        update_opening_explorer(game_uuid)
+    return len(game_ids)
+
+
+def get_explorer_moves(fen: str) -> list:
+    """
+    Следующие ходы позиции по дереву дебютов, самые частые первыми
+    """
+    chess_board = chess.Board(fen)
+    moves = []
+    for packed_move, (white, draws, black, rating_sum, rated) in get_opening_explorer().moves(
+        positions.position_key(chess_board)
+    ).items():
+        move = movelog.unpack_move(packed_move)
+        games = white + draws + black
+        if not games or not chess_board.is_legal(move):
+            continue
+        moves.append({
+            "uci": move.uci(),
+            "san": chess_board.san(move),
+            "games": games,
+            "white": round(100 * white / games, 1),
+            "draws": round(100 * draws / games, 1),
+            "black": round(100 * black / games, 1),
+            "average_rating": round(rating_sum / rated) if rated else None,
+        })
+    return sorted(moves, key=lambda entry: -entry["games"])
+
+
+# Engine analysis
+
+
+def request_live_eval(game_uuid, fen: str) -> None:
+    """
+    Оценка новой позиции для шкалы оценки, в очередь после коммита хода
+    """
+    transaction.on_commit(
+        lambda: get_analysis_queue().push(Job(fen, ANALYSIS_LIVE_DEPTH, LIVE, game=str(game_uuid)))
+    )
+
+
+def send_live_eval(job: Job, evaluation: dict) -> None:
+    starting_fen = Board.objects.filter(game_uuid=job.game).values_list("starting_fen", flat=True).first()
+    async_to_sync(send_eval_to_group)(
+        job.game, get_eval_event(job.fen, evaluation, starting_fen or chess.STARTING_FEN)
+    )
+
+
+def get_game_analysis(game: Game, depth=ANALYSIS_DEPTH) -> dict:
+    """
+    Оценки всех позиций партии из кэша, недостающие ставятся в очередь разбора.
+    complete - все позиции оценены, pending - сколько еще ждут движка
+    """
+    starting_fen = game.board.starting_fen if game.board else ""
+    chess_board = chess.Board(starting_fen or chess.STARTING_FEN)
+    fens, sans, keys = [chess_board.fen()], [None], [positions.position_key(chess_board)]
+    for move in game.board.move_stack if game.board else []:
+        sans.append(chess_board.san(move))
+        keys.append(positions.push(chess_board, move, keys[-1]))
+        fens.append(chess_board.fen())
+
+    evaluations = get_eval_cache().get_many(set(keys), depth)
+    missing = {key: fen for key, fen in zip(keys, fens) if key not in evaluations}
+    analysis_queue = get_analysis_queue()
+    for fen in missing.values():
+        analysis_queue.push(Job(fen, depth, REVIEW))
+
+    return {
+        "depth": depth,
+        "complete": not missing,
+        "pending": len(missing),
+        "positions": [
+            {"ply": ply, "fen": fen, "san": san, "eval": evaluations.get(key)}
+            for ply, (fen, san, key) in enumerate(zip(fens, sans, keys))
+        ],
+    }
 
-        return ChessGame.from_board(chess_board)
-    except Board.DoesNotExist:
-        return ''
+
+def _save_game_analysis(game_id, depth: int, pgn: str, stats: dict) -> None:
+    fields = {"depth": depth, "pgn": pgn}
+    for color, color_stats in stats.items():
+        fields.update({f"{color}_{name}": value for name, value in color_stats.items()})
+    GameAnalysis.objects.update_or_create(game_id=game_id, defaults=fields)
+
+
+def analyse_games(games, depth=ANALYSIS_DEPTH, workers=None, event="?", progress=None) -> int:
+    """
+    Разбор законченных партий: партии разбираются в рабочих процессах (workers=0 - в текущем),
+    у каждого процесса свой движок, оценки позиций общие через кэш оценок.
+    Разбор партии сохраняется сразу, повторный запуск пропускает партии, уже разобранные
+    на этой глубине. progress(done, total) вызывается после каждой партии.
+    Возвращает число разобранных партий
+    """
+    games = (
+        games.filter(result__result__in=(Result.WHITE_WINS, Result.BLACK_WINS, Result.DRAW), board__isnull=False)
+        .exclude(analysis__depth__gte=depth)
+        .with_related()
+        .order_by("pk")
+    )
+    items = [(game.pk, bytes(game.board.move_log), game.pgn_headers(event), depth) for game in games]
+    config = settings.ANALYSIS_ENGINE
+    initargs = (config["COMMAND"], config.get("OPTIONS"))
+
+    if workers == 0:
+        review.init_worker(*initargs)
+        pool, reviewed = None, map(review.review_game, items)
+    else:
+        pool = Pool(workers or os.cpu_count() or 1, initializer=review.init_worker, initargs=initargs)
+        reviewed = pool.imap_unordered(review.review_game, items)
+
+    analysed = 0
+    try:
+        for done, (game_id, pgn, stats) in enumerate(reviewed, 1):
+            if pgn is not None:
+                _save_game_analysis(game_id, depth, pgn, stats)
+                analysed += 1
+            if progress:
+                progress(done, len(items))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        else:
+            review.close_worker()
+    return analysed
+
+
+def analyse_tournament(tournament, depth=ANALYSIS_DEPTH, workers=None, progress=None) -> int:
+    """
+    Разбор всех законченных партий турнира за один запуск
+    """
+    games = Game.objects.filter(matches__tour__tournament=tournament).distinct()
+    return analyse_games(games, depth=depth, workers=workers, event=tournament.name, progress=progress)
 
 
 def create_board_from_pgn(pgn_file, starting_at=0):
@@ -272,7 +782,9 @@ def create_board_from_pgn(pgn_file, starting_at=0):
         chess_board = chess_game.board()
 
         board_instance = Board.from_fen(chess_board.fen())
+        board_instance.zobrist = positions.position_key(chess_board)
         board_instance.save()
+        BoardPosition.objects.create(board=board_instance, ply=0, zobrist=board_instance.zobrist)
 
         if starting_at:
             move_ucis = [i.move.uci() for i in chess_game.mainline()][:starting_at]
@@ -283,6 +795,16 @@ def create_board_from_pgn(pgn_file, starting_at=0):
     return (board_instance, chess_board)
 
 
+def stream_pgn(games, event="?"):
+    """
+    Партии одним PGN-файлом: серверный курсор и порции по PGN_EXPORT_CHUNK_SIZE,
+    память не зависит от количества партий
+    """
+    games = games.with_related().order_by("created_at", "uuid")
+    for game in games.iterator(chunk_size=PGN_EXPORT_CHUNK_SIZE):
+        yield f"{game.to_pgn(event)}\n\n"
+
+
 # Elo
 
 
@@ -334,69 +856,482 @@ def update_elo_rating(player_score=None, player=None, opponent=None, previous=Fa
     return player.elo.rating
 
 
+def get_game_scores(result: str) -> dict:
+    """
+    Очки белых и черных за партию, None если результат не окончательный
+    """
+    return {
+        Result.WHITE_WINS: {"white": 1, "black": 0},
+        Result.BLACK_WINS: {"white": 0, "black": 1},
+        Result.DRAW: {"white": 0.5, "black": 0.5},
+    }.get(result)
+
+
+def _outcome_field(score) -> str:
+    return {1: "wins", 0: "losses"}.get(score, "draws")
+
+
 def update_elo(game_instance):
     """
     Update the ELO of a game's players according to the game's result
+
+    Both Elo rows are locked, each one is written by a single UPDATE
+    and the new ratings are appended to RatingHistory
     Returns: white_elo, black_elo
     """
 
     white = game_instance.white_player
     black = game_instance.black_player
+    scores = get_game_scores(game_instance.result.result) or {"white": 0, "black": 0}
+    # AutoOneToOneField создает недостающие строки Elo
+    players = {"white": white, "black": black}
+    cached = {color: player.elo for color, player in players.items()}
+
+    if white.pk == black.pk:
+        return cached["white"], cached["black"]
+
+    with transaction.atomic():
+        # строки блокируются по порядку pk, иначе две одновременные партии могут взаимно заблокироваться
+        locked = {
+            elo.pk: elo
+            for elo in Elo.objects.select_for_update().filter(pk__in=[elo.pk for elo in cached.values()]).order_by("pk")
+        }
+        ratings = {color: locked[cached[color].pk].rating for color in players}
+        new_ratings = {
+            "white": get_rating(scores["white"], ratings["white"], ratings["black"]),
+            "black": get_rating(scores["black"], ratings["black"], ratings["white"]),
+        }
+
+        for color, elo in cached.items():
+            outcome = _outcome_field(scores[color])
+            Elo.objects.filter(pk=elo.pk).update(
+                rating=new_ratings[color],
+                previous_rating=F("rating"),
+                updated_at=timezone.now(),
+                **{outcome: F(outcome) + 1},
+            )
+
+            elo.previous_rating = ratings[color]
+            elo.rating = new_ratings[color]
+            setattr(elo, outcome, getattr(locked[elo.pk], outcome) + 1)
+
+        RatingHistory.objects.bulk_create(
+            RatingHistory(
+                player=players[color],
+                game_id=None if game_instance._state.adding else game_instance.pk,
+                rating=new_ratings[color],
+                delta=new_ratings[color] - ratings[color],
+                created_at=game_instance.finished_at or timezone.now(),
+            )
+            for color in players
+        )
+        _update_leaderboard_on_commit(ELO_CATEGORY, {players[color].pk: new_ratings[color] for color in players})
 
-    scores = {
-        "white": 0,
-        "black": 0,
-    }
+        update_category_ratings(game_instance)
 
-    result = game_instance.result.result
+    return cached["white"], cached["black"]
 
-    if result == Result.DRAW:
-        scores["white"] += 0.5
-        scores["black"] += 0.5
-        white.elo.draws += 1
-        black.elo.draws += 1
 
-    elif result == Result.WHITE_WINS:
-        scores["white"] += 1
-        white.elo.wins += 1
-        black.elo.losses += 1
+def schedule_rating_update(game: Game) -> None:
+    """
+    Рейтинги закончившейся партии пересчитываются в фоне после фиксации транзакции
+    """
+    enqueue_on_commit(tasks.update_game_ratings, str(game.uuid))
 
-    elif result == Result.BLACK_WINS:
-        scores["black"] += 1
-        black.elo.wins += 1
-        white.elo.losses += 1
 
-    white.elo.save()
-    black.elo.save()
+def update_game_ratings(game_uuid) -> bool:
+    """
+    Обновляет рейтинги игроков партии и отправляет партию с новыми рейтингами в ее группу.
+    Рейтинги партии обновляются один раз, повторный вызов ничего не меняет
+    """
+    with transaction.atomic():
+        game = (
+            Game.objects.select_for_update(of=("self",))
+            .select_related("white_player", "black_player", "result")
+            .filter(uuid=game_uuid, finished_at__isnull=False)
+            .first()
+        )
+        if game is None or RatingHistory.objects.filter(game=game).exists():
+            return False
+        update_elo(game)
+        broadcast_on_commit(game.uuid)
 
-    update_elo_rating(player_score=scores["white"], player=white, opponent=black)
+    return True
 
-    update_elo_rating(
-        player_score=scores["black"], player=black, opponent=white, previous=True
+
+def recalculate_ratings(since) -> int:
+    """
+    Пересчет рейтингов по всем завершенным партиям начиная с since, например после
+    изменения результата. Рейтинг меняется последовательно от партии к партии,
+    поэтому партии проигрываются по порядку в памяти и записываются пачкой
+
+    Возвращает количество пересчитанных партий
+    """
+    games = list(
+        Game.objects.filter(
+            finished_at__gte=since,
+            rated=True,
+            white_player__isnull=False,
+            black_player__isnull=False,
+            result__result__in=(Result.WHITE_WINS, Result.BLACK_WINS, Result.DRAW),
+        )
+        .exclude(white_player=F("black_player"))
+        .select_related("result")
+        .order_by("finished_at", "uuid")
+    )
+    if not games:
+        return 0
+
+    player_ids = {player_id for game in games for player_id in (game.white_player_id, game.black_player_id)}
+
+    with transaction.atomic():
+        # Elo создается при первом обращении к user.elo, у кого-то его может еще не быть
+        existing = set(Elo.objects.filter(player_id__in=player_ids).values_list("player_id", flat=True))
+        Elo.objects.bulk_create(Elo(player_id=player_id) for player_id in player_ids - existing)
+        # рейтинг до since: последняя запись до него, иначе рейтинг перед первой записью после,
+        # иначе текущий - одним запросом вместе с блокировкой
+        player_history = RatingHistory.objects.filter(player_id=OuterRef("player_id"))
+        rating_before = player_history.filter(created_at__lt=since).order_by("-created_at", "-id").values("rating")
+        rating_at_since = (
+            player_history.filter(created_at__gte=since)
+            .order_by("created_at", "id")
+            .annotate(start=F("rating") - F("delta"))
+            .values("start")
+        )
+        elos = {
+            elo.player_id: elo
+            for elo in Elo.objects.select_for_update()
+            .filter(player_id__in=player_ids)
+            .annotate(baseline=Coalesce(Subquery(rating_before[:1]), Subquery(rating_at_since[:1]), F("rating")))
+            .order_by("pk")
+        }
+        ratings = {player_id: elo.baseline for player_id, elo in elos.items()}
+
+        history = []
+        previous = dict(ratings)
+        for game in games:
+            scores = get_game_scores(game.result.result)
+            white_rating, black_rating = ratings[game.white_player_id], ratings[game.black_player_id]
+            new_ratings = {
+                game.white_player_id: get_rating(scores["white"], white_rating, black_rating),
+                game.black_player_id: get_rating(scores["black"], black_rating, white_rating),
+            }
+            for player_id, rating in new_ratings.items():
+                history.append(RatingHistory(
+                    player_id=player_id,
+                    game_id=game.pk,
+                    rating=rating,
+                    delta=rating - ratings[player_id],
+                    created_at=game.finished_at,
+                ))
+                previous[player_id] = ratings[player_id]
+                ratings[player_id] = rating
+
+        RatingHistory.objects.filter(player_id__in=player_ids, created_at__gte=since).delete()
+        RatingHistory.objects.bulk_create(history)
+
+        outcomes = {player_id: {"wins": 0, "losses": 0, "draws": 0} for player_id in player_ids}
+        finished_games = Game.objects.filter(
+            rated=True, result__result__in=(Result.WHITE_WINS, Result.BLACK_WINS, Result.DRAW)
+        ).exclude(white_player=F("black_player"))
+        for color in ("white", "black"):
+            counts = (
+                finished_games.filter(**{f"{color}_player__in": player_ids})
+                .order_by()
+                .values_list(f"{color}_player", "result__result")
+                .annotate(count=Count("uuid"))
+            )
+            for player_id, result, count in counts:
+                outcomes[player_id][_outcome_field(get_game_scores(result)[color])] += count
+
+        for player_id, elo in elos.items():
+            elo.rating = ratings[player_id]
+            elo.previous_rating = previous[player_id]
+            elo.updated_at = timezone.now()
+            for outcome, count in outcomes[player_id].items():
+                setattr(elo, outcome, count)
+        Elo.objects.bulk_update(
+            elos.values(), ["rating", "previous_rating", "wins", "losses", "draws", "updated_at"]
+        )
+        _update_leaderboard_on_commit(ELO_CATEGORY, ratings)
+
+    return len(games)
+
+
+# Category ratings
+
+
+def _as_rating(player_rating: PlayerRating) -> Rating:
+    return Rating(player_rating.rating, player_rating.deviation, player_rating.volatility)
+
+
+def update_category_ratings(game_instance) -> None:
+    """
+    Рейтинг игроков в категории контроля времени партии.
+    Каждая партия считается отдельным рейтинговым периодом
+    """
+    scores = get_game_scores(game_instance.result.result)
+    white_id, black_id = game_instance.white_player_id, game_instance.black_player_id
+    if scores is None or game_instance.time_control_type_id is None or white_id == black_id:
+        return
+
+    system = get_rating_system(RATING_SYSTEM)
+    initial = system.initial()
+    category = {"time_control_type_id": game_instance.time_control_type_id, "system": system.name}
+
+    with transaction.atomic():
+        PlayerRating.objects.bulk_create(
+            [PlayerRating(player_id=player_id, **category, **initial._asdict()) for player_id in (white_id, black_id)],
+            ignore_conflicts=True,
+        )
+        player_ratings = {
+            player_rating.player_id: player_rating
+            for player_rating in PlayerRating.objects.select_for_update().filter(
+                player_id__in=(white_id, black_id), **category
+            )
+        }
+        new_ratings = system.rate_period(
+            {player_id: _as_rating(player_rating) for player_id, player_rating in player_ratings.items()},
+            [(white_id, black_id, scores["white"])],
+        )
+
+        for player_id, player_rating in player_ratings.items():
+            player_rating.rating, player_rating.deviation, player_rating.volatility = new_ratings[player_id]
+            player_rating.games += 1
+            player_rating.updated_at = timezone.now()
+        PlayerRating.objects.bulk_update(
+            player_ratings.values(), ["rating", "deviation", "volatility", "games", "updated_at"]
+        )
+        _update_leaderboard_on_commit(
+            game_instance.time_control_type_id,
+            {player_id: player_rating.rating for player_id, player_rating in player_ratings.items()},
+        )
+
+
+def rebuild_category_ratings() -> int:
+    """
+    Пересчет рейтингов по категориям с нуля в памяти, результат записывается пачкой.
+    Как и в update_category_ratings, каждая партия - отдельный рейтинговый период,
+    поэтому пересчет не меняет рейтинги, посчитанные после партий
+
+    Возвращает количество пересчитанных партий
+    """
+    system = get_rating_system(RATING_SYSTEM)
+    initial = system.initial()
+    games = (
+        Game.objects.filter(
+            finished_at__isnull=False,
+            rated=True,
+            time_control_type__isnull=False,
+            white_player__isnull=False,
+            black_player__isnull=False,
+            result__result__in=(Result.WHITE_WINS, Result.BLACK_WINS, Result.DRAW),
+        )
+        .exclude(white_player=F("black_player"))
+        .order_by("finished_at", "pk")
+        .values_list("time_control_type_id", "white_player_id", "black_player_id", "result__result")
     )
 
-    return white.elo, black.elo
+    ratings = defaultdict(dict)
+    games_count = defaultdict(int)
+    amount = 0
+    for category, white_id, black_id, result in games.iterator(chunk_size=RATING_BATCH_SIZE):
+        category_ratings = ratings[category]
+        category_ratings.update(system.rate_period(
+            {player_id: category_ratings.get(player_id, initial) for player_id in (white_id, black_id)},
+            [(white_id, black_id, get_game_scores(result)["white"])],
+        ))
+        games_count[category, white_id] += 1
+        games_count[category, black_id] += 1
+        amount += 1
+
+    with transaction.atomic():
+        PlayerRating.objects.filter(system=system.name).delete()
+        PlayerRating.objects.bulk_create(
+            (
+                PlayerRating(
+                    player_id=player_id,
+                    time_control_type_id=category,
+                    system=system.name,
+                    games=games_count[category, player_id],
+                    **rating._asdict(),
+                )
+                for category, category_ratings in ratings.items()
+                for player_id, rating in category_ratings.items()
+            ),
+            batch_size=RATING_BATCH_SIZE,
+        )
+        for category, category_ratings in ratings.items():
+            transaction.on_commit(
+                lambda category=category, category_ratings=category_ratings: get_leaderboard().replace(
+                    category, {player_id: rating.rating for player_id, rating in category_ratings.items()}
+                )
+            )
+
+    return amount
+
+
+# Leaderboard
+
+
+def _update_leaderboard_on_commit(category, ratings: dict) -> None:
+    """
+    Лидерборд меняется только после фиксации транзакции с новыми рейтингами
+    """
+    ratings = dict(ratings)
+    transaction.on_commit(lambda: get_leaderboard().update(category, ratings))
+
+
+def rebuild_leaderboards() -> int:
+    """
+    Заполнение всех лидербордов из БД, возвращает количество категорий
+    """
+    leaderboard = get_leaderboard()
+    leaderboard.replace(
+        ELO_CATEGORY,
+        dict(
+            Elo.objects.filter(player__isnull=False)
+            .values_list("player_id", "rating")
+            .iterator(chunk_size=RATING_BATCH_SIZE)
+        ),
+    )
+
+    categories = defaultdict(dict)
+    player_ratings = PlayerRating.objects.filter(system=RATING_SYSTEM).values_list(
+        "time_control_type_id", "player_id", "rating"
+    )
+    for category, player_id, rating in player_ratings.iterator(chunk_size=RATING_BATCH_SIZE):
+        categories[category][player_id] = rating
+    for category, ratings in categories.items():
+        leaderboard.replace(category, ratings)
+
+    return len(categories) + 1
+
+
+def get_leaderboard_entries(entries: list) -> list:
+    """
+    Строки лидерборда с именами игроков, entries: [(место, игрок, рейтинг)]
+    """
+    users = User.objects.in_bulk([player_id for _, player_id, _ in entries])
+    return [
+        {
+            "rank": rank,
+            "player": player_id,
+            "username": users[player_id].username if player_id in users else None,
+            "rating": round(rating),
+        }
+        for rank, player_id, rating in entries
+    ]
 
 
 def get_game_data(game_id):
     try:
-        game = Game.objects.get(uuid=game_id)
+        game = Game.objects.with_related().get(uuid=game_id)
         return GameSerializer(game).data
     except Game.DoesNotExist:
         return {}
 
 
+BROADCAST_ROOMS = {
+    Game.CAM: (CAMERA,),
+    Game.BOARD: (BOARD,),
+    Game.BOTH: (CAMERA, BOARD),
+}
+
+BROADCAST_FIELDS = {
+    CAMERA: '{}_player_broadcast',
+    BOARD: '{}_player_broadcast_board',
+}
+
+
 def create_broadcast_for_game(game: Game):
-    session_id, data_id = create_session()
-    if game.white_player:
-        camera, board = create_rooms_for_user(session_id, data_id, game.white_player.get_full_name())
-        game.set_cam_broadcast('white', camera)
-        game.set_board_broadcast('white', board)
+    """
+    Комнаты Janus для трансляций игроков берутся из пула, недостающие создаются параллельно.
+    Уже назначенные комнаты не пересоздаются, партия сохраняется один раз
+    """
+    rooms = [
+        (color, player, room_type)
+        for color, player in (('white', game.white_player), ('black', game.black_player))
+        if player
+        for room_type in BROADCAST_ROOMS.get(game.broadcast_type, ())
+        if not getattr(game, BROADCAST_FIELDS[room_type].format(color))
+    ]
+    if not rooms:
+        return
+
+    pool = get_room_pool()
+    leased = pool.lease(len(rooms), time.time())
+    room_ids = [room.room_id for room in leased]
+    try:
+        if len(room_ids) < len(rooms):
+            # пул пуст, недостающие комнаты создаются сразу
+            session_id, data_id = create_session()
+            created = create_rooms(
+                session_id, data_id,
+                [(player.get_full_name(), room_type) for _, player, room_type in rooms[len(room_ids):]]
+            )
+            pool.track([Room(session_id, data_id, room_id, time.time()) for room_id in created], time.time())
+            room_ids += created
+
+        for (color, _, room_type), room_id in zip(rooms, room_ids):
+            if room_type == CAMERA:
+                game.set_cam_broadcast(color, room_id, save=False)
+            else:
+                game.set_board_broadcast(color, room_id, save=False)
+        game.save(update_fields=[BROADCAST_FIELDS[room_type].format(color) for color, _, room_type in rooms])
+    except Exception:
+        # комнаты не достались партии, возвращаем их в пул
+        pool.release(room_ids)
+        raise
+
+
+def provision_broadcast(game_uuid) -> bool:
+    """
+    Создает трансляции партии в фоне и отправляет обновленную партию в ее группу.
+    Строка партии заблокирована: два одновременных запуска не назначат комнаты одному цвету дважды
+    """
+    with transaction.atomic():
+        game = (
+            Game.objects.select_for_update(of=("self",))
+            .select_related('white_player', 'black_player')
+            .filter(uuid=game_uuid)
+            .first()
+        )
+        if game is None:
+            return False
 
-    if game.black_player:
-        camera, board = create_rooms_for_user(session_id, data_id, game.black_player.get_full_name())
-        game.set_cam_broadcast('black', camera)
-        game.set_board_broadcast('black', board)
+        try:
+            create_broadcast_for_game(game)
+        except BroadcastApiError:
+            logger.exception("Could not create the broadcast of game %s", game_uuid)
+            return False
+        broadcast_on_commit(game_uuid)
+
+    return True
+
+
+def release_broadcast(game: Game) -> None:
+    """
+    Возвращает комнаты трансляций закончившейся партии в пул
+    """
+    room_ids = [
+        room_id
+        for room_id in (
+            game.white_player_broadcast, game.white_player_broadcast_board,
+            game.black_player_broadcast, game.black_player_broadcast_board,
+        )
+        if room_id
+    ]
+    if room_ids:
+        transaction.on_commit(lambda: get_room_pool().release(room_ids))
+
+
+def schedule_broadcast(game: Game) -> None:
+    """
+    Трансляции создаются после фиксации транзакции, вне HTTP-запроса
+    """
+    if game.broadcast_type in BROADCAST_ROOMS:
+        enqueue_on_commit(tasks.provision_broadcast, str(game.uuid))
 
 
 def repeat_game(game: Game) -> Game:
@@ -410,6 +1345,61 @@ def repeat_game(game: Game) -> Game:
         broadcast_type=game.broadcast_type,
         time_control_type=game.time_control_type
     )
-    game_data = get_game_data(new_game.uuid)
-    async_to_sync(send_game_data_to_group)(game.uuid, game_data)
+    transaction.on_commit(
+        lambda: async_to_sync(send_game_data_to_group)(game.uuid, get_game_data(new_game.uuid))
+    )
     return new_game
+
+
+def send_game_invitation(game_uuid, sender, email) -> None:
+    topic = f'Chess game invitation from {sender}'
+    message = f'''
+        Hello!
+        You have been invited to a chess game:
+        https://chessmatch.mercury.xamtal.ru/#/play/friend/{game_uuid}
+    '''
+    send_mail(topic, message, settings.EMAIL_HOST_USER, [email], fail_silently=True)
+
+
+# Matchmaking
+
+
+def seek_game(user: User, time_control_type) -> None:
+    """
+    Ставит игрока в очередь подбора соперника, новый поиск заменяет предыдущий
+    """
+    get_seek_queue().push({
+        "action": SEEK,
+        "player": user.pk,
+        "rating": user.elo.rating,
+        "time_control_type": time_control_type.pk,
+        "created_at": time.time(),
+    })
+
+
+def cancel_seek(user: User) -> None:
+    get_seek_queue().push({"action": CANCEL, "player": user.pk})
+
+
+def create_matched_game(white_id, black_id, time_control_type_id) -> Game:
+    """
+    Партия для пары, найденной матчмейкером. Игроки узнают о ней из своих каналов
+    """
+    with transaction.atomic():
+        game_uuid = uuid.uuid4()
+        game = Game.objects.create(
+            uuid=game_uuid,
+            board=create_board(game_uuid, {}),
+            result=create_result({}),
+            white_player_id=white_id,
+            black_player_id=black_id,
+            time_control_type_id=time_control_type_id,
+            broadcast_type=Game.NONE,
+        )
+
+        broadcast_on_commit(game_uuid)
+        transaction.on_commit(
+            lambda: async_to_sync(send_match_to_players)(game_uuid, {"white": white_id, "black": black_id})
+        )
+
+    return game
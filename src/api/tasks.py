@@ -0,0 +1,26 @@
+from celery import shared_task
+from django.db import OperationalError
+
+from core.utils.tasks import KeyedTask
+from . import services
+
+
+# взаимная блокировка откатывает транзакцию целиком, повтор безопасен: рейтинги партии пишутся один раз
+@shared_task(base=KeyedTask, acks_late=True, autoretry_for=(OperationalError,), retry_backoff=True, max_retries=5)
+def update_game_ratings(game_uuid):
+    return services.update_game_ratings(game_uuid)
+
+
+@shared_task(base=KeyedTask, acks_late=True)
+def update_opening_explorer(game_uuid):
+    return services.update_opening_explorer(game_uuid)
+
+
+@shared_task(base=KeyedTask, acks_late=True)
+def provision_broadcast(game_uuid):
+    return services.provision_broadcast(game_uuid)
+
+
+@shared_task(base=KeyedTask)
+def send_game_invitation(game_uuid, sender, email):
+    services.send_game_invitation(game_uuid, sender, email)
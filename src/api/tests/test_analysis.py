@@ -0,0 +1,178 @@
+import chess
+import pytest
+from django.conf import settings
+from rest_framework.test import APIClient
+
+from api import positions, services
+from api.analysis.cache import InMemoryEvalCache, get_eval_cache
+from api.analysis.engine import AnalysisWorker, EnginePool
+from api.analysis.jobs import LIVE, REVIEW, InMemoryAnalysisQueue, Job, get_analysis_queue
+'Do not remove the import below!'
+from fixtures import users
+
+FOOLS_MATE = ("f2f3", "e7e5", "g2g4", "d8h4")
+
+
+@pytest.fixture(autouse=True)
+def analysis_backends():
+    get_analysis_queue.cache_clear()
+    get_eval_cache.cache_clear()
+    yield
+    get_analysis_queue.cache_clear()
+    get_eval_cache.cache_clear()
+
+
+@pytest.fixture
+def engine_pool():
+    pool = EnginePool(settings.ANALYSIS_ENGINE["COMMAND"], size=1, options={"Threads": 1})
+    yield pool
+    pool.close()
+
+
+def _play(game, users):
+    player, opponent = users
+    for counter, uci in enumerate(FOOLS_MATE):
+        services.commit_move(game.uuid, uci[:2], uci[2:], player if counter % 2 == 0 else opponent)
+
+
+def test_queue_orders_live_before_review():
+    jobs = InMemoryAnalysisQueue(max_size=4)
+
+    assert jobs.push(Job("review", 10, REVIEW, created_at=1))
+    assert jobs.push(Job("review", 10, REVIEW, created_at=2))
+    assert jobs.push(Job("other review", 10, REVIEW, created_at=3))
+    assert not jobs.push(Job("third review", 10, REVIEW, created_at=4))
+    assert jobs.push(Job("live", 10, LIVE, game="game", created_at=5))
+
+    assert [jobs.pop(0).fen for _ in range(3)] == ["live", "review", "other review"]
+    assert jobs.pop(0) is None
+
+
+def test_eval_cache_returns_deepest_evaluation():
+    cache = InMemoryEvalCache()
+    cache.set(1, 10, {"depth": 10})
+    cache.set(1, 20, {"depth": 20})
+
+    assert cache.get(1, 5) == {"depth": 20}
+    assert cache.get(1, 15) == {"depth": 20}
+    assert cache.get(1, 25) is None
+    assert cache.get_many([1, 2], 10) == {1: {"depth": 20}}
+
+
+def test_engine_pool_evaluates_from_white_side(engine_pool):
+    hanging_queen = engine_pool.analyse("rnb1kbnr/pppp1ppp/8/4p3/4P2q/5P2/PPPP2PP/RNBQKBNR w KQkq - 1 3", 6)
+    mated = engine_pool.analyse("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3", 6)
+
+    assert hanging_queen["depth"] == 6
+    assert hanging_queen["cp"] < 0
+    assert mated == {"depth": 6, "cp": -10000, "mate": 0, "best": None, "pv": []}
+
+
+def test_worker_caches_and_drops_stale_live_jobs(engine_pool):
+    jobs, cache, notified = InMemoryAnalysisQueue(), InMemoryEvalCache(), []
+    worker = AnalysisWorker(engine_pool, jobs, cache, notify=lambda job, result: notified.append(job.game), live_ttl=10)
+
+    jobs.push(Job(chess.STARTING_FEN, 4, LIVE, game="game", created_at=100))
+    assert worker.run_once(0, now=105)["cp"] == 0
+    assert cache.get(positions.fen_key(chess.STARTING_FEN), 4)["cp"] == 0
+    assert notified == ["game"]
+
+    jobs.push(Job(chess.STARTING_FEN, 4, LIVE, game="game", created_at=100))
+    assert worker.run_once(0, now=111) is None
+    assert notified == ["game"]
+
+
+def test_worker_caches_time_limited_search_at_requested_depth():
+    class TimeLimitedPool:
+        def analyse(self, fen, depth):
+            return {"depth": 3, "cp": 20, "mate": None, "best": "e2e4", "pv": ["e2e4"]}
+
+    jobs, cache = InMemoryAnalysisQueue(), InMemoryEvalCache()
+    jobs.push(Job(chess.STARTING_FEN, 10, REVIEW))
+
+    assert AnalysisWorker(TimeLimitedPool(), jobs, cache).run_once(0)["depth"] == 3
+    assert cache.get(positions.fen_key(chess.STARTING_FEN), 10)["depth"] == 3
+    assert cache.get(positions.fen_key(chess.STARTING_FEN), 11) is None
+
+
+def test_engine_pool_closes_engine_after_any_error(engine_pool):
+    engine_pool.analyse(chess.STARTING_FEN, 2)
+    engine = engine_pool._idle.get_nowait()
+    engine.analyse = lambda *args, **kwargs: {}["score"]
+    engine_pool._idle.put(engine)
+
+    with pytest.raises(KeyError):
+        engine_pool.analyse(chess.STARTING_FEN, 2)
+
+    assert engine_pool._idle.empty()
+    assert engine_pool.analyse(chess.STARTING_FEN, 2)["depth"] == 2
+
+
+@pytest.mark.django_db
+def test_game_analysis(users, engine_pool):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    _play(game, users)
+    client = APIClient()
+
+    response = client.get(f"/api/game/{game.uuid}/analysis/", {"depth": 4})
+
+    assert response.status_code == 202
+    assert response.data["pending"] == 5
+
+    worker = AnalysisWorker(engine_pool, get_analysis_queue(), get_eval_cache())
+    while worker.run_once(0) is not None:
+        pass
+    response = client.get(f"/api/game/{game.uuid}/analysis/", {"depth": 4})
+
+    assert response.status_code == 200
+    assert response.data["complete"]
+    assert [position["san"] for position in response.data["positions"]] == [None, "f3", "e5", "g4", "Qh4#"]
+    assert response.data["positions"][-1]["eval"]["mate"] == 0
+    assert response.data["positions"][-1]["eval"]["cp"] == -10000
+
+
+@pytest.mark.django_db
+def test_time_limited_analysis_completes(users):
+    class TimeLimitedPool:
+        def analyse(self, fen, depth):
+            return {"depth": 3, "cp": 0, "mate": None, "best": None, "pv": []}
+
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    _play(game, users)
+    client = APIClient()
+    client.get(f"/api/game/{game.uuid}/analysis/", {"depth": 10})
+
+    worker = AnalysisWorker(TimeLimitedPool(), get_analysis_queue(), get_eval_cache())
+    while worker.run_once(0) is not None:
+        pass
+    response = client.get(f"/api/game/{game.uuid}/analysis/", {"depth": 10})
+
+    assert response.status_code == 200
+    assert get_analysis_queue().size() == 0
+
+
+@pytest.mark.django_db
+def test_unfinished_game_is_not_analysed(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    services.commit_move(game.uuid, "e2", "e4", player)
+
+    response = APIClient().get(f"/api/game/{game.uuid}/analysis/")
+
+    assert response.status_code == 400
+    assert get_analysis_queue().size() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_move_requests_live_evaluation(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    services.commit_move(game.uuid, "e2", "e4", player)
+
+    job = get_analysis_queue().pop(0)
+
+    assert job.is_live
+    assert job.game == str(game.uuid)
+    assert job.fen == chess.Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1").fen()
@@ -0,0 +1,84 @@
+import uuid
+
+import chess
+import pytest
+from django.db import transaction
+
+from api import services
+from api.board_cache import LiveBoardCache, live_boards
+from api.models import Game
+'Do not remove the import below!'
+from fixtures import users
+
+
+def test_cache_lru_eviction():
+    board_cache = LiveBoardCache(maxsize=2)
+    first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+
+    board_cache.set(first, chess.Board(), 0)
+    board_cache.set(second, chess.Board(), 0)
+    board_cache.get(first)
+    board_cache.set(third, chess.Board(), 0)
+
+    assert list(board_cache._boards) == [str(first), str(third)]
+
+
+def test_cache_restores_board_from_shared_cache():
+    board_cache = LiveBoardCache()
+    game_uuid = uuid.uuid4()
+    chess_board = chess.Board()
+    chess_board.push_uci("e2e4")
+    board_cache.set(game_uuid, chess_board, 1)
+
+    board_cache.clear()
+    cached_board = board_cache.get(game_uuid, fen=chess_board.fen(), ply=1)
+
+    assert cached_board is not chess_board
+    assert cached_board.fen() == chess_board.fen()
+    assert board_cache.get(game_uuid, ply=2) is None
+
+
+def test_cache_drops_outdated_board():
+    board_cache = LiveBoardCache()
+    game_uuid = uuid.uuid4()
+    board_cache.set(game_uuid, chess.Board(), 0)
+
+    assert board_cache.get(game_uuid, fen=chess.Board("8/8/8/8/8/8/8/K6k w - - 0 1").fen()) is None
+
+
+@pytest.mark.django_db
+def test_chess_board_from_uuid_uses_cache(users, django_assert_num_queries):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    services.move_piece(game.board, "e2", "e4", player)
+
+    with django_assert_num_queries(1):
+        chess_board = services.chess_board_from_uuid(game.uuid)
+
+    assert [m.uci() for m in chess_board.move_stack] == ["e2e4"]
+
+
+@pytest.mark.django_db
+def test_rolled_back_move_is_not_cached(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    live_boards.delete(game.uuid)
+
+    with pytest.raises(RuntimeError), transaction.atomic():
+        services.commit_move(game.uuid, "e2", "e4", player)
+        raise RuntimeError
+
+    live_boards.clear()
+    assert live_boards.get(game.uuid, ply=1) is None
+    assert services.chess_board_from_uuid(game.uuid).fen() == chess.STARTING_FEN
+
+
+@pytest.mark.django_db(transaction=True)
+def test_finished_game_leaves_cache(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    services.move_piece(game.board, "e2", "e4", player)
+
+    services.draw_game(Game.objects.get(uuid=game.uuid))
+
+    assert live_boards.get(game.uuid) is None
@@ -0,0 +1,211 @@
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from api import services
+from api.broadcast import services as broadcast_services
+from api.broadcast.exceptions import BroadcastApiError
+from api.broadcast.fake_janus import FakeJanus
+from api.broadcast.pool import InMemoryRoomPool, RoomPoolMaintainer, get_room_pool
+from api.broadcast.services import CreateSession, KeepAlive, create_session
+from api.models import Game
+'Do not remove the import below!'
+from fixtures import users
+
+
+@pytest.fixture
+def janus(settings, monkeypatch):
+    monkeypatch.setattr(broadcast_services, "BROADCAST_BACKOFF", 0)
+    get_room_pool.cache_clear()
+    with FakeJanus() as server:
+        settings.VIDEO_BROADCAST = server.url
+        yield server
+    get_room_pool.cache_clear()
+
+
+def _game(users, broadcast_type=Game.BOTH):
+    player, opponent = users
+    return services.create_game({}, {}, white_player=player, black_player=opponent, broadcast_type=broadcast_type)
+
+
+@pytest.mark.django_db
+def test_create_broadcast_for_game(users, janus):
+    game = _game(users)
+
+    with patch.object(Game, "save", autospec=True, side_effect=Game.save) as save:
+        services.create_broadcast_for_game(game)
+
+    assert save.call_count == 1
+    assert len(janus.sessions) == 1
+    game.refresh_from_db()
+    assert {
+        game.white_player_broadcast, game.white_player_broadcast_board,
+        game.black_player_broadcast, game.black_player_broadcast_board,
+    } == {str(room) for room in janus.rooms}
+
+
+@pytest.mark.django_db
+def test_create_broadcast_for_camera_only(users, janus):
+    game = _game(users, Game.CAM)
+
+    services.create_broadcast_for_game(game)
+
+    assert len(janus.rooms) == 2
+    assert game.white_player_broadcast and game.black_player_broadcast
+    assert game.white_player_broadcast_board is None
+
+
+@pytest.mark.django_db
+def test_create_broadcast_without_stream(users, janus):
+    services.create_broadcast_for_game(_game(users, Game.NONE))
+
+    assert janus.requests == []
+
+
+def test_janus_request_is_retried(janus):
+    janus.failures = 2
+
+    assert create_session()
+    assert len(janus.requests) == 4
+
+
+def test_janus_request_gives_up(janus):
+    janus.failures = broadcast_services.BROADCAST_RETRIES + 1
+
+    with pytest.raises(BroadcastApiError):
+        CreateSession().do_request()
+
+
+def test_janus_request_timeout(janus, monkeypatch):
+    monkeypatch.setattr(broadcast_services, "BROADCAST_READ_TIMEOUT", 0.05)
+    monkeypatch.setattr(broadcast_services, "BROADCAST_RETRIES", 0)
+    janus.delay = 0.2
+
+    with pytest.raises(BroadcastApiError):
+        CreateSession().do_request()
+
+
+def test_janus_create_is_not_retried_after_read_timeout(janus, monkeypatch):
+    monkeypatch.setattr(broadcast_services, "BROADCAST_READ_TIMEOUT", 0.05)
+    janus.delay = 0.2
+
+    with pytest.raises(BroadcastApiError):
+        CreateSession().do_request()
+
+    assert len(janus.requests) == 1
+
+
+def test_janus_keepalive_is_retried_after_read_timeout(janus, monkeypatch):
+    session_id, _ = create_session()
+    monkeypatch.setattr(broadcast_services, "BROADCAST_READ_TIMEOUT", 0.05)
+    janus.delay = 0.2
+
+    with pytest.raises(BroadcastApiError):
+        KeepAlive(session_id).do_request()
+
+    assert len(janus.requests) == 2 + broadcast_services.BROADCAST_RETRIES + 1
+
+
+def test_janus_error_response(janus):
+    with pytest.raises(BroadcastApiError):
+        broadcast_services.CreateData(1).do_request()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_provision_broadcast_pushes_game(users, janus):
+    game = _game(users)
+    layer = get_channel_layer()
+    channel = async_to_sync(layer.new_channel)()
+    async_to_sync(layer.group_add)(f"game_{game.uuid}", channel)
+
+    assert services.provision_broadcast(game.uuid)
+
+    message = async_to_sync(layer.receive)(channel)
+    assert message["type"] == "game_data"
+    game.refresh_from_db()
+    assert game.white_player_broadcast in message["game"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_assign_color_schedules_broadcast(users):
+    player, _ = users
+    game = services.create_game({}, {}, broadcast_type=Game.BOTH)
+
+    with patch("api.tasks.provision_broadcast.apply_async") as apply_async:
+        services.assign_color(game, player.username, "white")
+
+    apply_async.assert_called_once_with(args=(str(game.uuid),), kwargs={})
+
+
+def test_room_pool_maintainer_fills_pool(janus):
+    pool = InMemoryRoomPool()
+
+    stats = RoomPoolMaintainer(pool, size=4).run_once()
+
+    assert stats == {"available": 4, "leased": 0, "hits": 0, "misses": 0, "hit_rate": None}
+    assert {room.room_id for room in pool.available()} == set(janus.rooms)
+
+
+def test_room_pool_health_check_and_ttl(janus):
+    pool = InMemoryRoomPool()
+    maintainer = RoomPoolMaintainer(pool, size=2, ttl=100)
+    maintainer.run_once(now=1000)
+    expired_session = pool.available()[0].session_id
+
+    janus.expire_session(expired_session)
+    maintainer.run_once(now=1001)
+    assert {room.session_id for room in pool.available()} - {expired_session}
+    assert expired_session not in {room.session_id for room in pool.available()}
+
+    old_rooms = {room.room_id for room in pool.available()}
+    maintainer.run_once(now=1200)
+    assert not old_rooms & {room.room_id for room in pool.available()}
+    # устаревшие комнаты живых сессий удаляются и в Janus
+    assert not old_rooms & set(janus.rooms)
+
+
+@pytest.mark.django_db
+def test_create_broadcast_leases_rooms(users, janus):
+    RoomPoolMaintainer(get_room_pool(), size=6).run_once()
+    sessions = set(janus.sessions)
+
+    game = _game(users)
+    services.create_broadcast_for_game(game)
+
+    assert janus.sessions == sessions
+    assert get_room_pool().stats() == {"available": 2, "leased": 4, "hits": 4, "misses": 0, "hit_rate": 1.0}
+
+
+@pytest.mark.django_db
+def test_create_broadcast_failure_returns_leased_rooms(users, janus):
+    RoomPoolMaintainer(get_room_pool(), size=1).run_once()
+    janus.failures = broadcast_services.BROADCAST_RETRIES + 1
+
+    with pytest.raises(BroadcastApiError):
+        services.create_broadcast_for_game(_game(users))
+
+    assert get_room_pool().stats()["available"] == 1
+    assert get_room_pool().stats()["leased"] == 0
+
+
+@pytest.mark.django_db
+def test_create_broadcast_pool_miss(users, janus):
+    RoomPoolMaintainer(get_room_pool(), size=1).run_once()
+
+    services.create_broadcast_for_game(_game(users))
+
+    assert len(janus.sessions) == 2
+    assert get_room_pool().stats() == {"available": 0, "leased": 4, "hits": 1, "misses": 3, "hit_rate": 0.25}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_finished_game_releases_rooms(users, janus):
+    game = _game(users)
+    services.create_broadcast_for_game(game)
+
+    services.draw_game(game, broadcast=False)
+
+    assert get_room_pool().stats()["available"] == 4
+    assert get_room_pool().stats()["leased"] == 0
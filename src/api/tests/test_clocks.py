@@ -0,0 +1,100 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from api import services
+from api.clocks import ClockScheduler, InMemoryClockStore, get_clock_store
+from api.models import Game, Result
+from core.tournament.models import TimeControlType
+'Do not remove the import below!'
+from fixtures import users
+
+
+def test_in_memory_store_pops_due_games_in_order():
+    store = InMemoryClockStore()
+    store.schedule("late", 30)
+    store.schedule("early", 10)
+    store.schedule("cancelled", 5)
+    store.cancel("cancelled")
+
+    assert store.next_deadline() == 10
+    assert store.pop_due(20) == ["early"]
+    assert store.pop_due(40) == ["late"]
+    assert store.next_deadline() is None
+
+
+def test_in_memory_store_reschedule():
+    store = InMemoryClockStore()
+    store.schedule("game", 10)
+    store.schedule("game", 50)
+
+    assert store.pop_due(20) == []
+    assert store.next_deadline() == 50
+
+
+def test_scheduler_runs_handler_for_due_games():
+    store = InMemoryClockStore()
+    store.schedule("game", 10)
+    finished = []
+
+    scheduler = ClockScheduler(store, finished.append)
+
+    assert scheduler.run_pending(now=5) == 0
+    assert scheduler.run_pending(now=15) == 1
+    assert finished == ["game"]
+
+
+def test_scheduler_retries_failed_handler():
+    store = InMemoryClockStore()
+    store.schedule("game", 10)
+    calls = []
+
+    def handler(game_uuid):
+        calls.append(game_uuid)
+        if len(calls) == 1:
+            raise TimeoutError
+
+    scheduler = ClockScheduler(store, handler, retry_delay=5)
+
+    assert scheduler.run_pending(now=15) == 1
+    assert store.next_deadline() == 20
+    assert scheduler.run_pending(now=20) == 1
+    assert calls == ["game", "game"]
+    assert store.next_deadline() is None
+
+
+@pytest.fixture
+def bullet_game(users):
+    get_clock_store.cache_clear()
+    player, opponent = users
+    time_control_type = TimeControlType.objects.create(name='bullet', time=60)
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent, time_control_type=time_control_type)
+    services.commit_move(game.uuid, 'e2', 'e4', player)
+    return Game.objects.get(uuid=game.uuid)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_move_schedules_flag_fall(bullet_game):
+    assert get_clock_store().pop_due(bullet_game.flag_deadline().timestamp()) == [str(bullet_game.uuid)]
+
+
+@pytest.mark.django_db
+def test_finish_game_on_time(bullet_game):
+    Game.objects.filter(uuid=bullet_game.uuid).update(
+        last_move_at=timezone.now() - datetime.timedelta(seconds=61)
+    )
+
+    assert services.finish_game_on_time(bullet_game.uuid)
+
+    game = Game.objects.get(uuid=bullet_game.uuid)
+    assert game.result.result == Result.WHITE_WINS
+    assert game.result.termination == Result.TIME_FORFEIT
+    assert str(bullet_game.uuid) not in get_clock_store().pop_due(float('inf'))
+
+
+@pytest.mark.django_db
+def test_finish_game_on_time_too_early(bullet_game):
+    assert not services.finish_game_on_time(bullet_game.uuid)
+    assert Game.objects.get(uuid=bullet_game.uuid).finished_at is None
@@ -0,0 +1,99 @@
+import io
+
+import chess
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from api import explorer, movelog, positions, services
+from api.explorer import get_opening_explorer
+from api.models import Game, Result
+'Do not remove the import below!'
+from fixtures import users
+
+MORPHY_PGN = "docs/pgn/Morphy.pgn"
+
+
+@pytest.fixture(autouse=True)
+def opening_explorer():
+    get_opening_explorer.cache_clear()
+    yield get_opening_explorer()
+    get_opening_explorer.cache_clear()
+
+
+def _log(*ucis):
+    return movelog.encode([chess.Move.from_uci(uci) for uci in ucis])
+
+
+def test_count_games_and_merge():
+    start = positions.position_key(chess.Board())
+    e4, d4 = movelog.pack_move(chess.Move.from_uci("e2e4")), movelog.pack_move(chess.Move.from_uci("d2d4"))
+
+    first = explorer.count_games([(_log("e2e4", "e7e5"), explorer.WHITE, 1500, 1400)])
+    second = explorer.count_games([
+        (_log("e2e4"), explorer.DRAW, None, 1400),
+        (_log("d2d4"), explorer.BLACK, 1300, 1200),
+    ])
+    stats = explorer.merge(first, second)
+
+    assert stats[start, e4] == [1, 1, 0, 1500, 1]
+    assert stats[start, d4] == [0, 0, 1, 1300, 1]
+    assert len(explorer.game_entries(_log("e2e4", "e7e5", "g1f3"), depth=2)) == 2
+
+
+def test_in_memory_explorer_counts_game_once(opening_explorer):
+    entries = explorer.game_entries(_log("e2e4", "e7e5"))
+
+    assert opening_explorer.add_game("game", entries, explorer.WHITE, {True: 1500, False: None})
+    assert not opening_explorer.add_game("game", entries, explorer.WHITE, {True: 1500, False: None})
+
+    e5 = movelog.pack_move(chess.Move.from_uci("e7e5"))
+    assert opening_explorer.moves(entries[1][0]) == {e5: [1, 0, 0, 0, 0]}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_finished_game_is_added_to_explorer(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    for uci, user in (("f2f3", player), ("e7e5", opponent), ("g2g4", player), ("d8h4", opponent)):
+        services.commit_move(game.uuid, uci[:2], uci[2:], user)
+
+    response = APIClient().get("/api/game/explorer/", {"fen": chess.STARTING_FEN})
+
+    assert response.status_code == 200
+    assert response.data["games"] == 1
+    assert response.data["moves"] == [{
+        "uci": "f2f3", "san": "f3", "games": 1, "white": 0.0, "draws": 0.0, "black": 100.0, "average_rating": 1200,
+    }]
+    assert not services.update_opening_explorer(game.uuid)
+
+
+@pytest.mark.django_db
+def test_rebuild_counts_games_finished_during_rebuild(users, monkeypatch):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    for uci, user in (("f2f3", player), ("e7e5", opponent), ("g2g4", player), ("d8h4", opponent)):
+        services.commit_move(game.uuid, uci[:2], uci[2:], user)
+    # партия закончилась уже после запроса пересчета
+    monkeypatch.setattr(services, "_explorer_batches", lambda batch_size: iter([]))
+
+    assert services.rebuild_opening_explorer(workers=0) == 0
+    assert [move["games"] for move in services.get_explorer_moves(chess.STARTING_FEN)] == [1]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("workers", [0, 2])
+def test_rebuild_opening_explorer(workers):
+    call_command("import_pgn", MORPHY_PGN, "--workers=0", stdout=io.StringIO())
+    finished = Game.objects.filter(
+        result__result__in=(Result.WHITE_WINS, Result.DRAW, Result.BLACK_WINS)
+    ).count()
+    out = io.StringIO()
+
+    call_command("rebuild_opening_explorer", "--batch-size=50", f"--workers={workers}", stdout=out)
+
+    moves = services.get_explorer_moves(chess.STARTING_FEN)
+    assert f"rebuilt from {finished} games" in out.getvalue()
+    assert sum(move["games"] for move in moves) == finished
+    assert moves[0]["san"] == "e4"
+    assert all(move["average_rating"] is None for move in moves)
@@ -0,0 +1,112 @@
+import random
+import time
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import services
+from api.leaderboard import ELO_CATEGORY, InMemoryLeaderboard, get_around, get_leaderboard
+from api.models import Elo, Game, Result
+from api.views import EloViewSet
+'Do not remove the import below!'
+from fixtures import users
+
+factory = APIRequestFactory()
+
+
+@pytest.fixture
+def leaderboard():
+    get_leaderboard.cache_clear()
+    yield get_leaderboard()
+    get_leaderboard.cache_clear()
+
+
+def test_in_memory_leaderboard_ranks():
+    board = InMemoryLeaderboard()
+    board.update(ELO_CATEGORY, {1: 1200, 2: 1500, 3: 1350})
+    board.update(ELO_CATEGORY, {1: 1600})
+
+    assert board.page(ELO_CATEGORY, 0, 10) == [(1, 1, 1600), (2, 2, 1500), (3, 3, 1350)]
+    assert board.position(ELO_CATEGORY, 3) == (3, 1350)
+    assert board.position(ELO_CATEGORY, 4) is None
+    assert board.size(ELO_CATEGORY) == 3
+    assert board.page("5", 0, 10) == []
+
+
+def test_in_memory_leaderboard_orders_ties_like_redis():
+    board = InMemoryLeaderboard()
+    board.update(ELO_CATEGORY, {9: 1500, 10: 1500, 2: 1500, 3: 1600})
+
+    # ZREVRANGE: равные очки по убыванию участника как строки
+    assert [player_id for _, player_id, _ in board.page(ELO_CATEGORY, 0, 10)] == [3, 9, 2, 10]
+    assert board.position(ELO_CATEGORY, 10) == (4, 1500)
+    assert board.page(ELO_CATEGORY, 1, 2) == [(2, 9, 1500), (3, 2, 1500)]
+
+
+def test_get_around():
+    board = InMemoryLeaderboard()
+    board.replace(ELO_CATEGORY, {player_id: 2000 - player_id for player_id in range(1, 21)})
+
+    position, entries = get_around(board, ELO_CATEGORY, 10, 2)
+    assert position == (10, 1990)
+    assert [rank for rank, _, _ in entries] == [8, 9, 10, 11, 12]
+
+    _, entries = get_around(board, ELO_CATEGORY, 1, 2)
+    assert [rank for rank, _, _ in entries] == [1, 2, 3]
+
+    assert get_around(board, ELO_CATEGORY, 100, 2) == (None, [])
+
+
+def test_in_memory_leaderboard_is_fast():
+    random.seed(0)
+    board = InMemoryLeaderboard()
+    board.replace(ELO_CATEGORY, {player_id: random.randint(800, 2800) for player_id in range(100000)})
+
+    started = time.monotonic()
+    for player_id in range(0, 100000, 100):
+        get_around(board, ELO_CATEGORY, player_id, 5)
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_update_elo_updates_leaderboard(users, leaderboard):
+    player, opponent = users
+    game = Game.objects.create(
+        white_player=player,
+        black_player=opponent,
+        result=Result.objects.create(result=Result.WHITE_WINS, termination=Result.NORMAL),
+        finished_at=timezone.now(),
+        broadcast_type=Game.NONE,
+    )
+
+    services.update_elo(game)
+
+    assert leaderboard.page(ELO_CATEGORY, 0, 10) == [(1, player.pk, 1216), (2, opponent.pk, 1184)]
+
+
+@pytest.mark.django_db
+def test_leaderboard_views(users, leaderboard):
+    player, opponent = users
+    Elo.objects.create(player=player, rating=1500)
+    Elo.objects.create(player=opponent, rating=1300)
+    assert services.rebuild_leaderboards() == 1
+
+    request = factory.get("/api/elo/leaderboard/", {"limit": 1})
+    force_authenticate(request, user=opponent)
+    response = EloViewSet.as_view({"get": "leaderboard"})(request)
+    assert response.data == {
+        "category": ELO_CATEGORY,
+        "count": 2,
+        "results": [{"rank": 1, "player": player.pk, "username": player.username, "rating": 1500}],
+    }
+
+    request = factory.get("/api/elo/leaderboard/me/", {"size": 1})
+    force_authenticate(request, user=opponent)
+    response = EloViewSet.as_view({"get": "my_position"})(request)
+    assert (response.data["rank"], response.data["rating"]) == (2, 1300)
+    assert [entry["player"] for entry in response.data["around"]] == [player.pk, opponent.pk]
+
+    request = factory.get("/api/elo/leaderboard/", {"limit": 0})
+    force_authenticate(request, user=opponent)
+    assert EloViewSet.as_view({"get": "leaderboard"})(request).status_code == 422
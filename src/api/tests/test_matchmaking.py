@@ -0,0 +1,149 @@
+import asyncio
+import random
+import time
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from rest_framework.test import APIClient
+
+from api import services
+from api.matchmaking import CANCEL, SEEK, InMemorySeekQueue, Matchmaker, Seek, SeekPool, get_seek_queue
+from core.tournament.models import TimeControlType
+from stream_app.services import matchmaking_group_name
+'Do not remove the import below!'
+from fixtures import users
+
+
+def test_seek_pool_pairs_within_window():
+    pool = SeekPool(initial_window=100)
+
+    assert pool.add(Seek(1, 1500, 1, 0), now=0) is None
+    assert pool.add(Seek(2, 1700, 1, 0), now=0) is None
+    assert pool.add(Seek(3, 1450, 2, 0), now=0) is None
+    assert pool.add(Seek(4, 1560, 1, 0), now=0).player_id == 1
+    assert len(pool) == 2
+
+
+def test_seek_pool_picks_closest_opponent():
+    pool = SeekPool(initial_window=100)
+    for player_id, rating in ((1, 1350), (2, 1480), (3, 1590)):
+        pool.add(Seek(player_id, rating, 1, 0), now=0)
+
+    assert pool.add(Seek(4, 1510, 1, 0), now=0).player_id == 2
+
+
+def test_seek_pool_window_widens():
+    pool = SeekPool(initial_window=100, widening=10, max_window=300)
+    pool.add(Seek(1, 1200, 1, 0), now=0)
+    pool.add(Seek(2, 1450, 1, 0), now=0)
+
+    assert pool.pop_pairs(now=10) == []
+    pairs = pool.pop_pairs(now=15)
+    assert [(white.player_id, black.player_id) for white, black in pairs] == [(1, 2)]
+    assert len(pool) == 0
+
+
+def test_seek_pool_cancel_and_replace():
+    pool = SeekPool(initial_window=100)
+    pool.add(Seek(1, 1500, 1, 0), now=0)
+    pool.cancel(1)
+    assert pool.add(Seek(2, 1500, 1, 0), now=0) is None
+
+    # новый поиск того же игрока заменяет старый, сам с собой игрок не играет
+    assert pool.add(Seek(2, 1900, 1, 0), now=0) is None
+    assert pool.add(Seek(3, 1500, 1, 0), now=0) is None
+    assert pool.add(Seek(4, 1880, 1, 0), now=0).player_id == 2
+    assert len(pool) == 1
+
+
+def test_seek_pool_is_fast():
+    random.seed(0)
+    pool = SeekPool()
+
+    started = time.monotonic()
+    pairs = 0
+    for player_id in range(20000):
+        if pool.add(Seek(player_id, random.gauss(1500, 300), player_id % 4, 0), now=0):
+            pairs += 1
+    pairs += len(pool.pop_pairs(now=60))
+
+    assert time.monotonic() - started < 5
+    assert pairs * 2 + len(pool) == 20000
+
+
+@pytest.mark.asyncio
+async def test_matchmaker_run_pending():
+    queue = InMemorySeekQueue()
+    games = []
+
+    async def handler(white, black):
+        games.append((white.player_id, black.player_id))
+
+    matchmaker = Matchmaker(queue, handler, SeekPool(initial_window=100))
+    for player_id, rating in ((1, 1500), (2, 1900), (3, 1550)):
+        queue.push({"action": SEEK, "player": player_id, "rating": rating, "time_control_type": 1, "created_at": 0})
+    queue.push({"action": CANCEL, "player": 2})
+
+    assert await matchmaker.run_pending(now=1) == 1
+    assert games == [(1, 3)]
+    assert len(matchmaker.pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_matchmaker_drops_pool_when_lease_is_lost():
+    class FollowerQueue(InMemorySeekQueue):
+        def acquire_leadership(self, node_id, ttl=0):
+            return False
+
+    matchmaker = Matchmaker(FollowerQueue(), None, SeekPool(initial_window=100), tick=0.01)
+    matchmaker.pool.add(Seek(1, 1500, 1, 0), now=0)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(matchmaker.run_forever(), timeout=0.05)
+
+    assert len(matchmaker.pool) == 0
+    assert matchmaker.pool.add(Seek(2, 1500, 1, 0), now=0) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+@patch('api.broadcast.services.CreateSession.do_request', return_value=12345)
+@patch('api.broadcast.services.CreateData.do_request', return_value=12345)
+@patch('api.broadcast.services.CreateRoom.do_request', return_value=12345)
+async def test_create_matched_game_notifies_players(create_room, create_data, create_session, users):
+    player, opponent = users
+    time_control_type = await sync_to_async(TimeControlType.objects.create)(name="blitz", time=300, additional_time=2)
+    layer = get_channel_layer()
+    channels = {}
+    for user in users:
+        channels[user.pk] = await layer.new_channel()
+        await layer.group_add(matchmaking_group_name(user.pk), channels[user.pk])
+
+    game = await sync_to_async(services.create_matched_game)(player.pk, opponent.pk, time_control_type.pk)
+
+    assert (game.white_player_id, game.black_player_id) == (player.pk, opponent.pk)
+    assert game.time_control_type_id == time_control_type.pk
+    message = await layer.receive(channels[opponent.pk])
+    assert (message["game"], message["color"]) == (str(game.uuid), "black")
+
+
+@pytest.mark.django_db
+def test_seek_view(users):
+    player, _ = users
+    get_seek_queue.cache_clear()
+    time_control_type = TimeControlType.objects.create(name="blitz", time=300, additional_time=2)
+    client = APIClient()
+
+    assert client.post("/api/game/seek/", {"time_control_type": time_control_type.pk}).status_code in (401, 403)
+
+    client.force_authenticate(user=player)
+    assert client.post("/api/game/seek/", {"time_control_type": time_control_type.pk}).status_code == 202
+    assert client.delete("/api/game/seek/").status_code == 204
+
+    seek, cancel = get_seek_queue().pop(0)
+    assert (seek["action"], seek["player"], seek["rating"], seek["time_control_type"]) == (
+        SEEK, player.pk, 1200, time_control_type.pk)
+    assert cancel == {"action": CANCEL, "player": player.pk}
+    get_seek_queue.cache_clear()
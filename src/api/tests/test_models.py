@@ -1,8 +1,11 @@
+from datetime import timedelta
+
 import pytest
 import chess
 
 from api import services
-from api.models import Board, Result
+from api.models import Board, Game, Result
+from core.tournament.models import TimeControlType
 'Do not remove the import below!'
 from fixtures import users, game_instance
 
@@ -48,3 +51,63 @@ def test_result_invalid_finished(users):
         {}, {}, white_player=player, black_player=opponent)
 
     assert not game.result.finished
+
+
+@pytest.mark.django_db
+def test_time_remaining_without_queries(users, django_assert_num_queries):
+    player, opponent = users
+    time_control_type = TimeControlType.objects.create(name='blitz', time=300, additional_time=2)
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent, time_control_type=time_control_type)
+    services.move_piece(game.board, 'e2', 'e4', player)
+    game = Game.objects.select_related('board', 'time_control_type').get(uuid=game.uuid)
+    game.white_player_time_spent = 10
+
+    with django_assert_num_queries(0):
+        assert game.white_player_time_remaining == 300 - 10 + 2
+        assert game.black_player_time_remaining == 300
+
+
+def test_ply_and_moves_made_from_position_with_black_to_move():
+    chess_board = chess.Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1")
+    board = Board(starting_fen=chess_board.fen())
+    for uci in ("e7e5", "g1f3", "b8c6"):
+        move = chess.Move.from_uci(uci)
+        chess_board.push(move)
+        board.add_move(move)
+    board.turn = chess_board.turn
+    game = Game(board=board)
+
+    assert board.ply == 3
+    assert (game.moves_made('white'), game.moves_made('black')) == (1, 2)
+
+
+@pytest.mark.django_db
+def test_flag_fallen_color(users):
+    player, opponent = users
+    time_control_type = TimeControlType.objects.create(name='bullet', time=60)
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent, time_control_type=time_control_type)
+    services.move_piece(game.board, 'e2', 'e4', player)
+    game = Game.objects.get(uuid=game.uuid)
+
+    assert game.flag_fallen_color() is None
+    assert game.flag_fallen_color(game.last_move_at + timedelta(seconds=61)) == 'black'
+
+
+def test_board_add_san():
+    board = Board()
+    board.add_san('e4')
+    board.turn = False
+    board.add_san('e5')
+    board.turn, board.fullmove_number = True, 2
+    board.add_san('Nf3')
+
+    assert board.movetext == '1. e4 e5 2. Nf3'
+
+
+def test_board_add_san_black_to_move():
+    board = Board(turn=False, fullmove_number=5)
+    board.add_san('Kg7')
+
+    assert board.movetext == '5... Kg7'
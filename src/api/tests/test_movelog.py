@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+import chess
+import pytest
+
+from api import movelog, services
+from api.models import Board
+'Do not remove the import below!'
+from fixtures import users
+
+MOVES = [chess.Move.from_uci(uci) for uci in ("e2e4", "e7e5", "g1f3", "a7a8q", "b2b1n")]
+
+
+def test_pack_move_round_trip():
+    for move in MOVES:
+        assert movelog.unpack_move(movelog.pack_move(move)) == move
+    assert movelog.pack_move(chess.Move.from_uci("h7h8q")) < 2 ** 16
+
+
+def test_append_matches_encode():
+    started = datetime(2021, 3, 14, 12, tzinfo=timezone.utc)
+    times = [started + timedelta(seconds=seconds) for seconds in (0, 3, 4.5, 60, 61)]
+
+    log = b""
+    for move, at in zip(MOVES, times):
+        log = movelog.append(log, move, at)
+
+    assert log == movelog.encode(MOVES, times)
+    assert len(log) == movelog.HEADER.size + movelog.RECORD.size * len(MOVES)
+    assert movelog.length(log) == len(MOVES)
+    assert movelog.decode_moves(log) == MOVES
+    assert movelog.decode_times(log) == times
+
+
+def test_log_without_times():
+    log = movelog.encode(MOVES)
+
+    assert movelog.decode_moves(log) == MOVES
+    assert movelog.decode_times(log) == [None] * len(MOVES)
+    assert movelog.decode_moves(b"") == []
+
+
+@pytest.mark.django_db
+def test_board_rebuilt_from_move_log(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    for uci, user in (("e2e4", player), ("e7e5", opponent), ("g1f3", player)):
+        services.commit_move(game.uuid, uci[:2], uci[2:], user)
+    services.live_boards.delete(game.uuid)
+
+    board = Board.objects.get(game_uuid=game.uuid)
+    chess_board = services.chess_board_from_board(board)
+
+    assert [move.uci() for move in chess_board.move_stack] == ["e2e4", "e7e5", "g1f3"]
+    assert chess_board.fen() == board.fen
@@ -0,0 +1,121 @@
+import io
+from unittest import mock
+
+import datetime
+
+import chess
+import chess.pgn
+import pytest
+from api import pgn_import, services
+from api.models import Game, RatingHistory, Result
+from django.core.management import call_command
+from django.utils import timezone
+'Do not remove the import below!'
+from fixtures import users
+
+MORPHY_PGN = "docs/pgn/Morphy.pgn"
+
+GAMES_PGN = """[Event "Casual"]
+[Date "2020.05.17"]
+[White "walterwhite"]
+[Black "Stranger"]
+[Result "0-1"]
+
+1. f3 e5 2. g4 Qh4# 0-1
+
+[Event "Broken"]
+[Result "*"]
+
+1. e4 e5 2. Ke3 *
+
+[Event "Promotion"]
+[Result "*"]
+
+1. h4 g5 2. hxg5 h6 3. gxh6 Nf6 4. h7 Rg8 5. hxg8=Q *
+"""
+
+
+def test_split_games():
+    with open(MORPHY_PGN, encoding="utf-8-sig", errors="replace") as handle:
+        assert sum(1 for _ in pgn_import.split_games(handle)) == 211
+
+    assert len(list(pgn_import.split_games(io.StringIO(GAMES_PGN)))) == 3
+
+
+def test_split_games_keeps_wrapped_comment():
+    text = """[Event "Clocks"]
+[Result "1-0"]
+
+1. e4 { thinking
+[%clk 0:01:00]} e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+[Event "Next"]
+[Result "*"]
+
+1. d4 *
+"""
+    games = list(pgn_import.split_games(io.StringIO(text)))
+
+    assert len(games) == 2
+    assert pgn_import.parse_game(games[0])["movetext"].endswith("4. Qxf7#")
+
+
+def test_parse_game_skips_illegal_moves():
+    broken = list(pgn_import.split_games(io.StringIO(GAMES_PGN)))[1]
+
+    assert pgn_import.parse_game(broken) is None
+
+
+@pytest.mark.django_db
+def test_import_pgn(users, tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text(GAMES_PGN)
+    progress = mock.MagicMock()
+
+    with mock.patch("channels.layers.InMemoryChannelLayer.group_send") as group_send:
+        stats = pgn_import.import_pgn(path, batch_size=1, workers=0, progress=progress, match_players=True)
+
+    group_send.assert_not_called()
+    assert (stats["imported"], stats["skipped"]) == (2, 1)
+    assert progress.call_count == 2
+
+    game = Game.objects.with_related().get(board__movetext__startswith="1. f3")
+    assert game.white_player == users[0]
+    assert game.black_player is None
+    assert not game.rated
+    assert game.result.result == Result.BLACK_WINS
+    assert game.board.fen == "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3"
+    assert game.pgn.endswith("1. f3 e5 2. g4 Qh4# 0-1")
+
+    promotion = Game.objects.get(board__movetext__endswith="hxg8=Q")
+    assert promotion.result.result == Result.IN_PROGRESS
+    assert promotion.board.move_stack[-1] == chess.Move.from_uci("h7g8q")
+
+
+@pytest.mark.django_db
+def test_import_pgn_leaves_ratings_alone(users, tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text(GAMES_PGN.replace('"Stranger"', f'"{users[1].username}"'))
+
+    pgn_import.import_pgn(path, workers=0)
+    game = Game.objects.get(board__movetext__startswith="1. f3")
+    assert (game.white_player, game.black_player) == (None, None)
+
+    Game.objects.all().delete()
+    pgn_import.import_pgn(path, workers=0, match_players=True)
+
+    assert services.recalculate_ratings(timezone.make_aware(datetime.datetime(2020, 1, 1))) == 0
+    assert not RatingHistory.objects.exists()
+
+
+@pytest.mark.django_db
+def test_import_pgn_command_with_workers():
+    out = io.StringIO()
+    call_command("import_pgn", MORPHY_PGN, "--batch-size=100", "--workers=2", stdout=out)
+
+    assert Game.objects.count() == 211
+    assert "211 games imported, 0 skipped" in out.getvalue()
+
+    game = Game.objects.with_related().get(board__movetext__startswith="1. e4 e5 2. Bc4 f5 3. exf5")
+    assert game.result.result == Result.WHITE_WINS
+    assert game.started_at is None
+    assert game.board.movetext.endswith("30. Kh1 Qc1+ 31. Bg1")
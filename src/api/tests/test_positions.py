@@ -0,0 +1,100 @@
+import io
+import random
+
+import chess
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from api import movelog, pgn_import, positions, services
+from api.models import Board, BoardPosition, Game, Result
+'Do not remove the import below!'
+from fixtures import users
+
+# рокировки, взятие на проходе и превращение
+SPECIAL_MOVES = "e2e4 d7d5 e4e5 f7f5 e5f6 g8h6 f6g7 e8f7 g7h8q b8c6 g1f3 c8e6 f1e2 d8d6 e1g1".split()
+
+
+def test_push_matches_full_hash():
+    random.seed(2021)
+    for _ in range(20):
+        chess_board = chess.Board()
+        key = positions.position_key(chess_board)
+        while not chess_board.is_game_over() and len(chess_board.move_stack) < 200:
+            key = positions.push(chess_board, random.choice(list(chess_board.legal_moves)), key)
+            assert key == positions.position_key(chess_board)
+
+
+def test_replay_special_moves():
+    chess_board = chess.Board()
+    expected = [positions.position_key(chess_board)]
+    moves = []
+    for uci in SPECIAL_MOVES:
+        moves.append(chess_board.parse_uci(uci))
+        chess_board.push(moves[-1])
+        expected.append(positions.position_key(chess_board))
+
+    assert positions.replay(moves) == expected
+    assert all(-2 ** 63 <= key < 2 ** 63 for key in expected)
+
+
+@pytest.mark.django_db
+def test_threefold_repetition_draws_game(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+
+    shuffle = [("g1f3", player), ("g8f6", opponent), ("f3g1", player), ("f6g8", opponent)]
+    for uci, user in shuffle * 2:
+        assert Game.objects.get(uuid=game.uuid).result.result != Result.DRAW
+        services.commit_move(game.uuid, uci[:2], uci[2:], user)
+
+    game = Game.objects.get(uuid=game.uuid)
+    assert game.result.result == Result.DRAW
+    assert list(game.board.positions.filter(zobrist=positions.position_key(chess.Board()))
+                .values_list("ply", flat=True)) == [0, 4, 8]
+
+
+@pytest.mark.django_db
+def test_find_games_by_fen(users):
+    player, opponent = users
+    sicilian = services.create_game({}, {}, white_player=player, black_player=opponent)
+    for uci, user in (("e2e4", player), ("c7c5", opponent)):
+        services.commit_move(sicilian.uuid, uci[:2], uci[2:], user)
+    services.create_game({}, {}, white_player=player, black_player=opponent)
+
+    client = APIClient()
+    fen = "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 7"
+    response = client.get("/api/game/position/", {"fen": fen})
+
+    assert response.status_code == 200
+    assert response.data["count"] == 1
+    assert response.data["results"][0]["uuid"] == str(sicilian.uuid)
+    assert client.get("/api/game/position/", {"fen": chess.STARTING_FEN}).data["count"] == 2
+    assert client.get("/api/game/position/", {"fen": "not a fen"}).status_code == 422
+
+
+@pytest.mark.django_db
+def test_index_positions_command():
+    moves = [chess.Move.from_uci(uci) for uci in ("d2d4", "d7d5", "c2c4")]
+    board = Board.objects.create(move_log=movelog.encode(moves))
+    game = Game.objects.create(board=board, result=Result.objects.create(), broadcast_type=Game.NONE)
+    out = io.StringIO()
+
+    call_command("index_positions", "--workers=0", stdout=out)
+
+    board.refresh_from_db()
+    assert board.zobrist == positions.replay(moves)[-1]
+    assert board.positions.count() == 4
+    assert list(services.find_games_by_fen("rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2")) == [game]
+    assert "1 boards indexed" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_import_pgn_indexes_positions():
+    text = "[Event \"Casual\"]\n[Result \"0-1\"]\n\n1. f3 e5 2. g4 Qh4# 0-1\n"
+    pgn_import.save_games([pgn_import.parse_game(text)])
+
+    game = Game.objects.get()
+    assert game.board.positions.count() == 5
+    assert game.board.zobrist == game.board.positions.get(ply=4).zobrist
+    assert BoardPosition.objects.filter(zobrist=game.board.zobrist).count() == 1
@@ -0,0 +1,55 @@
+import pytest
+from api import services
+from api.views import GameViewSet
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+'Do not remove the import below!'
+from fixtures import users
+
+factory = APIRequestFactory()
+
+# count, games
+GAME_LIST_QUERIES = 2
+
+
+def create_games(users, amount):
+    player, opponent = users
+    for _ in range(amount):
+        game = services.create_game({}, {}, white_player=player, black_player=opponent)
+        services.commit_move(game.uuid, 'e2', 'e4', player)
+        services.commit_move(game.uuid, 'e7', 'e5', opponent)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('amount', [1, 5])
+def test_game_list_query_budget(users, amount, ):
+    create_games(users, amount)
+    request = factory.get('/chess/game/')
+    force_authenticate(request, users[0])
+
+    with CaptureQueriesContext(connection) as context:
+        response = GameViewSet.as_view({'get': 'list'})(request)
+        response.render()
+
+    assert len(context.captured_queries) == GAME_LIST_QUERIES, [query['sql'] for query in context.captured_queries]
+
+    assert response.status_code == 200
+    assert len(response.data['results']) == amount
+    assert response.data['results'][0]['pgn'].endswith('1. e4 e5 *')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('amount', [1, 5])
+def test_unfinished_games_query_budget(users, amount, ):
+    create_games(users, amount)
+    request = factory.get('/chess/game/get_unfinished_games/')
+    force_authenticate(request, users[1])
+
+    with CaptureQueriesContext(connection) as context:
+        response = GameViewSet.as_view({'get': 'get_unfinished_games'})(request)
+        response.render()
+
+    assert len(context.captured_queries) == GAME_LIST_QUERIES, [query['sql'] for query in context.captured_queries]
+
+    assert len(response.data['results']) == amount
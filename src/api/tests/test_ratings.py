@@ -0,0 +1,61 @@
+import random
+import time
+
+import pytest
+
+from api.ratings import Glicko2, Rating, get_rating_system
+
+
+def test_glicko2_paper_example():
+    """
+    Пример из http://www.glicko.net/glicko/glicko2.pdf
+    """
+    ratings = {
+        "player": Rating(1500, 200, 0.06),
+        "first": Rating(1400, 30, 0.06),
+        "second": Rating(1550, 100, 0.06),
+        "third": Rating(1700, 300, 0.06),
+    }
+    games = [("player", "first", 1), ("second", "player", 1), ("player", "third", 0)]
+
+    player = Glicko2(tau=0.5).rate_period(ratings, games)["player"]
+
+    assert player.rating == pytest.approx(1464.06, abs=0.01)
+    assert player.deviation == pytest.approx(151.52, abs=0.01)
+    assert player.volatility == pytest.approx(0.05999, abs=0.00001)
+
+
+def test_glicko2_inactive_player_deviation_grows():
+    system = Glicko2()
+    ratings = system.rate_period({"idle": Rating(1700, 60, 0.06)}, [])
+
+    assert ratings["idle"].rating == 1700
+    assert 60 < ratings["idle"].deviation < 61
+
+
+def test_glicko2_deviation_is_capped():
+    system = Glicko2()
+
+    assert system.rate_period({"new": system.initial()}, [])["new"] == system.initial()
+
+
+def test_glicko2_rate_single_game():
+    system = get_rating_system("glicko2")
+    winner = system.rate(system.initial(), system.initial(), 1)
+    loser = system.rate(system.initial(), system.initial(), 0)
+
+    assert winner.rating == pytest.approx(1662.31, abs=0.01)
+    assert winner.rating - 1500 == pytest.approx(1500 - loser.rating)
+    assert winner.deviation == pytest.approx(290.32, abs=0.01)
+
+
+def test_glicko2_period_is_fast():
+    random.seed(0)
+    players = list(range(5000))
+    games = [(*random.sample(players, 2), random.choice((0, 0.5, 1))) for _ in range(100000)]
+
+    started = time.monotonic()
+    ratings = Glicko2().rate_period({}, games)
+
+    assert len(ratings) == len(players)
+    assert time.monotonic() - started < 10
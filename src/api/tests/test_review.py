@@ -0,0 +1,145 @@
+import io
+
+import chess
+import chess.pgn
+import pytest
+from django.core.management import call_command
+
+from api import services
+from api.analysis import review
+from api.analysis.cache import get_eval_cache
+from api.models import GameAnalysis
+from core.tournament.models import Match, Tour, Tournament
+'Do not remove the import below!'
+from fixtures import users
+
+# 2. ...Qh4 is the engine's move, 3. g4 walks into mate
+FOOLS_MATE = ("f2f3", "e7e5", "g2g4", "d8h4")
+
+
+def _evaluation(cp, best=None, mate=None):
+    return {"depth": 4, "cp": cp, "mate": mate, "best": best, "pv": [best] if best else []}
+
+
+@pytest.fixture(autouse=True)
+def eval_cache():
+    get_eval_cache.cache_clear()
+    yield get_eval_cache()
+    get_eval_cache.cache_clear()
+
+
+@pytest.fixture
+def tournament_games(users):
+    player, opponent = users
+    tournament = Tournament.objects.create(name="Open", short_description="", description="")
+    match = Match.objects.create(
+        tour=Tour.objects.create(tournament=tournament), first_player=player, second_player=opponent
+    )
+    games = []
+    for _ in range(2):
+        game = services.create_game({}, {}, white_player=player, black_player=opponent)
+        for counter, uci in enumerate(FOOLS_MATE):
+            services.commit_move(game.uuid, uci[:2], uci[2:], player if counter % 2 == 0 else opponent)
+        match.games.add(game)
+        games.append(game)
+    # not finished
+    match.games.add(services.create_game({}, {}, white_player=player, black_player=opponent))
+    return tournament, games
+
+
+def test_review_moves_flags_losses():
+    moves = [chess.Move.from_uci(uci) for uci in ("e2e4", "e7e5", "d1h5", "g8f6")]
+    evaluations = [
+        _evaluation(20, "e2e4"), _evaluation(20, "g1f3"), _evaluation(30, "b1c3"),
+        _evaluation(-50, "g7g6"), _evaluation(400),
+    ]
+
+    reviewed = review.review_moves(moves, evaluations)
+
+    assert [entry["loss"] for entry in reviewed] == [0, 10, 80, 450]
+    assert [entry["nag"] for entry in reviewed] == [None, None, chess.pgn.NAG_DUBIOUS_MOVE, chess.pgn.NAG_BLUNDER]
+    assert reviewed[0]["accuracy"] == 100.0
+    assert reviewed[3]["accuracy"] < 50
+
+    stats = review.summary(reviewed)
+    assert (stats["white"]["acpl"], stats["white"]["inaccuracies"], stats["white"]["blunders"]) == (40, 1, 0)
+    assert (stats["black"]["acpl"], stats["black"]["inaccuracies"], stats["black"]["blunders"]) == (230, 0, 1)
+
+
+def test_review_moves_from_position_with_black_to_move():
+    fen = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+    moves = [chess.Move.from_uci(uci) for uci in ("e7e5", "d1h5")]
+    evaluations = [_evaluation(20, "c7c5"), _evaluation(400, "g1f3"), _evaluation(400)]
+
+    reviewed = review.review_moves(moves, evaluations, fen)
+
+    assert [entry["color"] for entry in reviewed] == ["black", "white"]
+    assert [entry["loss"] for entry in reviewed] == [380, 0]
+
+
+def test_annotate_writes_nags_and_eval_comments():
+    moves = [chess.Move.from_uci(uci) for uci in FOOLS_MATE]
+    evaluations = [
+        _evaluation(20, "e2e4"), _evaluation(-60, "e7e5"), _evaluation(-60, "d2d4"),
+        _evaluation(-9999, "d8h4", mate=-1), _evaluation(-10000, mate=0),
+    ]
+    reviewed = review.review_moves(moves, evaluations)
+
+    pgn = review.annotate([("White", "a"), ("Result", "0-1")], moves, evaluations, reviewed)
+
+    assert '[White "a"]' in pgn
+    assert "1. f3 $6 { [%eval -0.60] Inaccuracy. e4 was best. }" in pgn
+    assert "2. g4 $4 { [%eval #-1] Blunder. d4 was best. } 2... Qh4# 0-1" in pgn
+
+
+def test_evaluate_skips_cached_positions(eval_cache):
+    class Engine:
+        calls = []
+
+        def analyse(self, fen, depth):
+            self.calls.append(fen)
+            return _evaluation(0)
+
+    engine = Engine()
+    eval_cache.set(1, 4, _evaluation(10))
+
+    evaluations = review.evaluate(["first", "second", "second"], [1, 2, 2], 4, engine, eval_cache)
+
+    assert [evaluation["cp"] for evaluation in evaluations] == [10, 0, 0]
+    assert engine.calls == ["second"]
+    assert eval_cache.get(2, 4)["cp"] == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("workers", [0, 2])
+def test_analyse_tournament(tournament_games, workers, eval_cache):
+    tournament, games = tournament_games
+    progress = []
+
+    analysed = services.analyse_tournament(
+        tournament, depth=4, workers=workers, progress=lambda done, total: progress.append((done, total))
+    )
+
+    assert analysed == 2
+    assert progress == [(1, 2), (2, 2)]
+    analysis = GameAnalysis.objects.get(game=games[0])
+    assert analysis.depth == 4
+    assert analysis.white_blunders == 1
+    assert analysis.black_blunders == 0
+    assert analysis.black_accuracy == 100.0
+    assert '[Event "Open"]' in analysis.pgn
+    assert "Qh4#" in analysis.pgn
+
+    # already analysed games are skipped
+    assert services.analyse_tournament(tournament, depth=4, workers=workers) == 0
+
+
+@pytest.mark.django_db
+def test_analyse_games_command(tournament_games):
+    tournament, _ = tournament_games
+    out = io.StringIO()
+
+    call_command("analyse_games", f"--tournament={tournament.pk}", "--depth=4", "--workers=0", stdout=out)
+
+    assert "2/2 games analysed" in out.getvalue()
+    assert GameAnalysis.objects.count() == 2
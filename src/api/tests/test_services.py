@@ -1,3 +1,4 @@
+import io
 from unittest import mock
 from unittest.mock import patch
 
@@ -6,9 +7,15 @@ import chess.pgn
 import pytest
 from api import services
 from api.broadcast.services import AbstractCreateBroadcast
-from api.models import Board, Game, Result
+from api.models import Board, Elo, Game, PlayerRating, RatingHistory, Result
+from api.serializers import EloRatingsSerializer
 from api.services import create_broadcast_for_game
 from core.tournament.models import TimeControlType
+from core.users.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
 import time
 import datetime
 'Do not remove the import below!'
@@ -169,37 +176,6 @@ def test_update_elo_white_wins(users, game_instance):
     assert opponent.elo.wins == 0
 
 
-@pytest.mark.django_db
-def test_set_start_datetime(users):
-    player, opponent = users
-    time_control_type = TimeControlType.objects.create(name='test time control type', )
-    game = services.create_game(
-        {}, {}, white_player=player,
-        black_player=opponent,
-        time_control_type=time_control_type,
-    )
-    services.start_game(game.uuid)
-    assert Game.objects.get(uuid=game.uuid).created_at
-    assert Game.objects.get(uuid=game.uuid).result.result == Result.IN_PROGRESS
-
-
-@pytest.mark.django_db
-def test_is_exist_move(users):
-    player, opponent = users
-    game = services.create_game(
-        {}, {}, white_player=player, black_player=opponent)
-    services.move_piece(game.board, 'e2', 'e4', player)
-    assert services.is_exist_move(game.uuid)
-
-
-@pytest.mark.django_db
-def test_is_not_exist_move(users):
-    player, opponent = users
-    game = services.create_game(
-        {}, {}, white_player=player, black_player=opponent)
-    assert not services.is_exist_move(game.uuid)
-
-
 @pytest.mark.django_db
 def test_create_broadcast_for_game(users):
     player, opponent = users
@@ -236,25 +212,6 @@ def test_agree_to_draw(users):
     assert result
 
 
-@pytest.mark.django_db
-def test_check_threefold_repetition(users):
-    player, opponent = users
-    game = services.create_game(
-        {}, {}, white_player=player, black_player=opponent, started_at=datetime.datetime.now())
-    white_square_first = 'b1'
-    white_square_second = 'c3'
-
-    black_square_first = 'b8'
-    black_square_second = 'a6'
-
-    for i in range(2):
-        services.move_piece(game.board, white_square_first, white_square_second, player)
-        services.move_piece(game.board, black_square_first, black_square_second, opponent)
-        services.move_piece(game.board, white_square_second, white_square_first, player)
-        services.move_piece(game.board, black_square_second, black_square_first, opponent)
-    assert services.check_threefold_repetition(game)
-
-
 @pytest.mark.django_db
 def test_draw_game(users):
     player, opponent = users
@@ -278,3 +235,273 @@ def test_repeat_game(users):
 
     assert new_game.black_player == game.white_player
     assert new_game.white_player == game.black_player
+
+
+@pytest.mark.django_db(transaction=True)
+def test_commit_move(users):
+    player, opponent = users
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent)
+
+    with patch('api.services.send_game_data_to_group', new_callable=mock.AsyncMock) as send_mock:
+        move, game_data = services.commit_move(game.uuid, 'e2', 'e4', player)
+
+    send_mock.assert_called_once()
+    _, sent_game_data, move_data = send_mock.call_args[0]
+    assert sent_game_data is game_data
+    assert move_data['seq'] == 1
+    assert move_data['san'] == 'e4'
+    assert move == chess.Move.from_uci('e2e4')
+    assert game_data['result']['result'] == Result.IN_PROGRESS
+    assert game_data['board']['fen'] == Game.objects.get(uuid=game.uuid).board.fen
+
+
+@pytest.mark.django_db
+def test_commit_move_illegal(users):
+    player, opponent = users
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent)
+
+    assert services.commit_move(game.uuid, 'e2', 'e5', player) == (None, None)
+    assert Game.objects.get(uuid=game.uuid).board.ply == 0
+
+
+@pytest.mark.django_db
+def test_commit_move_finishes_game(users):
+    player, opponent = users
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent)
+
+    for counter, uci in enumerate(['f2f3', 'e7e5', 'g2g4', 'd8h4']):
+        user = player if counter % 2 == 0 else opponent
+        _, game_data = services.commit_move(game.uuid, uci[:2], uci[2:], user)
+
+    assert game_data['result']['result'] == Result.BLACK_WINS
+    assert game_data['finished_at']
+    assert Game.objects.get(uuid=game.uuid).result.result == Result.BLACK_WINS
+
+
+@pytest.mark.django_db
+def test_record_move_time(users):
+    player, opponent = users
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent)
+    game.last_move_at = timezone.now()
+
+    services.record_move_time(game, 'black', game.last_move_at + datetime.timedelta(seconds=7))
+
+    assert game.black_player_time_spent == 7
+    assert game.white_player_time_spent == 0
+
+    services.record_move_time(game, 'white', game.last_move_at + datetime.timedelta(milliseconds=400))
+    services.record_move_time(game, 'black', game.last_move_at + datetime.timedelta(milliseconds=700))
+
+    assert game.white_player_time_spent == 0.4
+    assert game.black_player_time_spent == 7.7
+
+
+@pytest.mark.django_db
+def test_commit_move_time_forfeit(users):
+    player, opponent = users
+    time_control_type = TimeControlType.objects.create(name='bullet', time=60)
+    game = services.create_game(
+        {}, {}, white_player=player, black_player=opponent, time_control_type=time_control_type)
+    services.commit_move(game.uuid, 'e2', 'e4', player)
+    Game.objects.filter(uuid=game.uuid).update(last_move_at=timezone.now() - datetime.timedelta(seconds=61))
+
+    move, game_data = services.commit_move(game.uuid, 'e7', 'e5', opponent)
+
+    assert move is None
+    assert game_data['result'] == {'result': Result.WHITE_WINS, 'termination': Result.TIME_FORFEIT}
+
+
+@pytest.mark.django_db
+def test_stored_pgn_matches_python_chess(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    chess_board = chess.Board()
+    for uci, user in (('f2f3', player), ('e7e5', opponent), ('g2g4', player), ('d8h4', opponent)):
+        services.commit_move(game.uuid, uci[:2], uci[2:], user)
+        chess_board.push_uci(uci)
+
+    game = Game.objects.with_related().get(uuid=game.uuid)
+    exported = chess.pgn.Game.from_board(chess_board)
+
+    assert game.pgn.endswith(f'\n\n{exported.accept(chess.pgn.StringExporter(headers=False))}')
+    assert f'[White "{player.username}"]' in game.pgn
+    assert '[Result "0-1"]' in game.pgn
+    assert game.board.move_stack == chess_board.move_stack
+    assert len(game.board.move_times) == 4
+
+
+@pytest.mark.django_db
+def test_stream_pgn(users):
+    player, opponent = users
+    time_control_type = TimeControlType.objects.create(name='blitz', time=300, additional_time=2)
+    first = services.create_game({}, {}, white_player=player, black_player=opponent,
+                                 time_control_type=time_control_type)
+    services.create_game({}, {}, white_player=opponent, black_player=player)
+    for uci, user in (('f2f3', player), ('e7e5', opponent), ('g2g4', player), ('d8h4', opponent)):
+        services.commit_move(first.uuid, uci[:2], uci[2:], user)
+
+    chunks = list(services.stream_pgn(Game.objects.filter(white_player=player)))
+
+    assert len(chunks) == 1
+    player.elo.refresh_from_db()
+    assert f'[WhiteElo "{player.elo.rating}"]' in chunks[0]
+    assert '[TimeControl "300+2"]' in chunks[0]
+    assert f'[Termination "{Result.NORMAL}"]' in chunks[0]
+    assert chunks[0].endswith('1. f3 e5 2. g4 Qh4# 0-1\n\n')
+
+
+@pytest.mark.django_db
+def test_export_finished_games_only(users):
+    player, opponent = users
+    finished = services.create_game({}, {}, white_player=player, black_player=opponent)
+    for uci, user in (('f2f3', player), ('e7e5', opponent), ('g2g4', player), ('d8h4', opponent)):
+        services.commit_move(finished.uuid, uci[:2], uci[2:], user)
+    unfinished = services.create_game({}, {}, white_player=opponent, black_player=player)
+    services.commit_move(unfinished.uuid, 'd2', 'd4', opponent)
+    client = APIClient()
+
+    assert client.get('/api/game/export/', {'user': player.pk}).status_code == 403
+
+    client.force_authenticate(opponent)
+    response = client.get('/api/game/export/', {'user': player.pk})
+
+    assert response.status_code == 200
+    pgn = b''.join(response.streaming_content).decode()
+    assert pgn.count('[Event ') == 1
+    assert pgn.endswith('1. f3 e5 2. g4 Qh4# 0-1\n\n')
+
+
+@pytest.mark.django_db
+def test_pgn_from_custom_position_with_escaped_headers(users):
+    player, opponent = users
+    fen = '4k3/8/8/8/8/8/4P3/4K3 w - - 0 1'
+    board = Board.from_fen(fen)
+    board.save()
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    Game.objects.filter(uuid=game.uuid).update(board=board)
+    board.game_uuid = game.uuid
+    board.save()
+    services.commit_move(game.uuid, 'e2', 'e4', player)
+
+    game = Game.objects.with_related().get(uuid=game.uuid)
+    pgn = game.to_pgn(event='Cup "Open" \\ 2020')
+    parsed = chess.pgn.read_game(io.StringIO(pgn))
+
+    assert '[Event "Cup \\"Open\\" \\\\ 2020"]' in pgn
+    assert parsed.headers['SetUp'] == '1'
+    assert parsed.headers['FEN'] == fen
+    assert not parsed.errors
+    assert [move.uci() for move in parsed.mainline_moves()] == ['e2e4']
+
+
+def _finished_game(white, black, result, finished_at, time_control_type=None):
+    return Game.objects.create(
+        white_player=white,
+        black_player=black,
+        result=Result.objects.create(result=result, termination=Result.NORMAL),
+        finished_at=finished_at,
+        time_control_type=time_control_type,
+        broadcast_type=Game.NONE,
+    )
+
+
+@pytest.mark.django_db
+def test_update_elo_writes_history(users):
+    player, opponent = users
+    game = _finished_game(player, opponent, Result.WHITE_WINS, timezone.now())
+
+    services.update_elo(game)
+
+    assert list(RatingHistory.objects.filter(game=game).values_list('player', 'rating', 'delta')) == [
+        (player.pk, 1216, 16), (opponent.pk, 1184, -16)]
+    elo = Elo.objects.get(player=player)
+    assert (elo.rating, elo.previous_rating, elo.wins) == (1216, 1200, 1)
+
+
+@pytest.mark.django_db
+def test_recalculate_ratings_after_adjudication(users):
+    player, opponent = users
+    started = timezone.now() - datetime.timedelta(days=1)
+    first = _finished_game(player, opponent, Result.WHITE_WINS, started)
+    second = _finished_game(player, opponent, Result.DRAW, started + datetime.timedelta(hours=1))
+    services.update_elo(first)
+    services.update_elo(second)
+
+    Result.objects.filter(game=first).update(result=Result.BLACK_WINS)
+    assert services.recalculate_ratings(started) == 2
+
+    white, black = Elo.objects.get(player=player), Elo.objects.get(player=opponent)
+    assert (white.rating, black.rating) == (1186, 1214)
+    assert (white.wins, white.losses, white.draws) == (0, 1, 1)
+    assert (black.wins, black.losses, black.draws) == (1, 0, 1)
+    assert list(RatingHistory.objects.filter(player=player).values_list('rating', flat=True)) == [1184, 1186]
+
+
+@pytest.mark.django_db
+def test_recalculate_ratings_queries_do_not_grow_with_players(users):
+    player, opponent = users
+    started = timezone.now() - datetime.timedelta(days=1)
+    services.update_elo(_finished_game(player, opponent, Result.WHITE_WINS, started - datetime.timedelta(hours=1)))
+    services.update_elo(_finished_game(player, opponent, Result.DRAW, started))
+
+    with CaptureQueriesContext(connection) as two_players:
+        assert services.recalculate_ratings(started) == 1
+    assert list(RatingHistory.objects.filter(player=player).values_list('rating', flat=True)) == [1216, 1214]
+
+    others = [User.objects.create(username=f'player_{i}', email=f'player_{i}@example.com') for i in range(4)]
+    for white, black in zip(others[::2], others[1::2]):
+        _finished_game(white, black, Result.WHITE_WINS, started)
+    with CaptureQueriesContext(connection) as six_players:
+        assert services.recalculate_ratings(started) == 3
+
+    assert len(six_players.captured_queries) == len(two_players.captured_queries) + 1
+
+
+@pytest.mark.django_db
+def test_update_elo_updates_category_rating(users):
+    player, opponent = users
+    blitz = TimeControlType.objects.create(name="blitz", time=300, additional_time=0)
+    classical = TimeControlType.objects.create(name="classical", time=5400, additional_time=30)
+
+    services.update_elo(_finished_game(player, opponent, Result.WHITE_WINS, timezone.now(), blitz))
+    services.update_elo(_finished_game(player, opponent, Result.DRAW, timezone.now()))
+
+    assert not PlayerRating.objects.filter(time_control_type=classical).exists()
+    winner = PlayerRating.objects.get(player=player, time_control_type=blitz)
+    loser = PlayerRating.objects.get(player=opponent, time_control_type=blitz)
+    assert (round(winner.rating, 2), round(loser.rating, 2)) == (1662.31, 1337.69)
+    assert (winner.games, loser.games, winner.system) == (1, 1, "glicko2")
+
+    data = EloRatingsSerializer(Elo.objects.get(player=player)).data
+    assert [(rating["time_control_type_name"], rating["games"]) for rating in data["ratings"]] == [("blitz", 1)]
+
+
+@pytest.mark.django_db
+def test_rebuild_category_ratings(users):
+    player, opponent = users
+    blitz = TimeControlType.objects.create(name="blitz", time=300, additional_time=0)
+    started = timezone.now() - datetime.timedelta(days=30)
+    for days, result in ((0, Result.WHITE_WINS), (1, Result.DRAW), (15, Result.WHITE_WINS)):
+        services.update_elo(
+            _finished_game(player, opponent, result, started + datetime.timedelta(days=days), blitz)
+        )
+    _finished_game(player, opponent, Result.DRAW, started, None)
+    live = dict(PlayerRating.objects.filter(time_control_type=blitz).values_list("player", "rating"))
+
+    assert services.rebuild_category_ratings() == 3
+
+    ratings = PlayerRating.objects.filter(time_control_type=blitz)
+    assert sorted(ratings.values_list("games", flat=True)) == [3, 3]
+    winner, loser = ratings.get(player=player), ratings.get(player=opponent)
+    assert winner.rating > 1500 > loser.rating
+    assert winner.rating - 1500 == pytest.approx(1500 - loser.rating)
+    # пересчет дает те же рейтинги, что и подсчет после каждой партии
+    assert winner.rating == pytest.approx(live[player.pk])
+    assert loser.rating == pytest.approx(live[opponent.pk])
+
+    services.rebuild_category_ratings()
+    assert PlayerRating.objects.get(player=player, time_control_type=blitz).rating == pytest.approx(winner.rating)
@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+import pytest
+from django.core import mail
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import services, tasks
+from api.models import Elo, Game, RatingHistory, Result
+from core.utils.tasks import enqueue_on_commit
+'Do not remove the import below!'
+from fixtures import users
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_enqueue_on_commit_once_per_key():
+    with patch.object(tasks.update_game_ratings, "apply_async") as apply_async:
+        with transaction.atomic():
+            enqueue_on_commit(tasks.update_game_ratings, "game")
+            enqueue_on_commit(tasks.update_game_ratings, "game")
+            enqueue_on_commit(tasks.update_game_ratings, "other")
+            apply_async.assert_not_called()
+
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                enqueue_on_commit(tasks.update_game_ratings, "rolled back")
+                raise RuntimeError
+
+    assert [call.kwargs["args"] for call in apply_async.call_args_list] == [("game",), ("other",)]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_process_local_cache_does_not_deduplicate(settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = False
+    with patch.object(tasks.update_game_ratings, "apply_async") as apply_async:
+        enqueue_on_commit(tasks.update_game_ratings, "game")
+        enqueue_on_commit(tasks.update_game_ratings, "game")
+
+    assert apply_async.call_count == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_task_can_be_enqueued_again_once_started():
+    with patch.object(services, "update_game_ratings") as update_game_ratings:
+        enqueue_on_commit(tasks.update_game_ratings, "game")
+        enqueue_on_commit(tasks.update_game_ratings, "game")
+
+    assert update_game_ratings.call_count == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_checkmate_updates_ratings_in_background(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+
+    for from_square, to_square, user in (
+        ("f2", "f3", player), ("e7", "e5", opponent), ("g2", "g4", player), ("d8", "h4", opponent),
+    ):
+        services.commit_move(game.uuid, from_square, to_square, user)
+
+    assert Elo.objects.get(player=opponent).wins == 1
+    assert RatingHistory.objects.filter(game=game).count() == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_ratings_are_updated_once(users):
+    player, opponent = users
+    game = Game.objects.create(
+        white_player=player,
+        black_player=opponent,
+        result=Result.objects.create(result=Result.WHITE_WINS, termination=Result.NORMAL),
+        finished_at=timezone.now(),
+        broadcast_type=Game.NONE,
+    )
+
+    assert services.update_game_ratings(game.uuid)
+    assert not services.update_game_ratings(game.uuid)
+    assert Elo.objects.get(player=player).rating == 1216
+
+
+@pytest.mark.django_db(transaction=True)
+def test_invite_sends_email_after_response(users, settings):
+    settings.EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+    player, _ = users
+    game = services.create_game({}, {}, white_player=player)
+    client = APIClient()
+    client.force_authenticate(user=player)
+
+    response = client.post(f"/api/game/{game.uuid}/invite/", {"email": "friend@example.com"})
+
+    assert response.status_code == 200
+    assert [message.to for message in mail.outbox] == [["friend@example.com"]]
+    assert str(game.uuid) in mail.outbox[0].body
@@ -0,0 +1,78 @@
+"""
+Minimal UCI engine for tests: a two-ply material search
+"""
+import sys
+
+import chess
+
+VALUES = {chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
+
+
+def material(board: chess.Board, color: bool) -> int:
+    return sum(
+        VALUES[piece.piece_type] * (1 if piece.color == color else -1)
+        for piece in board.piece_map().values()
+    )
+
+
+def reply_score(board: chess.Board, color: bool) -> int:
+    if board.is_checkmate():
+        return 100000
+    scores = []
+    for move in board.legal_moves:
+        board.push(move)
+        scores.append(-100000 if board.is_checkmate() else material(board, color))
+        board.pop()
+    return min(scores) if scores else 0
+
+
+def search(board: chess.Board):
+    color = board.turn
+    best, best_score = None, None
+    for move in board.legal_moves:
+        board.push(move)
+        score = reply_score(board, color)
+        board.pop()
+        if best_score is None or score > best_score:
+            best, best_score = move, score
+    return best, best_score
+
+
+def main():
+    board = chess.Board()
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+        if command == "uci":
+            print("id name Stub")
+            print("option name Threads type spin default 1 min 1 max 8")
+            print("option name Hash type spin default 16 min 1 max 1024")
+            print("uciok")
+        elif command == "isready":
+            print("readyok")
+        elif command == "position":
+            moves = tokens.index("moves") if "moves" in tokens else len(tokens)
+            board = chess.Board() if tokens[1] == "startpos" else chess.Board(" ".join(tokens[2:moves]))
+            for uci in tokens[moves + 1:]:
+                board.push_uci(uci)
+        elif command == "go":
+            depth = int(tokens[tokens.index("depth") + 1]) if "depth" in tokens else 2
+            move, score = search(board)
+            if move is None:
+                print(f"info depth {depth} score {'mate 0' if board.is_checkmate() else 'cp 0'}")
+                print("bestmove (none)")
+            elif abs(score) >= 100000:
+                print(f"info depth {depth} score mate {1 if score > 0 else -1} pv {move.uci()}")
+                print(f"bestmove {move.uci()}")
+            else:
+                print(f"info depth {depth} score cp {score} pv {move.uci()}")
+                print(f"bestmove {move.uci()}")
+        elif command == "quit":
+            break
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
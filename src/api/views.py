@@ -1,23 +1,44 @@
 from django.utils.timezone import datetime
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
-from django.db.models import Q
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema, no_body
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 import re
-from django.conf import settings
 
+from core.utils.tasks import enqueue_on_commit
 from . import services
-from .models import Elo, Game
+from .constants import RATING_SYSTEM
+from .leaderboard import get_around, get_leaderboard
+from .models import Elo, Game, PlayerRating, Result
 from .permissions import GamePermission
-from .serializers import CustomTokenObtainPairSerializer, EloSerializer, GameSerializer, GameCreateSerializer, \
-    GameJoinSerializer, GameMoveSerializer, GamePgnSerializer, TokenCreateSerializer, TokenRefreshSerializer
-
-from .services import get_pgn_game_from_uuid, repeat_game
+from .serializers import (
+    AnalysisQuerySerializer,
+    CustomTokenObtainPairSerializer,
+    EloRatingsSerializer,
+    ExplorerSerializer,
+    GameAnalysisSerializer,
+    GameSerializer,
+    GameCreateSerializer,
+    GameJoinSerializer,
+    GameMoveSerializer,
+    GameSeekSerializer,
+    GamePgnSerializer,
+    LeaderboardPositionSerializer,
+    LeaderboardQuerySerializer,
+    LeaderboardSerializer,
+    PositionQuerySerializer,
+    TokenCreateSerializer,
+    TokenRefreshSerializer,
+)
+
+from .services import repeat_game
+from .tasks import send_game_invitation
 
 User = get_user_model()
 
@@ -68,6 +89,10 @@ class GameViewSet(viewsets.ModelViewSet):
         Отображение PGN доски
 
         Отображение истории доски в формате PGN
+    export:
+        Выгрузка партий в PGN
+
+        Все партии пользователя (?user=<id>, по умолчанию текущий) одним PGN-файлом
     claim_draw:
         Предложение ничьи
 
@@ -80,9 +105,28 @@ class GameViewSet(viewsets.ModelViewSet):
         Повторно создать игру
 
         Повторно создать игру
+    position:
+        Поиск партий по позиции
+
+        Партии, в которых встречалась позиция ?fen=<FEN>, счетчики ходов в FEN не учитываются
+    explorer:
+        Дерево дебютов
+
+        Следующие ходы позиции ?fen=<FEN> по всем законченным партиям: число партий,
+        проценты побед белых, ничьих и побед черных, средний рейтинг сделавших ход
+    seek:
+        Поиск соперника
+
+        POST ставит текущего игрока в очередь подбора соперника, DELETE отменяет поиск.
+        О найденной партии игрок узнает через ws/matchmaking/
+    analysis:
+        Разбор партии движком
+
+        Оценки всех позиций законченной партии на глубине ?depth=. Недостающие оценки ставятся
+        в очередь, пока они не готовы, ответ 202 и complete=false
     """
     serializer_class = GameSerializer
-    queryset = Game.objects.all().order_by("-created_at")
+    queryset = Game.objects.with_related().order_by("-created_at")
 
     permission_classes = [GamePermission]
 
@@ -105,12 +149,17 @@ class GameViewSet(viewsets.ModelViewSet):
         self.user = User.objects.filter(username=request.user).first()
         game_uuid = kwargs.get("pk")
         game = get_object_or_404(Game, uuid=game_uuid)
-        board = game.board
         self.check_object_permissions(self.request, game)
-        move = services.move_piece(board, from_square, to_square, self.user)
+        move, game_data = services.commit_move(game.uuid, from_square, to_square, self.user)
 
         if move:
-            return Response(self.serializer_class(game).data)
+            return Response(game_data)
+
+        elif game_data:
+            return Response(
+                data={"detail": "Time is over.", "game": game_data},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         else:
             return Response(
@@ -146,7 +195,7 @@ class GameViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def get_unfinished_games(self, request, *args, **kwargs):
         user = self.request.user
-        games = Game.objects.filter(
+        games = Game.objects.with_related().filter(
             Q(white_player=user) | Q(black_player=user)
         ).order_by("-created_at")
 
@@ -163,7 +212,72 @@ class GameViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def pgn(self, request, *args, **kwargs):
         game = self.get_object()
-        return Response(data={'results': str(get_pgn_game_from_uuid(game.uuid))})
+        return Response(data={'results': game.pgn if game.board else ''})
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def export(self, request, *args, **kwargs):
+        if "user" in request.query_params:
+            user = get_object_or_404(User, pk=request.query_params["user"])
+        else:
+            user = request.user
+
+        # только законченные партии: позиции идущих партий не выгружаются
+        games = Game.objects.filter(Q(white_player=user) | Q(black_player=user)).filter(
+            result__result__in=(Result.WHITE_WINS, Result.BLACK_WINS, Result.DRAW)
+        )
+        response = StreamingHttpResponse(services.stream_pgn(games), content_type="application/x-chess-pgn")
+        response["Content-Disposition"] = f'attachment; filename="{user.username}.pgn"'
+        return response
+
+    @swagger_auto_schema(
+        method="get", query_serializer=PositionQuerySerializer, responses={200: GameSerializer(many=True)}
+    )
+    @action(detail=False, methods=["get"])
+    def position(self, request, *args, **kwargs):
+        serializer = PositionQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        games = services.find_games_by_fen(serializer.validated_data["fen"], self.get_queryset())
+        page = self.paginate_queryset(games)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @swagger_auto_schema(method="get", query_serializer=PositionQuerySerializer, responses={200: ExplorerSerializer})
+    @action(detail=False, methods=["get"])
+    def explorer(self, request, *args, **kwargs):
+        serializer = PositionQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        fen = serializer.validated_data["fen"]
+        moves = services.get_explorer_moves(fen)
+
+        return Response({"fen": fen, "games": sum(move["games"] for move in moves), "moves": moves})
+
+    @swagger_auto_schema(
+        method="get", query_serializer=AnalysisQuerySerializer, responses={200: GameAnalysisSerializer}
+    )
+    @action(detail=True, methods=["get"])
+    def analysis(self, request, *args, **kwargs):
+        game = self.get_object()
+        if game.result is None or game.result.result not in (Result.WHITE_WINS, Result.BLACK_WINS, Result.DRAW):
+            return Response({"detail": "The game is not finished."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = AnalysisQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        analysis = services.get_game_analysis(game, serializer.validated_data["depth"])
+
+        return Response(analysis, status=status.HTTP_200_OK if analysis["complete"] else status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(method="post", request_body=GameSeekSerializer, responses={202: ""})
+    @swagger_auto_schema(method="delete", responses={204: ""})
+    @action(detail=False, methods=["post", "delete"], permission_classes=[IsAuthenticated])
+    def seek(self, request, *args, **kwargs):
+        if request.method == "DELETE":
+            services.cancel_seek(request.user)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        serializer = GameSeekSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        services.seek_game(request.user, serializer.validated_data["time_control_type"])
+        return Response(status=status.HTTP_202_ACCEPTED)
 
     @swagger_auto_schema(method="post", request_body=no_body)
     @action(detail=True, methods=["post"])
@@ -208,19 +322,7 @@ class GameViewSet(viewsets.ModelViewSet):
 
         if game.started_at is None or game.started_at.replace(tzinfo=None) > datetime.now():
             if user in (game.white_player, game.black_player):
-                topic = f'Chess game invitation from {user}'
-                message = f'''
-                    Hello!
-                    You have been invited to a chess game:
-                    https://chessmatch.mercury.xamtal.ru/#/play/friend/{kwargs.get("pk")}
-                '''
-                send_mail(
-                    topic,
-                    message,
-                    settings.EMAIL_HOST_USER,
-                    [request.data['email']],
-                    fail_silently=True,
-                )
+                enqueue_on_commit(send_game_invitation, str(game.pk), str(user), request.data['email'])
                 return Response({"detail": "An invitation has been successfully sent."}, status=status.HTTP_200_OK)
             else:
                 return Response({"detail": "Only participants may send invitations."}, status=status.HTTP_403_FORBIDDEN)
@@ -231,13 +333,13 @@ class GameViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def white_player_time(self, request, *args, **kwargs):
         game = Game.objects.filter(uuid=kwargs['pk']).first()
-        return Response(data={'results': game.white_player_time(game)})
+        return Response(data={'results': game.white_player_time_remaining})
 
     @swagger_auto_schema(method="get")
     @action(detail=True, methods=["get"])
     def black_player_time(self, request, *args, **kwargs):
         game = Game.objects.filter(uuid=kwargs['pk']).first()
-        return Response(data={'results': game.black_player_time(game)})
+        return Response(data={'results': game.black_player_time_remaining})
 
     @swagger_auto_schema(method="post", request_body=no_body, responses={201: GameSerializer})
     @action(detail=True, methods=["post"])
@@ -254,16 +356,65 @@ class EloViewSet(
     list:
         Список Elo
 
-        Список всех Elo
+        Список всех Elo с рейтингами по категориям контроля времени
     retrieve:
         Детальные данные Elo
 
         Детальная страница Elo
+    leaderboard:
+        Лидерборд
+
+        Лучшие игроки категории рейтинга (category: "elo" или id типа контроля времени)
+    my_position:
+        Место в лидерборде
+
+        Место текущего игрока и игроки рядом с ним (size выше и ниже)
     """
-    queryset = Elo.objects.all()
-    serializer_class = EloSerializer
+    queryset = Elo.objects.select_related("player").prefetch_related(
+        Prefetch(
+            "player__ratings",
+            queryset=PlayerRating.objects.filter(system=RATING_SYSTEM).select_related("time_control_type"),
+        )
+    ).order_by("-rating", "pk")
+    serializer_class = EloRatingsSerializer
     lookup_field = "uuid"
 
+    def _leaderboard_query(self) -> dict:
+        serializer = LeaderboardQuerySerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    @swagger_auto_schema(
+        method="get", query_serializer=LeaderboardQuerySerializer, responses={200: LeaderboardSerializer}
+    )
+    @action(detail=False, methods=["get"])
+    def leaderboard(self, request, *args, **kwargs):
+        query = self._leaderboard_query()
+        leaderboard = get_leaderboard()
+        entries = leaderboard.page(query["category"], query["offset"], query["limit"])
+
+        return Response({
+            "category": query["category"],
+            "count": leaderboard.size(query["category"]),
+            "results": services.get_leaderboard_entries(entries),
+        })
+
+    @swagger_auto_schema(
+        method="get", query_serializer=LeaderboardQuerySerializer, responses={200: LeaderboardPositionSerializer}
+    )
+    @action(detail=False, methods=["get"], url_path="leaderboard/me")
+    def my_position(self, request, *args, **kwargs):
+        query = self._leaderboard_query()
+        position, entries = get_around(get_leaderboard(), query["category"], request.user.pk, query["size"])
+        rank, rating = position or (None, None)
+
+        return Response({
+            "category": query["category"],
+            "rank": rank,
+            "rating": round(rating) if rating is not None else None,
+            "around": services.get_leaderboard_entries(entries),
+        })
+
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     """
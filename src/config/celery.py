@@ -0,0 +1,18 @@
+"""
+Celery application
+
+Tasks are split into queues by how long their result may wait:
+realtime - players are waiting for it (broadcast rooms of a started game),
+background - ratings and tournament standings,
+mail - outgoing emails, a slow SMTP server must not hold up the other queues.
+Game moves and their WebSocket pushes never go through Celery.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
+
+app = Celery("chess")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
@@ -337,6 +337,74 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Clock scheduler
+CLOCK_STORE = {
+    "BACKEND": "api.clocks.RedisClockStore",
+    "OPTIONS": {"url": f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/1"},
+}
+
+# Leaderboards
+LEADERBOARD = {
+    "BACKEND": "api.leaderboard.RedisLeaderboard",
+    "OPTIONS": {"url": f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/1"},
+}
+
+# Broadcast room pool
+BROADCAST_ROOM_POOL = {
+    "BACKEND": "api.broadcast.pool.RedisRoomPool",
+    "OPTIONS": {"url": f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/1"},
+}
+
+# Opening explorer
+OPENING_EXPLORER = {
+    "BACKEND": "api.explorer.RedisOpeningExplorer",
+    "OPTIONS": {"url": f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/1"},
+}
+
+# Engine analysis
+ANALYSIS_ENGINE = {
+    "COMMAND": env("ANALYSIS_ENGINE_COMMAND", default="/usr/games/stockfish"),
+    "ENGINES": env.int("ANALYSIS_ENGINES", default=2),
+    "OPTIONS": {"Threads": 1, "Hash": 64},
+}
+ANALYSIS_QUEUE = {
+    "BACKEND": "api.analysis.jobs.RedisAnalysisQueue",
+    "OPTIONS": {"url": f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/1"},
+}
+EVAL_CACHE = {
+    "BACKEND": "api.analysis.cache.RedisEvalCache",
+    "OPTIONS": {"url": f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/1"},
+}
+
+# Matchmaking
+MATCHMAKING_QUEUE = {
+    "BACKEND": "api.matchmaking.RedisSeekQueue",
+    "OPTIONS": {"url": f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/1"},
+}
+
+# Celery
+# http://docs.celeryproject.org/en/latest/userguide/configuration.html
+CELERY_BROKER_URL = env(
+    "CELERY_BROKER_URL", default=f"redis://:{env('REDIS_PASSWORD', default='XXXXXX')}@redis:6379/2"
+)
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_ACCEPT_CONTENT = ["json"]
+CELERY_TASK_SERIALIZER = "json"
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_TIME_LIMIT = 5 * 60
+CELERY_TASK_SOFT_TIME_LIMIT = 60
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# очереди по допустимой задержке, см. config/celery.py
+CELERY_TASK_DEFAULT_QUEUE = "background"
+CELERY_TASK_ROUTES = {
+    "api.tasks.provision_broadcast": {"queue": "realtime"},
+    "api.tasks.update_game_ratings": {"queue": "background"},
+    "core.tournament.tasks.update_standings": {"queue": "background"},
+    "api.tasks.update_opening_explorer": {"queue": "background"},
+    "api.tasks.send_game_invitation": {"queue": "mail"},
+    "core.users.tasks.send_confirm_url": {"queue": "mail"},
+}
+
 SIZES_IMAGE = [
     50,
     200,
@@ -2,8 +2,10 @@
 With these settings, tests run faster.
 """
 
+import sys
+
 from .base import *  # noqa
-from .base import env
+from .base import ROOT_DIR, env
 
 # GENERAL
 # ------------------------------------------------------------------------------
@@ -28,6 +30,38 @@ CACHES = {
     }
 }
 
+# CLOCKS
+# ------------------------------------------------------------------------------
+CLOCK_STORE = {"BACKEND": "api.clocks.InMemoryClockStore"}
+
+# LEADERBOARDS
+# ------------------------------------------------------------------------------
+LEADERBOARD = {"BACKEND": "api.leaderboard.InMemoryLeaderboard"}
+
+# OPENING EXPLORER
+# ------------------------------------------------------------------------------
+OPENING_EXPLORER = {"BACKEND": "api.explorer.InMemoryOpeningExplorer"}
+
+# ENGINE ANALYSIS
+# ------------------------------------------------------------------------------
+ANALYSIS_ENGINE = {"COMMAND": [sys.executable, str(ROOT_DIR / "api" / "tests" / "uci_stub.py")], "ENGINES": 2}
+ANALYSIS_QUEUE = {"BACKEND": "api.analysis.jobs.InMemoryAnalysisQueue"}
+EVAL_CACHE = {"BACKEND": "api.analysis.cache.InMemoryEvalCache"}
+
+# MATCHMAKING
+# ------------------------------------------------------------------------------
+MATCHMAKING_QUEUE = {"BACKEND": "api.matchmaking.InMemorySeekQueue"}
+
+# BROADCAST ROOM POOL
+# ------------------------------------------------------------------------------
+BROADCAST_ROOM_POOL = {"BACKEND": "api.broadcast.pool.InMemoryRoomPool"}
+
+# CELERY
+# ------------------------------------------------------------------------------
+CELERY_BROKER_URL = "memory://"
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
+
 # PASSWORDS
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#password-hashers
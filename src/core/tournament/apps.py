@@ -5,3 +5,6 @@ from django.utils.translation import gettext_lazy as _
 class TournamentConfig(AppConfig):
     name = "core.tournament"
     verbose_name = _("Tournament")
+
+    def ready(self):
+        import core.tournament.signals  # noqa F401
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.tournament.models import Tournament
+from core.tournament.services import update_standings
+
+
+class Command(BaseCommand):
+    help = "Recalculates the standings of tournaments (all by default)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("tournament_ids", nargs="*", type=int)
+
+    def handle(self, *args, **options):
+        tournament_ids = options["tournament_ids"] or Tournament.objects.values_list("id", flat=True)
+        for tournament_id in tournament_ids:
+            update_standings(tournament_id)
+            self.stdout.write(f"Standings of tournament {tournament_id} updated")
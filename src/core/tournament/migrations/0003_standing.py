@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tournament', '0002_match_parent_match'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Standing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.FloatField(default=0)),
+                ('total_points', models.FloatField(default=0)),
+                ('buchholz', models.FloatField(default=0)),
+                ('sonneborn_berger', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to=settings.AUTH_USER_MODEL)),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='tournament.Tour')),
+            ],
+            options={
+                'ordering': ('tour', '-total_points', '-buchholz', '-sonneborn_berger'),
+                'unique_together': {('tour', 'player')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.0.7 on 2026-10-18 20:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tournament', '0003_standing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drawtype',
+            name='system',
+            field=models.CharField(blank=True, choices=[('', 'Manual'), ('round_robin', 'Round robin'), ('swiss', 'Swiss (Dutch)'), ('knockout', 'Knockout')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='players',
+            field=models.ManyToManyField(blank=True, related_name='tournaments', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
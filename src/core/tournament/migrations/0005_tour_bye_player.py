@@ -0,0 +1,21 @@
+# Generated by Django 3.0.7 on 2026-10-18 21:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tournament', '0004_pairing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='bye_player',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bye_tours', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
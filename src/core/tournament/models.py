@@ -1,8 +1,9 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
-from django.db.models import Q
-from django_paranoid.models import ParanoidModel
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django_paranoid.models import ParanoidModel, ParanoidModelManager
 
 User = get_user_model()
 
@@ -21,9 +22,24 @@ class TournamentType(ParanoidModel):
 class DrawType(ParanoidModel):
     """
     Типы жеребьёвок
+    system: система, по которой core.tournament.pairing составляет следующий тур,
+    пустая - туры и матчи создаются вручную
     """
 
+    MANUAL = ""
+    ROUND_ROBIN = "round_robin"
+    SWISS = "swiss"
+    KNOCKOUT = "knockout"
+
+    SYSTEM_CHOICES = [
+        (MANUAL, "Manual"),
+        (ROUND_ROBIN, "Round robin"),
+        (SWISS, "Swiss (Dutch)"),
+        (KNOCKOUT, "Knockout"),
+    ]
+
     name = models.CharField(max_length=255)
+    system = models.CharField(max_length=20, choices=SYSTEM_CHOICES, default=MANUAL, blank=True)
 
     def __str__(self):
         return self.name
@@ -42,6 +58,34 @@ class TimeControlType(ParanoidModel):
         return self.name
 
 
+class TournamentQuerySet(models.QuerySet):
+    def with_amounts(self):
+        """
+        Количество туров и участников одним запросом для списка турниров
+        """
+        match_filter = {
+            "tour__tournament": OuterRef("pk"),
+            "tour__deleted_at__isnull": True,
+            "deleted_at__isnull": True,
+        }
+        members = (
+            User.objects.filter(
+                Q(**{f"first_player_matches__{key}": value for key, value in match_filter.items()})
+                | Q(**{f"second_player_matches__{key}": value for key, value in match_filter.items()})
+            )
+            .order_by()
+            .annotate(group=Value(1, output_field=IntegerField()))
+            .values("group")
+            .annotate(count=Count("pk", distinct=True))
+            .values("count")
+        )
+
+        return self.annotate(
+            tours_count=Count("tours", filter=Q(tours__deleted_at__isnull=True), distinct=True),
+            members_count=Coalesce(Subquery(members, output_field=IntegerField()), 0),
+        )
+
+
 class Tournament(ParanoidModel):
     """
     Турниры
@@ -64,12 +108,19 @@ class Tournament(ParanoidModel):
         null=True,
     )
     finished = models.BooleanField(default=False)
+    players = models.ManyToManyField(
+        settings.AUTH_USER_MODEL, related_name="tournaments", blank=True
+    )
+
+    objects = ParanoidModelManager.from_queryset(TournamentQuerySet)()
 
     @property
     def tours_amount(self) -> int:
         """
         Количество туров
         """
+        if hasattr(self, "tours_count"):
+            return self.tours_count
         return self.tours.count()
 
     @property
@@ -77,6 +128,9 @@ class Tournament(ParanoidModel):
         """
         Количество участников этого турнира
         """
+        if hasattr(self, "members_count"):
+            return self.members_count
+
         players = set()
         for tour in self.tours.all():
             players |= tour.get_players_ids()
@@ -90,13 +144,19 @@ class Tournament(ParanoidModel):
 class Tour(ParanoidModel):
     """
     Туры
+    bye_player: игрок со свободным туром швейцарской системы, получает BYE_POINTS
     """
 
+    BYE_POINTS = 1.0
+
     tournament = models.ForeignKey(
         Tournament, on_delete=models.CASCADE, related_name="tours"
     )
     start_at = models.DateTimeField(null=True, blank=True)
     finished = models.BooleanField(null=True, blank=True)
+    bye_player = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name="bye_tours", null=True, blank=True
+    )
 
     def get_players_ids(self) -> set:
         """
@@ -175,3 +235,24 @@ class Match(ParanoidModel):
                 point = getattr(game, f"{player_color}_player_points")
                 user_point += point if point else 0
         return user_point
+
+
+class Standing(models.Model):
+    """
+    Положение игрока после тура: очки тура, сумма очков и дополнительные показатели.
+    Пересчитывается при завершении партии турнира, см. core.tournament.services
+    """
+
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name="standings")
+    player = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="standings"
+    )
+    points = models.FloatField(default=0)
+    total_points = models.FloatField(default=0)
+    buchholz = models.FloatField(default=0)
+    sonneborn_berger = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("tour", "player")
+        ordering = ("tour", "-total_points", "-buchholz", "-sonneborn_berger")
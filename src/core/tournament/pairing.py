@@ -0,0 +1,265 @@
+"""
+Жеребьевка следующего тура: круговая система (таблицы Бергера), швейцарская система
+(голландская) и олимпийская система
+
+Функции работают с идентификаторами игроков и не обращаются к БД,
+пары возвращаются как (белые, черные)
+"""
+
+# шагов перебора с возвратом на одну попытку, дальше пары подбираются жадно
+PAIRING_SEARCH_LIMIT = 10000
+
+
+class PairingError(Exception):
+    pass
+
+
+class _SearchLimitExceeded(Exception):
+    pass
+
+
+def round_robin_pairings(players: list, round_index: int) -> list:
+    """
+    Пары тура круговой системы методом вращения: последний игрок стоит на месте,
+    остальные сдвигаются на одну позицию каждый тур. При нечетном числе игроков
+    соперник None означает свободный тур
+    """
+    players = list(players)
+    if len(players) % 2:
+        players.append(None)
+
+    rounds = len(players) - 1
+    if round_index >= rounds:
+        raise PairingError("All round robin tours are already paired")
+
+    fixed, ring = players[-1], players[:-1]
+    shift = round_index % rounds
+    ring = ring[shift:] + ring[:shift]
+
+    pairs = [(ring[0], fixed) if round_index % 2 else (fixed, ring[0])]
+    for i in range(1, len(players) // 2):
+        first, second = ring[i], ring[-i]
+        pairs.append((second, first) if round_index % 2 else (first, second))
+
+    return [
+        (white, black) if white is not None else (black, None)
+        for white, black in pairs
+        if white is not None or black is not None
+    ]
+
+
+class SwissPlayer:
+    """
+    Состояние игрока для швейцарской жеребьевки
+    colors: цвета в сыгранных матчах, "w" или "b"
+    """
+
+    __slots__ = ("id", "score", "rating", "opponents", "colors", "had_bye")
+
+    def __init__(self, id, score=0.0, rating=0, opponents=(), colors=(), had_bye=False):
+        self.id = id
+        self.score = score
+        self.rating = rating
+        self.opponents = set(opponents)
+        self.colors = list(colors)
+        self.had_bye = had_bye
+
+    @property
+    def color_difference(self) -> int:
+        return self.colors.count("w") - self.colors.count("b")
+
+    @property
+    def preferred_color(self):
+        if self.color_difference < 0:
+            return "w"
+        if self.color_difference > 0:
+            return "b"
+        if self.colors:
+            return "w" if self.colors[-1] == "b" else "b"
+        return None
+
+    @property
+    def absolute_color(self):
+        """
+        Цвет, который игрок обязан получить: разница цветов больше одного
+        или два последних матча одним цветом
+        """
+        if abs(self.color_difference) > 1 or self.colors[-2:] in (["w", "w"], ["b", "b"]):
+            return self.preferred_color
+        return None
+
+    def can_play(self, other) -> bool:
+        if other.id in self.opponents:
+            return False
+        absolute = self.absolute_color
+        return absolute is None or absolute != other.absolute_color
+
+    def colors_against(self, other) -> tuple:
+        """
+        (белые, черные) для пары, где self выше в рейтинге жеребьевки
+        """
+        for player, opponent in ((self, other), (other, self)):
+            if player.absolute_color and player.absolute_color != opponent.absolute_color:
+                return (player.id, opponent.id) if player.absolute_color == "w" else (opponent.id, player.id)
+
+        preference = self.preferred_color or ("b" if other.preferred_color == "w" else "w")
+        return (self.id, other.id) if preference == "w" else (other.id, self.id)
+
+
+def _rank(player: SwissPlayer) -> tuple:
+    return -player.score, -player.rating, player.id
+
+
+def _pair_greedily(players: list) -> tuple:
+    pairs, floaters = [], []
+    remaining = list(players)
+    while remaining:
+        player = remaining.pop(0)
+        opponent = next((other for other in remaining if player.can_play(other)), None)
+        if opponent is None:
+            floaters.append(player)
+        else:
+            remaining.remove(opponent)
+            pairs.append(player.colors_against(opponent))
+    return pairs, floaters
+
+
+def _pair_bracket(bracket: list) -> tuple:
+    """
+    Верхняя половина группы играет с нижней (S1 против S2), при повторной встрече
+    или конфликте цветов берется следующий подходящий игрок S2.
+    Оставшиеся игроки пытаются сыграть между собой, остальные опускаются в следующую группу
+    """
+    half = len(bracket) // 2
+    s1, s2 = bracket[:half], bracket[half:]
+
+    pairs, unpaired = [], []
+    for player in s1:
+        opponent = next((other for other in s2 if player.can_play(other)), None)
+        if opponent is None:
+            unpaired.append(player)
+        else:
+            s2.remove(opponent)
+            pairs.append(player.colors_against(opponent))
+
+    rest_pairs, floaters = _pair_greedily(sorted(unpaired + s2, key=_rank))
+    return pairs + rest_pairs, floaters
+
+
+def _pair_exhaustively(players: list, limit=PAIRING_SEARCH_LIMIT):
+    """
+    Пары без повторных встреч и конфликта абсолютных цветов перебором с возвратом,
+    None, если таких пар нет. Перебор экспоненциален от размера группы,
+    после limit шагов - _SearchLimitExceeded
+    """
+    steps = 0
+
+    def search(players):
+        nonlocal steps
+        steps += 1
+        if steps > limit:
+            raise _SearchLimitExceeded
+        if not players:
+            return []
+
+        player, rest = players[0], players[1:]
+        for opponent in rest:
+            if player.can_play(opponent):
+                pairs = search([other for other in rest if other is not opponent])
+                if pairs is not None:
+                    return [player.colors_against(opponent)] + pairs
+        return None
+
+    return search(players)
+
+
+def _repair(players: list):
+    """
+    Пары для опустившихся игроков: перебором, а для большой группы, где перебор
+    не уложился в лимит, жадно. None, если кто-то остался без пары
+    """
+    try:
+        return _pair_exhaustively(players)
+    except _SearchLimitExceeded:
+        pairs, floaters = _pair_greedily(players)
+        return None if floaters else pairs
+
+
+def _pair_swiss_field(players: list) -> list:
+    brackets = {}
+    for player in players:
+        brackets.setdefault(player.score, []).append(player)
+
+    pairs, floaters = [], []
+    for score in sorted(brackets, reverse=True):
+        bracket_pairs, floaters = _pair_bracket(floaters + brackets[score])
+        pairs.extend(bracket_pairs)
+
+    # последние игроки уже встречались или не проходят по цвету:
+    # нижние пары разбираются обратно, пока не найдется допустимая жеребьевка
+    by_id = {player.id: player for player in players}
+    while floaters:
+        repaired = _repair(sorted(floaters, key=_rank))
+        if repaired is not None:
+            return pairs + repaired
+        if not pairs:
+            raise PairingError("No Swiss pairing without a repeat or a color conflict")
+        floaters += [by_id[player_id] for player_id in pairs.pop()]
+
+    return pairs
+
+
+def swiss_pairings(players: list) -> tuple:
+    """
+    Голландская система: группы по очкам сверху вниз, не спаренные игроки
+    опускаются в следующую группу. Повторных встреч и нарушений абсолютного цвета нет:
+    если нижние игроки не находят соперника, нижние пары пересобираются перебором
+    (ограниченным, затем жадно).
+    Свободный тур получает игрок с наименьшим рейтингом жеребьевки, у которого его
+    еще не было, а если без него жеребьевка невозможна - следующий
+
+    Возвращает пары и игрока со свободным туром (или None)
+    """
+    players = sorted(players, key=_rank)
+    if not len(players) % 2:
+        return _pair_swiss_field(players), None
+
+    candidates = [player for player in reversed(players) if not player.had_bye]
+    candidates += [player for player in reversed(players) if player.had_bye]
+    for bye in candidates:
+        try:
+            return _pair_swiss_field([player for player in players if player is not bye]), bye.id
+        except PairingError:
+            continue
+
+    raise PairingError("No Swiss pairing without a repeat or a color conflict")
+
+
+def knockout_pairings(entrants: list, first_round: bool) -> tuple:
+    """
+    Олимпийская система, entrants отсортированы по посеву.
+
+    В первом туре лучшие игроки получают свободный тур до ближайшей степени двойки,
+    остальные играют по схеме первый с последним. В следующих турах entrants - игроки
+    со свободным туром, затем победители матчей предыдущего тура по порядку,
+    и пары снова складываются первый с последним
+
+    Возвращает пары и игроков со свободным туром
+    """
+    if len(entrants) < 2:
+        raise PairingError("The knockout is over")
+
+    byes = []
+    if first_round:
+        bracket_size = 1
+        while bracket_size < len(entrants):
+            bracket_size *= 2
+        byes = entrants[:bracket_size - len(entrants)]
+        entrants = entrants[len(byes):]
+    elif len(entrants) & (len(entrants) - 1):
+        raise PairingError("Knockout tour needs a power of two players")
+
+    half = len(entrants) // 2
+    pairs = [(entrants[i], entrants[-i - 1]) for i in range(half)]
+
+    return pairs, byes
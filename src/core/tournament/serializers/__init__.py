@@ -1,14 +1,15 @@
 from rest_framework import serializers
 
-from core.tournament.models import TimeControlType
+from core.tournament.models import DrawType, TimeControlType
 
 
 class DrawTypeSerializer(serializers.ModelSerializer):
     class Meta:
-        model = TimeControlType
+        model = DrawType
         fields = (
             "id",
             "name",
+            "system",
         )
 
 
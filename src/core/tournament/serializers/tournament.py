@@ -72,6 +72,9 @@ class TournamentResultTableSerializer(serializers.Serializer):
     class TourResultSerializer(serializers.Serializer):
         username = serializers.CharField()
         point = serializers.FloatField()
+        total_points = serializers.FloatField()
+        buchholz = serializers.FloatField()
+        sonneborn_berger = serializers.FloatField()
 
     tour_id = serializers.IntegerField()
     result = TourResultSerializer(many=True)
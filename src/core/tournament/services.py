@@ -0,0 +1,241 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api.models import Elo
+from core.tournament.models import DrawType, Match, Standing, Tour, Tournament
+from core.tournament.pairing import (
+    PairingError,
+    SwissPlayer,
+    knockout_pairings,
+    round_robin_pairings,
+    swiss_pairings,
+)
+
+RESULT_TABLE_TIMEOUT = 60 * 60
+
+
+def _result_table_key(tournament_id: int) -> str:
+    return f"tournament_result_table_{tournament_id}"
+
+
+def get_match_points(match: Match) -> tuple:
+    """
+    Очки первого и второго игрока во всех партиях матча
+    """
+    points = {match.first_player_id: 0.0, match.second_player_id: 0.0}
+    for game in match.games.all():
+        for player_id in points:
+            color = game.check_white_or_black(player_id)
+            if color:
+                points[player_id] += getattr(game, f"{color}_player_points") or 0
+
+    return points[match.first_player_id], points[match.second_player_id]
+
+
+def calculate_standings(tournament_id: int) -> list:
+    """
+    Положение игроков после каждого тура.
+
+    Бухгольц - сумма очков соперников, Зоннеборн-Бергер - сумма очков соперников,
+    умноженных на очки, набранные против них. Оба считаются по очкам после тура
+    """
+    tours = Tour.objects.filter(tournament_id=tournament_id).order_by("start_at", "id")
+    matches = defaultdict(list)
+    for match in Match.objects.filter(tour__tournament_id=tournament_id).prefetch_related("games"):
+        matches[match.tour_id].append(match)
+
+    totals = defaultdict(float)
+    opponents = defaultdict(list)
+    standings = []
+
+    for tour_id, bye_player_id in tours.values_list("id", "bye_player_id"):
+        tour_points = defaultdict(float)
+        if bye_player_id:
+            tour_points[bye_player_id] += Tour.BYE_POINTS
+        for match in matches[tour_id]:
+            first_points, second_points = get_match_points(match)
+            tour_points[match.first_player_id] += first_points
+            tour_points[match.second_player_id] += second_points
+            opponents[match.first_player_id].append((match.second_player_id, first_points))
+            opponents[match.second_player_id].append((match.first_player_id, second_points))
+
+        for player_id, points in tour_points.items():
+            totals[player_id] += points
+
+        for player_id, points in tour_points.items():
+            standings.append(Standing(
+                tour_id=tour_id,
+                player_id=player_id,
+                points=points,
+                total_points=totals[player_id],
+                buchholz=sum(totals[opponent] for opponent, _ in opponents[player_id]),
+                sonneborn_berger=sum(totals[opponent] * score for opponent, score in opponents[player_id]),
+            ))
+
+    return standings
+
+
+def update_standings(tournament_id: int) -> None:
+    """
+    Пересчет таблицы турнира и сброс закешированной таблицы результатов
+    """
+    with transaction.atomic():
+        Standing.objects.filter(tour__tournament_id=tournament_id).delete()
+        Standing.objects.bulk_create(calculate_standings(tournament_id))
+
+    cache.delete(_result_table_key(tournament_id))
+
+
+def get_result_table(tournament_id: int) -> list:
+    """
+    Таблица результатов по турам из сохраненных положений игроков
+    """
+    result_table = cache.get(_result_table_key(tournament_id))
+    if result_table is not None:
+        return result_table
+
+    result_table = {
+        tour_id: []
+        for tour_id in Tour.objects.filter(tournament_id=tournament_id)
+        .order_by("start_at", "id")
+        .values_list("id", flat=True)
+    }
+    standings = Standing.objects.filter(tour__tournament_id=tournament_id).select_related("player")
+    for standing in standings:
+        result_table[standing.tour_id].append({
+            "username": standing.player.get_full_name(),
+            "point": standing.points,
+            "total_points": standing.total_points,
+            "buchholz": standing.buchholz,
+            "sonneborn_berger": standing.sonneborn_berger,
+        })
+
+    result_table = [{"tour_id": tour_id, "result": result} for tour_id, result in result_table.items()]
+    cache.set(_result_table_key(tournament_id), result_table, RESULT_TABLE_TIMEOUT)
+
+    return result_table
+
+
+# Pairing
+
+
+def get_match_winner(match: Match):
+    """
+    Победитель матча: указанный вручную или набравший больше очков, None при равенстве
+    """
+    if match.winner_id:
+        return match.winner_id
+
+    first_points, second_points = get_match_points(match)
+    if first_points == second_points:
+        return None
+    return match.first_player_id if first_points > second_points else match.second_player_id
+
+
+def get_tournament_players(tournament: Tournament, tours: list) -> list:
+    """
+    Участники турнира, а если они не указаны - все игроки его матчей
+    """
+    players = set(tournament.players.values_list("id", flat=True))
+    if not players:
+        for tour in tours:
+            for match in tour.matches.all():
+                players |= {match.first_player_id, match.second_player_id}
+    return sorted(players)
+
+
+def _get_swiss_players(players: list, tours: list, ratings: dict) -> list:
+    swiss_players = {player_id: SwissPlayer(player_id, rating=ratings.get(player_id, 0)) for player_id in players}
+
+    for tour in tours:
+        if tour.bye_player_id in swiss_players:
+            swiss_players[tour.bye_player_id].score += Tour.BYE_POINTS
+            swiss_players[tour.bye_player_id].had_bye = True
+
+        for match in tour.matches.all():
+            first_points, second_points = get_match_points(match)
+            for player_id, opponent_id, points, color in (
+                (match.first_player_id, match.second_player_id, first_points, "w"),
+                (match.second_player_id, match.first_player_id, second_points, "b"),
+            ):
+                if player_id in swiss_players:
+                    swiss_player = swiss_players[player_id]
+                    swiss_player.score += points
+                    swiss_player.opponents.add(opponent_id)
+                    swiss_player.colors.append(color)
+
+    return list(swiss_players.values())
+
+
+def _get_knockout_entrants(players: list, tours: list, ratings: dict) -> tuple:
+    """
+    Участники следующего тура олимпийской системы и матчи, из которых они вышли
+    """
+    seeded = sorted(players, key=lambda player_id: (-ratings.get(player_id, 0), player_id))
+    if not tours:
+        return seeded, []
+
+    eliminated = set()
+    for tour in tours:
+        for match in tour.matches.all():
+            winner = get_match_winner(match)
+            if winner is None:
+                raise PairingError(f"Match {match.pk} has no winner")
+            eliminated.add(match.second_player_id if winner == match.first_player_id else match.first_player_id)
+
+    previous_matches = sorted(tours[-1].matches.all(), key=lambda match: match.pk)
+    played = {player_id for match in previous_matches for player_id in (match.first_player_id, match.second_player_id)}
+    byes = [player_id for player_id in seeded if player_id not in played and player_id not in eliminated]
+
+    return byes + [get_match_winner(match) for match in previous_matches], previous_matches
+
+
+def pair_next_tour(tournament: Tournament, start_at=None) -> Tour:
+    """
+    Создает следующий тур и его матчи по системе жеребьевки турнира.
+    Первый игрок матча играет белыми
+    """
+    system = tournament.draw_type.system if tournament.draw_type else DrawType.MANUAL
+    if system == DrawType.MANUAL:
+        raise PairingError("The tournament draw type has no pairing system")
+
+    with transaction.atomic():
+        # две жеребьевки одного турнира не должны идти одновременно
+        Tournament.objects.select_for_update().filter(pk=tournament.pk).first()
+
+        tours = list(tournament.tours.order_by("id").prefetch_related("matches__games"))
+        players = get_tournament_players(tournament, tours)
+        if len(players) < 2:
+            raise PairingError("The tournament needs at least two players")
+        ratings = dict(Elo.objects.filter(player_id__in=players).values_list("player_id", "rating"))
+
+        previous_matches = []
+        bye = None
+        if system == DrawType.ROUND_ROBIN:
+            pairs = round_robin_pairings(players, len(tours))
+        elif system == DrawType.SWISS:
+            pairs, bye = swiss_pairings(_get_swiss_players(players, tours, ratings))
+        else:
+            entrants, previous_matches = _get_knockout_entrants(players, tours, ratings)
+            pairs, _ = knockout_pairings(entrants, first_round=not tours)
+
+        tour = Tour.objects.create(tournament=tournament, start_at=start_at, bye_player_id=bye)
+        Match.objects.bulk_create(
+            Match(tour=tour, start_at=start_at, first_player_id=white, second_player_id=black)
+            for white, black in pairs
+            if black is not None
+        )
+
+        if previous_matches:
+            new_matches = {}
+            for match in Match.objects.filter(tour=tour):
+                new_matches[match.first_player_id] = new_matches[match.second_player_id] = match
+            for match in previous_matches:
+                match.parent_match = new_matches[get_match_winner(match)]
+            Match.objects.bulk_update(previous_matches, ["parent_match"])
+
+        transaction.on_commit(lambda: update_standings(tournament.pk))
+
+    return tour
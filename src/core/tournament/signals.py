@@ -0,0 +1,40 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.tournament.models import Match, Tournament
+from core.tournament.tasks import update_standings
+from core.utils.tasks import enqueue_on_commit
+
+
+def _update_standings_on_commit(tournament_ids) -> None:
+    for tournament_id in set(tournament_ids):
+        enqueue_on_commit(update_standings, tournament_id)
+
+
+@receiver(post_save, sender="api.Game")
+def update_standings_on_game_finish(sender, instance, **kwargs):
+    """
+    Завершенная партия (или изменение очков в ней) меняет таблицу ее турниров
+    """
+    if instance.finished_at is not None:
+        _update_standings_on_commit(
+            Tournament.objects.filter(tours__matches__games=instance).values_list("id", flat=True)
+        )
+
+
+@receiver(m2m_changed, sender=Match.games.through)
+def update_standings_on_match_games_change(sender, instance, action, reverse, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if reverse:
+        tournament_ids = Tournament.objects.filter(tours__matches__games=instance).values_list("id", flat=True)
+    else:
+        tournament_ids = [instance.tour.tournament_id]
+    _update_standings_on_commit(tournament_ids)
+
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def update_standings_on_match_change(sender, instance, **kwargs):
+    _update_standings_on_commit([instance.tour.tournament_id])
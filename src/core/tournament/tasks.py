@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from core.utils.tasks import KeyedTask
+from . import services
+
+
+@shared_task(base=KeyedTask, acks_late=True)
+def update_standings(tournament_id: int):
+    services.update_standings(tournament_id)
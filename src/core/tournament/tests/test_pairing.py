@@ -0,0 +1,231 @@
+import random
+import time
+
+import pytest
+
+from api.models import Game
+from core.tournament.models import DrawType, Match, Standing, Tour
+from core.tournament.pairing import (
+    PairingError,
+    SwissPlayer,
+    knockout_pairings,
+    round_robin_pairings,
+    swiss_pairings,
+)
+from core.tournament.services import pair_next_tour, update_standings
+
+
+@pytest.mark.parametrize("players", [4, 7, 10])
+def test_round_robin_every_pair_meets_once(players):
+    ids = list(range(1, players + 1))
+    rounds = players - 1 if players % 2 == 0 else players
+
+    met = [frozenset(pair) for n in range(rounds) for pair in round_robin_pairings(ids, n) if pair[1]]
+
+    assert len(met) == len(set(met)) == players * (players - 1) // 2
+    with pytest.raises(PairingError):
+        round_robin_pairings(ids, rounds)
+
+
+def test_swiss_first_round_top_half_against_bottom_half():
+    players = [SwissPlayer(i, rating=2000 - i) for i in range(1, 9)]
+
+    pairs, bye = swiss_pairings(players)
+
+    assert bye is None
+    assert sorted(frozenset(pair) for pair in pairs) == sorted(
+        frozenset(pair) for pair in ((1, 5), (2, 6), (3, 7), (4, 8))
+    )
+
+
+def test_swiss_avoids_repeats_and_absolute_colors():
+    players = [
+        SwissPlayer(1, score=1, opponents={2}, colors=["w", "w"]),
+        SwissPlayer(2, score=1, opponents={1}, colors=["b", "b"]),
+        SwissPlayer(3, score=1, opponents={4}, colors=["w", "w"]),
+        SwissPlayer(4, score=1, opponents={3}, colors=["b", "b"]),
+        SwissPlayer(5, score=0, had_bye=True),
+    ]
+
+    pairs, bye = swiss_pairings(players)
+
+    assert bye == 4
+    assert (2, 3) in pairs
+    assert (5, 1) in pairs
+
+
+def test_swiss_backtracks_instead_of_a_repeat():
+    players = [
+        SwissPlayer(1, rating=2000, opponents={3, 4}),
+        SwissPlayer(2, rating=1900),
+        SwissPlayer(3, rating=1800, opponents={1}),
+        SwissPlayer(4, rating=1700, opponents={1}),
+    ]
+
+    pairs, bye = swiss_pairings(players)
+
+    assert bye is None
+    assert {frozenset(pair) for pair in pairs} == {frozenset((1, 2)), frozenset((3, 4))}
+
+
+def test_swiss_moves_the_bye_when_no_pairing_is_possible():
+    players = [
+        SwissPlayer(1, rating=2000, opponents={2}),
+        SwissPlayer(2, rating=1900, opponents={1}),
+        SwissPlayer(3, rating=1800),
+    ]
+
+    pairs, bye = swiss_pairings(players)
+
+    assert bye in (1, 2)
+    assert len(pairs) == 1 and 3 in pairs[0]
+
+
+def test_swiss_never_repeats():
+    players = [SwissPlayer(1, opponents={2}), SwissPlayer(2, opponents={1})]
+
+    with pytest.raises(PairingError):
+        swiss_pairings(players)
+
+
+def test_swiss_1000_players_round_under_a_second():
+    random.seed(1)
+    players = {i: SwissPlayer(i, rating=random.randint(1000, 2800)) for i in range(1000)}
+
+    for _ in range(7):
+        started = time.monotonic()
+        pairs, bye = swiss_pairings(list(players.values()))
+        assert time.monotonic() - started < 1
+
+        assert len(pairs) == 500
+        for white, black in pairs:
+            assert black not in players[white].opponents
+            players[white].opponents.add(black)
+            players[black].opponents.add(white)
+            players[white].colors.append("w")
+            players[black].colors.append("b")
+            players[random.choice((white, black))].score += 1
+
+    assert max(abs(player.color_difference) for player in players.values()) <= 2
+
+
+def test_swiss_impossible_large_group_fails_fast():
+    # последний игрок уже сыграл со всеми, остальные 21 могут играть друг с другом
+    players = [SwissPlayer(i, rating=2000 - i, opponents={21}) for i in range(21)]
+    players.append(SwissPlayer(21, rating=0, opponents=set(range(21))))
+
+    started = time.monotonic()
+    with pytest.raises(PairingError):
+        swiss_pairings(players)
+    assert time.monotonic() - started < 5
+
+
+def test_knockout_byes_for_top_seeds():
+    pairs, byes = knockout_pairings([1, 2, 3, 4, 5, 6], first_round=True)
+
+    assert byes == [1, 2]
+    assert pairs == [(3, 6), (4, 5)]
+
+    pairs, byes = knockout_pairings([1, 2, 3, 4], first_round=False)
+    assert pairs == [(1, 4), (2, 3)]
+
+
+@pytest.fixture
+def pairing_tournament(create_tournament, create_player):
+    def create(system, players=4):
+        tournament = create_tournament
+        tournament.draw_type = DrawType.objects.create(name=system, system=system)
+        tournament.save()
+        tournament.players.set([
+            create_player(f"player {i}", f"player_{i}", f"player_{i}@example.com") for i in range(players)
+        ])
+        return tournament
+
+    return create
+
+
+def _finish_tour(tour):
+    """
+    Первый игрок каждого матча выигрывает
+    """
+    for match in tour.matches.all():
+        game = Game.objects.create(
+            white_player_id=match.first_player_id,
+            black_player_id=match.second_player_id,
+            white_player_points=1,
+            black_player_points=0,
+            broadcast_type=Game.NONE,
+        )
+        match.games.add(game)
+
+
+@pytest.mark.django_db
+def test_pair_round_robin_tournament(pairing_tournament):
+    tournament = pairing_tournament(DrawType.ROUND_ROBIN)
+
+    for _ in range(3):
+        pair_next_tour(tournament)
+
+    met = [frozenset((match.first_player_id, match.second_player_id)) for match in Match.objects.all()]
+    assert len(met) == len(set(met)) == 6
+    with pytest.raises(PairingError):
+        pair_next_tour(tournament)
+
+
+@pytest.mark.django_db
+def test_pair_swiss_tournament(pairing_tournament):
+    tournament = pairing_tournament(DrawType.SWISS, players=6)
+
+    _finish_tour(pair_next_tour(tournament))
+    second_tour = pair_next_tour(tournament)
+
+    first_round = {frozenset((m.first_player_id, m.second_player_id)) for m in Tour.objects.first().matches.all()}
+    second_round = {frozenset((m.first_player_id, m.second_player_id)) for m in second_tour.matches.all()}
+    assert len(second_round) == 3
+    assert not first_round & second_round
+
+
+@pytest.mark.django_db
+def test_swiss_bye_is_stored_and_scored(pairing_tournament):
+    tournament = pairing_tournament(DrawType.SWISS, players=5)
+
+    first_tour = pair_next_tour(tournament)
+    _finish_tour(first_tour)
+    update_standings(tournament.pk)
+
+    assert first_tour.matches.count() == 2
+    assert first_tour.bye_player_id is not None
+    standing = Standing.objects.get(tour=first_tour, player_id=first_tour.bye_player_id)
+    assert standing.points == standing.total_points == Tour.BYE_POINTS
+
+    second_tour = pair_next_tour(tournament)
+    assert second_tour.bye_player_id not in (None, first_tour.bye_player_id)
+
+
+@pytest.mark.django_db
+def test_pair_knockout_tournament(pairing_tournament):
+    tournament = pairing_tournament(DrawType.KNOCKOUT, players=6)
+
+    first_tour = pair_next_tour(tournament)
+    assert first_tour.matches.count() == 2
+    _finish_tour(first_tour)
+
+    second_tour = pair_next_tour(tournament)
+    assert second_tour.matches.count() == 2
+    for match in first_tour.matches.all():
+        assert match.parent_match.tour == second_tour
+        assert match.first_player_id in (match.parent_match.first_player_id, match.parent_match.second_player_id)
+
+    _finish_tour(second_tour)
+    final = pair_next_tour(tournament)
+    assert final.matches.count() == 1
+
+    _finish_tour(final)
+    with pytest.raises(PairingError):
+        pair_next_tour(tournament)
+
+
+@pytest.mark.django_db
+def test_pair_manual_tournament(pairing_tournament):
+    with pytest.raises(PairingError):
+        pair_next_tour(pairing_tournament(DrawType.MANUAL))
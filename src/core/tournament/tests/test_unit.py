@@ -1,6 +1,9 @@
 import pytest
 
-from core.tournament.models import Tour, Match
+from api.models import Game
+from api.services import create_game, draw_game
+from core.tournament.models import Tour, Match, Standing
+from core.tournament.services import calculate_standings, get_result_table, update_standings
 
 
 @pytest.mark.django_db
@@ -75,3 +78,72 @@ def test_match_get_players_point(
     game.save()
     match.games.add(game)
     assert Match.objects.last().get_player_point(second_p.id) == 5.0
+
+
+@pytest.fixture
+def played_tournament(create_tournament, create_tour, create_match, create_player, create_game_fix):
+    """
+    Тур 1: A выигрывает у B, тур 2: B выигрывает у C
+    """
+    tournament = create_tournament
+    first_tour, second_tour = create_tour(tournament.id), create_tour(tournament.id)
+    a = create_player("A", "player_a", "a@example.com")
+    b = create_player("B", "player_b", "b@example.com")
+    c = create_player("C", "player_c", "c@example.com")
+
+    for tour, winner, loser in ((first_tour, a, b), (second_tour, b, c)):
+        game = create_game_fix((loser, winner))
+        game.black_player_points, game.white_player_points = 1, 0
+        game.save()
+        create_match(tour.id, winner.id, loser.id).games.add(game)
+
+    return tournament, (first_tour, second_tour), (a, b, c)
+
+
+@pytest.mark.django_db
+def test_calculate_standings(played_tournament):
+    tournament, (first_tour, second_tour), (a, b, c) = played_tournament
+
+    standings = {
+        (standing.tour_id, standing.player_id): (
+            standing.points, standing.total_points, standing.buchholz, standing.sonneborn_berger
+        )
+        for standing in calculate_standings(tournament.id)
+    }
+
+    assert standings == {
+        (first_tour.id, a.id): (1, 1, 0, 0),
+        (first_tour.id, b.id): (0, 0, 1, 0),
+        (second_tour.id, b.id): (1, 1, 1, 0),
+        (second_tour.id, c.id): (0, 0, 1, 0),
+    }
+
+
+@pytest.mark.django_db
+def test_result_table_is_cached(played_tournament, django_assert_num_queries):
+    tournament, (first_tour, second_tour), (a, b, c) = played_tournament
+    update_standings(tournament.id)
+
+    with django_assert_num_queries(2):
+        result_table = get_result_table(tournament.id)
+    with django_assert_num_queries(0):
+        assert get_result_table(tournament.id) == result_table
+
+    assert [tour["tour_id"] for tour in result_table] == [first_tour.id, second_tour.id]
+    assert result_table[1]["result"][0]["username"] == b.get_full_name()
+
+    update_standings(tournament.id)
+    with django_assert_num_queries(2):
+        get_result_table(tournament.id)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_standings_updated_on_game_finish(played_tournament):
+    tournament, (first_tour, _), (a, b, _) = played_tournament
+    game = create_game({}, {}, white_player=a, black_player=b)
+    Match.objects.get(tour=first_tour).games.add(game)
+    draw_game(game, broadcast=False)
+
+    standing = Standing.objects.get(tour=first_tour, player=b)
+    assert standing.points == 0.5
+    assert Game.objects.get(uuid=game.uuid).black_player_points == 0.5
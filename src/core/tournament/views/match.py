@@ -79,7 +79,7 @@ class MatchViewSet(
     @action(detail=True, methods=["get"])
     def games(self, request: Request, *args, **kwargs) -> Response:
         match_ = self.get_object()
-        return Response(GameSerializer(match_.games.all(), many=True).data)
+        return Response(GameSerializer(match_.games.with_related(), many=True).data)
 
 
 @method_decorator(name='create', decorator=swagger_auto_schema(
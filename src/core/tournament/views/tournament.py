@@ -1,10 +1,17 @@
-from drf_yasg.utils import swagger_auto_schema
-from rest_framework import mixins, viewsets
+from django.http import StreamingHttpResponse
+from drf_yasg.utils import no_body, swagger_auto_schema
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import BasePermission
 from rest_framework.response import Response
 
+from api.models import Game
+from api.services import stream_pgn
+from core.tournament.pairing import PairingError
 from core.tournament.serializers import tournament
+from core.tournament.serializers.tour import TourSerializer
+from core.tournament.services import get_result_table, pair_next_tour
 from core.tournament.filters import TournamentFilters
 from core.tournament.models import (
     Tournament,
@@ -12,6 +19,12 @@ from core.tournament.models import (
 )
 
 
+class TournamentPairingException(APIException):
+    default_code = 'pairing_failed'
+    default_detail = 'Next tour can not be paired'
+    status_code = status.HTTP_400_BAD_REQUEST
+
+
 class TournamentViewSet(
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
@@ -33,6 +46,15 @@ class TournamentViewSet(
         Таблица результатов
 
         Таблица результатов турнира
+    pgn:
+        Выгрузка партий турнира
+
+        Все партии турнира одним PGN-файлом
+    pair_next_tour:
+        Жеребьевка следующего тура
+
+        Создание следующего тура и его матчей по системе жеребьевки турнира.
+        Требуются права администратора.
     update:
         Редактирование турнира
 
@@ -72,7 +94,7 @@ class TournamentViewSet(
             return self.is_admin(request.user)
 
     queryset = (
-        Tournament.objects.select_related("tournament_type")
+        Tournament.objects.select_related("tournament_type", "draw_type", "time_control_type")
         .prefetch_related("tours")
         .all()
     )
@@ -81,6 +103,12 @@ class TournamentViewSet(
     permission_classes = []
     tags = ["Tournament"]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.with_amounts()
+        return queryset
+
     def get_serializer_class(self):
         if self.action == "retrieve":
             return tournament.TournamentDetailSerializer
@@ -92,7 +120,7 @@ class TournamentViewSet(
             return super().get_serializer_class()
 
     def get_permissions(self):
-        if self.action in ["destroy", "create", "update", "partial_update"]:
+        if self.action in ["destroy", "create", "update", "partial_update", "pair_next_tour"]:
             return [self.CanActionTournamentPermission()]
         return super().get_permissions()
 
@@ -102,22 +130,35 @@ class TournamentViewSet(
     )
     @action(detail=True, methods=["get"])
     def result_table(self, request, *args, **kwargs):
-        qs = self.get_object()
-        tour_result = []
-
-        for tour in qs.tours.all():
-            tour_result.append(
-                {"tour_id": tour.id, "result": tour.get_players_points()}
-            )
-
+        tournament_ = self.get_object()
         serializer = tournament.TournamentResultTableSerializer(
-            data=tour_result, many=True
+            get_result_table(tournament_.pk), many=True
         )
 
-        serializer.is_valid(raise_exception=True)
-
         return Response(serializer.data)
 
+    @action(detail=True, methods=["get"])
+    def pgn(self, request, *args, **kwargs):
+        tournament_ = self.get_object()
+        games = Game.objects.filter(matches__tour__tournament=tournament_).distinct()
+
+        response = StreamingHttpResponse(
+            stream_pgn(games, event=tournament_.name), content_type="application/x-chess-pgn"
+        )
+        response["Content-Disposition"] = f'attachment; filename="tournament_{tournament_.pk}.pgn"'
+        return response
+
+    @swagger_auto_schema(method="post", request_body=no_body, responses={201: TourSerializer})
+    @action(detail=True, methods=["post"])
+    def pair_next_tour(self, request, *args, **kwargs):
+        tournament_ = self.get_object()
+        try:
+            tour = pair_next_tour(tournament_, start_at=request.data.get("start_at"))
+        except PairingError as error:
+            raise TournamentPairingException(str(error))
+
+        return Response(TourSerializer(tour).data, status=status.HTTP_201_CREATED)
+
 
 class TournamentTypeViewSet(viewsets.ModelViewSet):
     queryset = TournamentType.objects.all()
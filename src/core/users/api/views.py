@@ -25,11 +25,12 @@ from .serializers import (
 
 from core.users.services import (
     create_user,
-    send_confirm_url_to_email,
     check_confirm_token,
     parse_token,
     activate_user
 )
+from core.users.tasks import send_confirm_url
+from core.utils.tasks import enqueue_on_commit
 
 from ...files.models.Image import Image
 
@@ -134,7 +135,7 @@ class UserViewSet(RetrieveModelMixin,
         ser = CreateUserSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
         user = create_user(**ser.validated_data)
-        send_confirm_url_to_email(user)
+        enqueue_on_commit(send_confirm_url, user.pk)
         return Response({'result': ser.data}, status=status.HTTP_201_CREATED)
 
 
@@ -165,5 +166,5 @@ class UserViewSet(RetrieveModelMixin,
     @action(methods=["GET"], detail=True)
     def request_reactivation(self, request, *args, **kwargs):
         user = User.objects.filter(username=kwargs['username'])[0]
-        send_confirm_url_to_email(user)
+        enqueue_on_commit(send_confirm_url, user.pk)
         return Response(status=status.HTTP_200_OK)
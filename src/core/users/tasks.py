@@ -0,0 +1,12 @@
+from celery import shared_task
+
+from core.utils.tasks import KeyedTask
+from .models import User
+from .services import send_confirm_url_to_email
+
+
+@shared_task(base=KeyedTask)
+def send_confirm_url(user_id: int):
+    user = User.objects.filter(id=user_id).first()
+    if user is not None:
+        send_confirm_url_to_email(user)
@@ -0,0 +1,60 @@
+from celery import Task
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import transaction
+
+# порядка ожидания задачи в очереди: если сообщение потеряно, задача снова ставится через минуту
+TASK_KEY_TIMEOUT = 60
+
+# кеши, которые воркер не видит: ключ, поставленный веб-процессом, воркер не снимет
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def task_key(name: str, args=(), kwargs=None) -> str:
+    """
+    Ключ задачи - ее имя и аргументы
+    """
+    arguments = [str(arg) for arg in args] + [f"{key}={kwargs[key]}" for key in sorted(kwargs or {})]
+    return f"task:{name}:{':'.join(arguments)}"
+
+
+def deduplicates() -> bool:
+    """
+    Повторы отсекаются, только если кеш общий с воркером или задачи выполняются в этом же процессе
+    """
+    backend = settings.CACHES[DEFAULT_CACHE_ALIAS]["BACKEND"]
+    return backend not in PROCESS_LOCAL_CACHES or getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False)
+
+
+class KeyedTask(Task):
+    """
+    Пока задача ждет в очереди, та же задача с теми же аргументами повторно не ставится.
+    Ключ снимается в начале выполнения, изменения после этого момента поставят задачу снова
+    """
+
+    def __call__(self, *args, **kwargs):
+        cache.delete(task_key(self.name, args, kwargs))
+        return super().__call__(*args, **kwargs)
+
+
+def enqueue_on_commit(task, *args, **kwargs) -> None:
+    """
+    Ставит задачу в очередь после фиксации транзакции, при откате задача не ставится
+    """
+
+    key = task_key(task.name, args, kwargs)
+
+    def enqueue():
+        # None - кеш недоступен, задача ставится без проверки
+        if deduplicates() and cache.add(key, 1, TASK_KEY_TIMEOUT) is False:
+            return
+        try:
+            task.apply_async(args=args, kwargs=kwargs)
+        except Exception:
+            cache.delete(key)
+            raise
+
+    transaction.on_commit(enqueue)
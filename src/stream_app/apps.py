@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class StreamAppConfig(AppConfig):
     name = "stream_app"
+
+    def ready(self):
+        import stream_app.signals  # noqa F401
@@ -1,37 +1,97 @@
 import json
+from urllib.parse import parse_qs
 
 
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-from stream_app.services import get_serialized_game
+from stream_app.services import DELTA_PROTOCOL, get_game_message, get_resync_event, matchmaking_group_name
 
 
 class GameConsumer(AsyncWebsocketConsumer):
+    """
+    protocol=1 (default): every change sends the full serialized game
+    protocol=2: a snapshot on connect, then compact move events with a sequence number.
+    The client resyncs with {"resync": <last seq>} when it notices a gap.
+    protocol=2 clients also receive engine evaluations of the current position ({"type": "eval"}).
+
+    Group messages arrive already encoded to JSON and are forwarded as is.
+    """
+
     async def connect(self):
         self.uuid = self.scope["url_route"]["kwargs"]["uuid"]
         self.game_group_name = f"game_{self.uuid}"
+        self.protocol = self._get_protocol()
 
         # Join room group
         await self.channel_layer.group_add(self.game_group_name, self.channel_name)
 
         await self.accept()
 
+        if self.protocol >= DELTA_PROTOCOL:
+            message, _ = await get_game_message(self.uuid)
+            await self.send(text_data=message["snapshot"])
+
+    def _get_protocol(self) -> int:
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            return int(query.get("protocol", [1])[0])
+        except ValueError:
+            return 1
+
     async def receive(self, text_data):
         data_json = json.loads(text_data)
 
-        if "update" in data_json:
-            game = await get_serialized_game(data_json.get("uuid"))
+        if "resync" in data_json and self.protocol >= DELTA_PROTOCOL:
+            event = await get_resync_event(self.uuid, data_json["resync"])
+            if event:
+                await self.send(text_data=json.dumps(event))
 
-            # Update both players' game data
-            await self.channel_layer.group_send(
-                self.game_group_name, {"type": "game_data", "game": game}
-            )
+        elif "update" in data_json:
+            message, is_serialized = await get_game_message(data_json.get("uuid", self.uuid))
+
+            if is_serialized:
+                # Update both players' game data
+                await self.channel_layer.group_send(self.game_group_name, message)
+            else:
+                # The group already has this version of the game
+                await self.game_data(message)
 
     async def game_data(self, data):
-        game = data["game"]
+        if self.protocol >= DELTA_PROTOCOL:
+            text_data = data.get("move") or data["snapshot"]
+        else:
+            text_data = data["game"]
 
         # Send game over WebSocket
-        await self.send(text_data=json.dumps(game))
+        await self.send(text_data=text_data)
+
+    async def game_eval(self, data):
+        # the eval bar is not part of the full-game protocol
+        if self.protocol >= DELTA_PROTOCOL:
+            await self.send(text_data=data["eval"])
 
     async def disconnect(self, *args, **kwargs):
         await self.channel_layer.group_discard(self.game_group_name, self.channel_name)
+
+
+class MatchmakingConsumer(AsyncWebsocketConsumer):
+    """
+    Personal channel of an authenticated player, receives the games found by matchmaking
+    """
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = matchmaking_group_name(user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def game_matched(self, data):
+        await self.send(text_data=json.dumps({"game": data["game"], "color": data["color"]}))
+
+    async def disconnect(self, *args, **kwargs):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
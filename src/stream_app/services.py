@@ -1,21 +1,187 @@
+import json
+
+import chess
 from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from django.core.cache import cache
+
+
+from api.models import Board, Game
+from api.serializers import GameSerializer, ResultSerializer
+
+DELTA_PROTOCOL = 2
+GAME_MESSAGE_TIMEOUT = 60
 
 
-from api.models import Game
-from api.serializers import GameSerializer
+def _game_message_key(game_uuid) -> str:
+    return f'game_message_{game_uuid}'
 
 
 @database_sync_to_async
 def get_serialized_game(uuid):
-    game = Game.objects.get(uuid=uuid)
+    game = Game.objects.with_related().get(uuid=uuid)
     return GameSerializer(game).data
 
 
-async def send_game_data_to_group(game_uuid, game_data: dict):
+def encode_game_message(game_data: dict, move_data: dict = None) -> dict:
+    """
+    Кодирует данные партии в JSON один раз для всех подписчиков группы
+    """
+    game_json = json.dumps(game_data)
+    board = game_data.get('board')
+    seq = board['ply'] if board else 0
+
+    return {
+        'type': 'game_data',
+        'seq': seq,
+        'game': game_json,
+        'snapshot': f'{{"type": "snapshot", "protocol": {DELTA_PROTOCOL}, "seq": {seq}, "game": {game_json}}}',
+        'move': json.dumps(move_data) if move_data else None,
+    }
+
+
+def _current_seq(uuid) -> int:
+    board = Board.objects.filter(game__uuid=uuid).values('fullmove_number', 'turn').first()
+    return (board['fullmove_number'] - 1) * 2 + (0 if board['turn'] else 1) if board else 0
+
+
+def invalidate_game_message(uuid) -> None:
+    cache.delete(_game_message_key(uuid))
+
+
+@database_sync_to_async
+def get_game_message(uuid):
+    """
+    Закодированные данные партии из последней рассылки, если она соответствует текущему ходу партии.
+    Второе значение - True, если пришлось заново сериализовать партию из БД
+    """
+    message = cache.get(_game_message_key(uuid))
+    if message is not None and message['seq'] == _current_seq(uuid):
+        return message, False
+
+    message = encode_game_message(GameSerializer(Game.objects.with_related().get(uuid=uuid)).data)
+    cache.set(_game_message_key(uuid), message, GAME_MESSAGE_TIMEOUT)
+    return message, True
+
+
+async def send_game_data_to_group(game_uuid, game_data: dict, move_data: dict = None):
     """
     Отправка в websocket room обновленных данных о партии
+
+    move_data: компактное событие хода для клиентов дельта-протокола.
+    Рассылка, опоздавшая после более позднего хода, не заменяет его в кэше
     """
+    message = encode_game_message(game_data, move_data)
+    cached = cache.get(_game_message_key(game_uuid))
+    if cached is None or cached['seq'] <= message['seq']:
+        cache.set(_game_message_key(game_uuid), dict(message, move=None), GAME_MESSAGE_TIMEOUT)
+
     layer = get_channel_layer()
-    await layer.group_send(f'game_{game_uuid}', {'type': 'game_data', 'game': game_data})
+    await layer.group_send(f'game_{game_uuid}', message)
+
+
+def _fen_ply(fen: str) -> int:
+    chess_board = chess.Board(fen)
+    return 2 * (chess_board.fullmove_number - 1) + (chess_board.turn == chess.BLACK)
+
+
+def get_eval_event(fen: str, evaluation: dict, starting_fen=chess.STARTING_FEN) -> dict:
+    """
+    Оценка позиции движком для шкалы оценки, seq - номер хода, после которого возникла позиция,
+    считается от начальной позиции партии, как и seq ходов.
+    Лучший ход движка не отправляется: событие получают и игроки идущей партии
+    """
+    return {
+        'type': 'eval',
+        'seq': _fen_ply(fen) - _fen_ply(starting_fen),
+        'fen': fen,
+        'depth': evaluation['depth'],
+        'cp': evaluation['cp'],
+        'mate': evaluation['mate'],
+    }
+
+
+async def send_eval_to_group(game_uuid, event: dict):
+    """
+    Только клиентам дельта-протокола, см. GameConsumer.game_eval
+    """
+    layer = get_channel_layer()
+    await layer.group_send(f'game_{game_uuid}', {'type': 'game_eval', 'eval': json.dumps(event)})
+
+
+def matchmaking_group_name(player_id) -> str:
+    return f'matchmaking_{player_id}'
+
+
+async def send_match_to_players(game_uuid, players: dict):
+    """
+    Уведомление игроков о найденной партии, players: {цвет: id игрока}
+    """
+    layer = get_channel_layer()
+    for color, player_id in players.items():
+        await layer.group_send(
+            matchmaking_group_name(player_id),
+            {'type': 'game_matched', 'game': str(game_uuid), 'color': color},
+        )
+
+
+def get_clocks(game: Game) -> dict:
+    return {
+        'white': game.white_player_time_remaining,
+        'black': game.black_player_time_remaining,
+    }
+
+
+def get_snapshot_event(game_data: dict) -> dict:
+    """
+    Полное состояние партии, с него начинается дельта-протокол
+    """
+    board = game_data.get('board')
+    return {
+        'type': 'snapshot',
+        'protocol': DELTA_PROTOCOL,
+        'seq': board['ply'] if board else 0,
+        'game': game_data,
+    }
+
+
+def get_move_event(game: Game, uci: str, san: str) -> dict:
+    """
+    Событие одного хода: ход, новая позиция, часы и номер в последовательности
+    """
+    return {
+        'type': 'move',
+        'seq': game.board.ply,
+        'move': uci,
+        'san': san,
+        'fen': game.board.fen,
+        'clocks': get_clocks(game),
+        'result': ResultSerializer(game.result).data if game.result else None,
+    }
+
+
+def build_resync_event(uuid, seq) -> dict:
+    """
+    Пропущенные клиентом ходы после seq, или снимок партии, если их не восстановить
+    """
+    game = Game.objects.with_related().get(uuid=uuid)
+    if game.board is None or game.board.ply == seq:
+        return None
+
+    current_seq = game.board.ply
+    move_stack = game.board.move_stack
+    if not isinstance(seq, int) or not 0 <= seq < current_seq or len(move_stack) != current_seq:
+        return get_snapshot_event(GameSerializer(game).data)
+
+    return {
+        'type': 'moves',
+        'seq': current_seq,
+        'moves': [move.uci() for move in move_stack[seq:]],
+        'fen': game.board.fen,
+        'clocks': get_clocks(game),
+        'result': ResultSerializer(game.result).data if game.result else None,
+    }
+
+
+get_resync_event = database_sync_to_async(build_resync_event)
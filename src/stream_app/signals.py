@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from api.models import Game, Result
+from stream_app.services import invalidate_game_message
+
+
+@receiver(post_save, sender=Game)
+def invalidate_game_message_on_finish(sender, instance, **kwargs):
+    """
+    Ходы отсекает проверка seq в get_game_message, кэш сбрасывается только для законченной партии:
+    окончание и правки после него (update в API, админка) не меняют номер хода
+    """
+    if instance.finished_at is not None:
+        transaction.on_commit(lambda: invalidate_game_message(instance.uuid))
+
+
+@receiver(post_save, sender=Result)
+def invalidate_game_message_on_result_change(sender, instance, created, **kwargs):
+    if created:
+        return
+    for game_uuid in Game.objects.filter(result=instance).values_list("uuid", flat=True):
+        transaction.on_commit(lambda game_uuid=game_uuid: invalidate_game_message(game_uuid))
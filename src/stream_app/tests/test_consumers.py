@@ -5,12 +5,19 @@ from uuid import uuid4
 from unittest import mock
 
 from channels.testing import WebsocketCommunicator
+from django.utils import timezone
 from stream_app.consumers import GameConsumer
+from asgiref.sync import async_to_sync
+from stream_app.services import build_resync_event, encode_game_message, get_eval_event, get_game_message, \
+    send_eval_to_group, send_game_data_to_group
 
 
-from api.models import Game
+from api import services
+from api.models import Game, Result
 
 from stream_app.tests.fixtures import GAME_UUID
+'Do not remove the import below!'
+from api.tests.fixtures import users
 
 
 @pytest.mark.asyncio
@@ -45,10 +52,11 @@ async def test_connect(game_communicator):
 async def test_receive(game_communicator):
     connected, _ = await game_communicator.connect()
 
-    Game.objects.get = mock.MagicMock(return_value=Game(uuid=GAME_UUID))
+    games = mock.MagicMock(get=mock.MagicMock(return_value=Game(uuid=GAME_UUID)))
 
-    await game_communicator.send_to(json.dumps({"update": "foo"}))
-    received_message = await game_communicator.receive_json_from()
+    with mock.patch.object(Game.objects, "with_related", return_value=games):
+        await game_communicator.send_to(json.dumps({"update": "foo"}))
+        received_message = await game_communicator.receive_json_from()
 
     assert received_message["uuid"] == GAME_UUID
 
@@ -60,3 +68,159 @@ async def test_routing():
     from stream_app import routing
 
     assert routing.websocket_urlpatterns is not None
+
+
+@pytest.fixture
+def delta_communicator(url_route):
+    game_uuid = url_route["kwargs"]["uuid"]
+    communicator = WebsocketCommunicator(GameConsumer, f"/ws/game/{game_uuid}/?protocol=2")
+    communicator.scope["url_route"] = url_route
+
+    return communicator
+
+
+@pytest.mark.asyncio
+async def test_delta_protocol_snapshot_on_connect(delta_communicator):
+    game = {"uuid": GAME_UUID, "board": {"ply": 3}}
+    message = encode_game_message(game)
+    with mock.patch("stream_app.consumers.get_game_message", new_callable=mock.AsyncMock, return_value=(message, True)):
+        connected, _ = await delta_communicator.connect()
+        snapshot = await delta_communicator.receive_json_from()
+
+    assert connected
+    assert snapshot == {"type": "snapshot", "protocol": 2, "seq": 3, "game": game}
+
+    await delta_communicator.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_delta_protocol_move_event(delta_communicator, url_route):
+    game = {"uuid": GAME_UUID, "board": {"ply": 0}}
+    move = {"type": "move", "seq": 1, "move": "e2e4"}
+    message = encode_game_message(game)
+    with mock.patch("stream_app.consumers.get_game_message", new_callable=mock.AsyncMock, return_value=(message, True)):
+        await delta_communicator.connect()
+        await delta_communicator.receive_json_from()
+
+    await send_game_data_to_group(url_route["kwargs"]["uuid"], game, move)
+
+    assert await delta_communicator.receive_json_from() == move
+
+    await delta_communicator.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_delta_protocol_eval_event(delta_communicator, url_route):
+    message = encode_game_message({"uuid": GAME_UUID, "board": {"ply": 0}})
+    evaluation = {"depth": 12, "cp": 30, "mate": None, "best": "e7e5", "pv": ["e7e5"]}
+    with mock.patch("stream_app.consumers.get_game_message", new_callable=mock.AsyncMock, return_value=(message, True)):
+        await delta_communicator.connect()
+        await delta_communicator.receive_json_from()
+
+    fen = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+    await send_eval_to_group(url_route["kwargs"]["uuid"], get_eval_event(fen, evaluation))
+
+    assert await delta_communicator.receive_json_from() == {
+        "type": "eval", "seq": 1, "fen": fen, "depth": 12, "cp": 30, "mate": None,
+    }
+
+    await delta_communicator.disconnect()
+
+
+@pytest.fixture
+def game_with_moves(users):
+    player, opponent = users
+    game = services.create_game({}, {}, white_player=player, black_player=opponent)
+    for counter, uci in enumerate(["e2e4", "e7e5", "g1f3"]):
+        services.commit_move(game.uuid, uci[:2], uci[2:], player if counter % 2 == 0 else opponent)
+    return game
+
+
+@pytest.mark.django_db
+def test_resync_sends_missed_moves(game_with_moves):
+    event = build_resync_event(game_with_moves.uuid, 1)
+
+    assert event["type"] == "moves"
+    assert event["seq"] == 3
+    assert event["moves"] == ["e7e5", "g1f3"]
+
+
+@pytest.mark.django_db
+def test_resync_up_to_date(game_with_moves):
+    assert build_resync_event(game_with_moves.uuid, 3) is None
+
+
+@pytest.mark.django_db
+def test_resync_falls_back_to_snapshot(game_with_moves):
+    event = build_resync_event(game_with_moves.uuid, "foo")
+
+    assert event["type"] == "snapshot"
+    assert event["game"]["uuid"] == str(game_with_moves.uuid)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_update_is_served_from_last_broadcast(game_communicator, url_route):
+    game_uuid = url_route["kwargs"]["uuid"]
+    await game_communicator.connect()
+    await send_game_data_to_group(game_uuid, {"uuid": game_uuid})
+    await game_communicator.receive_json_from()
+
+    with mock.patch("stream_app.services.GameSerializer") as serializer_mock:
+        await game_communicator.send_to(json.dumps({"update": "foo"}))
+        received_message = await game_communicator.receive_json_from()
+
+    serializer_mock.assert_not_called()
+    assert received_message == {"uuid": game_uuid}
+
+    await game_communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_late_broadcast_does_not_replace_newer_message(game_with_moves):
+    game_data = services.get_game_data(game_with_moves.uuid)
+    older = dict(game_data, board=dict(game_data["board"], ply=game_data["board"]["ply"] - 1))
+
+    async_to_sync(send_game_data_to_group)(game_with_moves.uuid, older)
+    message, is_serialized = async_to_sync(get_game_message)(game_with_moves.uuid)
+
+    assert not is_serialized
+    assert message["seq"] == game_data["board"]["ply"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_finish_invalidates_message(game_with_moves):
+    async_to_sync(get_game_message)(game_with_moves.uuid)
+    game = Game.objects.get(uuid=game_with_moves.uuid)
+    game.finished_at = timezone.now()
+    game.save()
+
+    message, is_serialized = async_to_sync(get_game_message)(game_with_moves.uuid)
+
+    assert is_serialized
+    assert json.loads(message["game"])["finished_at"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_result_change_invalidates_message(game_with_moves):
+    async_to_sync(get_game_message)(game_with_moves.uuid)
+    result = Game.objects.get(uuid=game_with_moves.uuid).result
+    result.result = Result.DRAW
+    result.save()
+
+    message, is_serialized = async_to_sync(get_game_message)(game_with_moves.uuid)
+
+    assert is_serialized
+    assert json.loads(message["game"])["result"]["result"] == Result.DRAW
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_save_during_play_keeps_message(game_with_moves):
+    async_to_sync(get_game_message)(game_with_moves.uuid)
+    game = Game.objects.get(uuid=game_with_moves.uuid)
+    game.white_player_can_claim_draw = True
+    game.save()
+
+    _, is_serialized = async_to_sync(get_game_message)(game_with_moves.uuid)
+
+    assert not is_serialized
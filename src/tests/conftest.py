@@ -2,6 +2,10 @@ import pytest
 from django.test import Client
 from rest_framework.test import APIClient
 
+from core.tournament.models import Match
+from core.users.models import User
+from tests.factories.tournament.tour import TourFactory
+from tests.factories.tournament.tournament import TournamentFactory
 from tests.factories.users.user import UserFactory
 
 
@@ -56,3 +60,30 @@ def admin_api_client(admin):
     client = APIClient()
     client.force_authenticate(admin)
     return client
+
+
+@pytest.fixture
+def create_large_tournament():
+    """
+    Бенчмарк: турнир с круговой системой на players участников и tours туров
+    """
+
+    def create(players=50, tours=10):
+        tournament = TournamentFactory()
+        prefix = f"bench_{tournament.pk}_"
+        User.objects.bulk_create(
+            User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com") for i in range(players)
+        )
+        player_ids = list(User.objects.filter(username__startswith=prefix).values_list("id", flat=True))
+
+        for n in range(tours):
+            tour = TourFactory(tournament=tournament)
+            shifted = player_ids[n % players:] + player_ids[:n % players]
+            Match.objects.bulk_create(
+                Match(tour=tour, first_player_id=first, second_player_id=second)
+                for first, second in zip(shifted[::2], shifted[1::2])
+            )
+
+        return tournament
+
+    return create
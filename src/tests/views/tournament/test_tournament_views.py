@@ -1,9 +1,16 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import force_authenticate
 
+from core.tournament.models import DrawType
 from core.tournament.views.tournament import TournamentViewSet
+from tests.factories.tournament.game import GameFactory
+from tests.factories.tournament.match import MatchFactory
+from tests.factories.tournament.tour import TourFactory
 from tests.factories.tournament.tournament import TournamentFactory
+from tests.factories.users.user import UserFactory
 
 
 @pytest.mark.django_db
@@ -18,3 +25,73 @@ class TestTournamentView:
 
         assert resp.status_code == status.HTTP_200_OK
         assert resp.data["results"][0]["id"] == self.tournament.pk
+
+    def test_tournament_list_amounts(self, rf, user, create_large_tournament):
+        large = create_large_tournament(players=20, tours=3)
+
+        req = rf.get("")
+        force_authenticate(req, user)
+        resp = TournamentViewSet.as_view({"get": "list"})(req)
+        amounts = {
+            tournament["id"]: (tournament["tours_amount"], tournament["members_amount"])
+            for tournament in resp.data["results"]
+        }
+
+        assert amounts == {self.tournament.pk: (0, 0), large.pk: (3, 20)}
+
+    def test_tournament_list_queries_stay_flat(self, rf, user, create_large_tournament, django_assert_num_queries):
+        req = rf.get("")
+        force_authenticate(req, user)
+
+        with CaptureQueriesContext(connection) as small:
+            TournamentViewSet.as_view({"get": "list"})(req).render()
+
+        for _ in range(5):
+            create_large_tournament(players=100, tours=9)
+
+        with django_assert_num_queries(len(small)):
+            resp = TournamentViewSet.as_view({"get": "list"})(req)
+            resp.render()
+
+        assert len(resp.data["results"]) == 6
+
+    def test_tournament_pgn(self, rf, user):
+        first_player, second_player = UserFactory(), UserFactory()
+        match = MatchFactory(
+            tour=TourFactory(tournament=self.tournament),
+            first_player=first_player,
+            second_player=second_player,
+        )
+        match.games.add(
+            GameFactory(white_player=first_player, black_player=second_player, broadcast_type="none"),
+            GameFactory(white_player=second_player, black_player=first_player, broadcast_type="none"),
+        )
+        GameFactory(white_player=first_player, black_player=second_player, broadcast_type="none")
+
+        req = rf.get("")
+        force_authenticate(req, user)
+        resp = TournamentViewSet.as_view({"get": "pgn"})(req, pk=self.tournament.pk)
+        pgn = b"".join(resp.streaming_content).decode()
+
+        assert resp.status_code == status.HTTP_200_OK
+        assert pgn.count(f'[Event "{self.tournament.name}"]') == 2
+        assert f'[White "{first_player.username}"]' in pgn
+
+    def test_pair_next_tour(self, rf, admin):
+        self.tournament.draw_type.system = DrawType.ROUND_ROBIN
+        self.tournament.draw_type.save()
+        self.tournament.players.set(UserFactory.create_batch(4))
+
+        req = rf.post("")
+        force_authenticate(req, admin)
+        resp = TournamentViewSet.as_view({"post": "pair_next_tour"})(req, pk=self.tournament.pk)
+
+        assert resp.status_code == status.HTTP_201_CREATED
+        assert len(resp.data["matches"]) == 2
+
+    def test_pair_next_tour_manual(self, rf, admin):
+        req = rf.post("")
+        force_authenticate(req, admin)
+        resp = TournamentViewSet.as_view({"post": "pair_next_tour"})(req, pk=self.tournament.pk)
+
+        assert resp.status_code == status.HTTP_400_BAD_REQUEST